@@ -156,7 +156,6 @@ stdenv.mkDerivation rec {
       "-p"
       "python3"
       "python3Packages.requests"
-      "python3Packages.beautifulsoup4"
       "nix-update"
       "git"
       "--run"
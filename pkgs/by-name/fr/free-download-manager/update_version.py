@@ -1,48 +1,300 @@
 #!/usr/bin/env python3
-import requests
-from bs4 import BeautifulSoup
+import argparse
+import codecs
+import io
+import json
+import os
 import re
 import sys
+import tarfile
+import time
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import urljoin
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[4] / "scripts"))
 
-def get_latest_version():
-    url = "https://debrepo.freedownloadmanager.org/pool/main/f/freedownloadmanager/"
+from update_utils import cache_dir, trace  # noqa: E402
+from update_utils.http import HttpClient  # noqa: E402
+
+POOL_URL = "https://debrepo.freedownloadmanager.org/pool/main/f/freedownloadmanager/"
+VERSION_PATTERN = re.compile(r"freedownloadmanager_(\d+\.\d+\.\d+\.\d+)_amd64\.deb")
+DEFAULT_TIMEOUT = 30.0
+# 设置 UPDATE_CACHE_DIR 时在多个工作区间共享
+SCRIPT_CACHE = cache_dir(
+    "free-download-manager", Path(__file__).resolve().parent / "cache"
+)
+CHUNK_SIZE = 64 * 1024
+CONTROL_FIELDS = ("Version", "Installed-Size", "Depends")
+AR_MAGIC = b"!<arch>\n"
+AR_HEADER_SIZE = 60
+
+
+class DebLinkParser(HTMLParser):
+    """Collects amd64 .deb versions from <a href> tags as the listing streams in."""
+
+    def __init__(self):
+        super().__init__()
+        self.deb_files = 0
+        self.versions = []
+        self.hrefs = {}
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+        href = dict(attrs).get("href")
+        if not href or not href.endswith(".deb") or "amd64" not in href:
+            return
+        self.deb_files += 1
+        match = VERSION_PATTERN.search(href)
+        if match:
+            self.versions.append(match.group(1))
+            self.hrefs[match.group(1)] = href
+
+
+def version_key(version):
+    return [int(x) for x in version.split(".")]
 
+
+def load_state(path):
     try:
-        response = requests.get(url)
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with trace.span("write", path=path) as span, open(tmp, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+        span.set(bytes=f.tell())
+    os.replace(tmp, path)
+
+
+def scrape_listing(url, timeout=DEFAULT_TIMEOUT, state=None, client=None):
+    """Stream the pool listing and return (latest_version, deb_url, new_state).
+
+    `timeout` bounds the whole request, not just each socket read. With a
+    previous `state` the request is conditional and a 304 returns the
+    version recorded in it.
+    """
+    client = client or HttpClient(timeout=timeout)
+    deadline = time.monotonic() + timeout
+    headers = {}
+    if state and state.get("url") == url and state.get("version"):
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+
+    with client.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            return state["version"], state.get("deb_url"), state
         response.raise_for_status()
 
-        soup = BeautifulSoup(response.text, "html.parser")
+        parser = DebLinkParser()
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(
+            errors="replace"
+        )
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"listing not received within {timeout}s")
+            parser.feed(decoder.decode(chunk))
+        parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+
+        if not parser.deb_files:
+            raise ValueError("No .deb files found")
+        if not parser.versions:
+            raise ValueError("No valid versions found")
 
-        # Find all .deb files
-        deb_files = []
-        for link in soup.find_all("a", href=True):
-            href = link["href"]
-            if href.endswith(".deb") and "amd64" in href:
-                deb_files.append(href)
+        latest = max(parser.versions, key=version_key)
+        deb_url = urljoin(url, parser.hrefs[latest])
+        new_state = {
+            "url": url,
+            "version": latest,
+            "deb_url": deb_url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        return latest, deb_url, new_state
 
-        if not deb_files:
-            print("No .deb files found", file=sys.stderr)
-            sys.exit(1)
 
-        # Extract version numbers
-        versions = []
-        version_pattern = r"freedownloadmanager_(\d+\.\d+\.\d+\.\d+)_amd64\.deb"
+class LeadingBytes:
+    """Reads a prefix of a remote file with HTTP Range requests.
 
-        for deb_file in deb_files:
-            match = re.search(version_pattern, deb_file)
-            if match:
-                version = match.group(1)
-                versions.append(version)
+    If the server ignores Range and answers 200, the full response is
+    streamed instead and only as much of it as needed is read before the
+    connection is closed.
+    """
 
-        if not versions:
-            print("No valid versions found", file=sys.stderr)
-            sys.exit(1)
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, client=None):
+        self.url = url
+        self.timeout = timeout
+        self.client = client or HttpClient(timeout=timeout)
+        self.data = b""
+        self.stream = None
+        self.requests = 0
 
-        # Find the latest version
-        latest_version = max(versions, key=lambda v: [int(x) for x in v.split(".")])
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.stream is not None:
+            self.stream.close()
+
+    def _read_stream(self, size):
+        chunks = self.stream.iter_content(chunk_size=CHUNK_SIZE)
+        while len(self.data) < size:
+            chunk = next(chunks, b"")
+            if not chunk:
+                raise ValueError(f"{self.url} ended after {len(self.data)} bytes")
+            self.data += chunk
+
+    def read(self, start, length):
+        end = start + length
+        if len(self.data) < end:
+            if self.stream is not None:
+                self._read_stream(end)
+            else:
+                # Over-fetch so one request usually covers control.tar too
+                last = max(end, len(self.data) + CHUNK_SIZE) - 1
+                response = self.client.get(
+                    self.url,
+                    headers={
+                        "Range": f"bytes={len(self.data)}-{last}",
+                        "Accept-Encoding": "identity",
+                    },
+                    stream=True,
+                    timeout=self.timeout,
+                )
+                self.requests += 1
+                if response.status_code == 206:
+                    self.data += response.content
+                    response.close()
+                elif response.status_code == 200:
+                    print(
+                        "Server ignored Range, streaming the start of the file",
+                        file=sys.stderr,
+                    )
+                    response.raw.decode_content = True
+                    self.stream = response
+                    self.data = b""
+                    self._read_stream(end)
+                else:
+                    response.close()
+                    response.raise_for_status()
+                    raise ValueError(f"Unexpected status {response.status_code}")
+                if len(self.data) < end:
+                    raise ValueError(f"{self.url} ended after {len(self.data)} bytes")
+        return self.data[start:end]
+
+
+def read_control_tar(remote):
+    """Locate control.tar.* among the leading ar members of a .deb."""
+    if remote.read(0, len(AR_MAGIC)) != AR_MAGIC:
+        raise ValueError("Not a Debian package (missing ar header)")
+    offset = len(AR_MAGIC)
+    while True:
+        header = remote.read(offset, AR_HEADER_SIZE)
+        name = header[0:16].decode("ascii").strip().rstrip("/")
+        size = int(header[48:58].decode("ascii").strip())
+        offset += AR_HEADER_SIZE
+        if name.startswith("control.tar"):
+            return name, remote.read(offset, size)
+        if name.startswith("data.tar"):
+            raise ValueError("control.tar not found before data.tar")
+        offset += size + size % 2
+
+
+def decompress_control(name, data):
+    if name.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("control.tar.zst requires the zstandard module")
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as tar:
+        for member in tar:
+            if member.name.lstrip("./") == "control":
+                return tar.extractfile(member).read().decode("utf-8")
+    raise ValueError(f"No control file in {name}")
+
+
+def parse_control(text):
+    fields = {}
+    key = None
+    for line in text.splitlines():
+        if line[:1] in (" ", "\t") and key:
+            fields[key] += " " + line.strip()
+        elif ":" in line:
+            key, value = line.split(":", 1)
+            fields[key] = value.strip()
+    return fields
+
+
+def fetch_control(deb_url, timeout=DEFAULT_TIMEOUT, client=None):
+    """Return the control fields of a remote .deb without downloading it all."""
+    with LeadingBytes(deb_url, timeout, client) as remote:
+        name, data = read_control_tar(remote)
+        fields = parse_control(decompress_control(name, data))
+        print(
+            f"Read {name} from the first {len(remote.data)} bytes of {deb_url} "
+            f"({remote.requests} request(s))",
+            file=sys.stderr,
+        )
+    return {field: fields.get(field) for field in CONTROL_FIELDS}
+
+
+def get_latest_version():
+    parser = argparse.ArgumentParser(
+        description="Print the latest free-download-manager version"
+    )
+    parser.add_argument("--url", default=POOL_URL, help="Pool directory listing URL")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help="Seconds allowed for fetching the whole listing",
+    )
+    parser.add_argument(
+        "--state",
+        default=str(SCRIPT_CACHE / "listing-state.json"),
+        help="File storing ETag/Last-Modified for conditional requests",
+    )
+    parser.add_argument(
+        "--control",
+        action="store_true",
+        help="Also read Version, Installed-Size and Depends from the .deb "
+        "and print them as JSON",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always download the full listing",
+    )
+    args = parser.parse_args()
+
+    client = HttpClient(timeout=args.timeout)
+    try:
+        state = {} if args.no_cache else load_state(args.state)
+        latest_version, deb_url, new_state = scrape_listing(
+            args.url, args.timeout, state, client
+        )
+        if not args.no_cache and new_state != state:
+            save_state(args.state, new_state)
 
-        print(latest_version)
+        if args.control:
+            deb_url = deb_url or urljoin(
+                args.url, f"freedownloadmanager_{latest_version}_amd64.deb"
+            )
+            info = {"version": latest_version, "url": deb_url}
+            info.update(fetch_control(deb_url, args.timeout, client))
+            print(json.dumps(info, indent=2))
+        else:
+            print(latest_version)
 
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
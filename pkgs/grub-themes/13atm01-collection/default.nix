@@ -56,14 +56,87 @@ let
 
   # 读取主题列表
   themeList = lib.importJSON ./theme-list.json;
+  # 每个主题实际需要的文件（由 update.py 生成）
+  themeManifests = lib.importJSON ./theme-manifests.json;
+
+  # 路径的各级父目录，如 "a/b/c" -> [ "a" "a/b" ]
+  parentDirs =
+    path:
+    let
+      parts = lib.splitString "/" path;
+    in
+    map (n: lib.concatStringsSep "/" (lib.take n parts)) (lib.range 1 (lib.length parts - 1));
+
+  # 主题需要的文件（相对仓库根）；清单须与当前 src 为同一提交，
+  # 否则（或尚无清单时）取整个主题目录
+  themeSelection =
+    packageName: themePath:
+    let
+      manifest = themeManifests.${packageName} or { };
+    in
+    if (manifest.rev or null) == rev then
+      {
+        files =
+          map (file: "${themePath}/${file}") (lib.attrNames manifest.files)
+          ++ lib.attrNames manifest.shared;
+        dirs = [ ];
+        shared = manifest.shared;
+      }
+    else
+      {
+        files = [ ];
+        dirs = [ themePath ];
+        shared = { };
+      };
+
+  # 将 src 过滤为单个主题所需的文件，安装时只复制这些文件
+  themeSrc =
+    packageName: selection:
+    let
+      root = "${src}/";
+      wanted = selection.files ++ selection.dirs;
+      # filter 先访问目录再访问其中的文件，所需文件的父目录也要保留
+      keep = lib.genAttrs (wanted ++ lib.concatMap parentDirs wanted) (_: true);
+    in
+    lib.cleanSourceWith {
+      name = "${packageName}-source";
+      inherit src;
+      filter =
+        path: type:
+        let
+          rel = lib.removePrefix root (toString path);
+        in
+        keep ? ${rel} || lib.any (dir: lib.hasPrefix "${dir}/" rel) selection.dirs;
+    };
+
+  # 目录外资源按仓库内路径放到 shared/ 下，并改写 theme.txt 中的引用
+  installShared =
+    shared:
+    lib.concatStrings (
+      lib.mapAttrsToList (
+        path: asset:
+        let
+          target = "shared/${dirOf path}/${baseNameOf asset.ref}";
+        in
+        ''
+          install -Dm644 "$src/"${lib.escapeShellArg path} "$out/shared/"${lib.escapeShellArg path}
+          substituteInPlace "$out/theme.txt" \
+            --replace-quiet ${lib.escapeShellArg ''"${asset.ref}"''} ${lib.escapeShellArg ''"${target}"''}
+        ''
+      ) shared
+    );
 
   # 为每个主题创建包的函数
   mkThemePackage =
     packageName: themePath:
+    let
+      selection = themeSelection packageName themePath;
+    in
     stdenvNoCC.mkDerivation {
       name = packageName;
       pname = packageName;
-      inherit src version;
+      inherit version;
+      src = themeSrc packageName selection;
 
       dontUnpack = true;
       dontConfigure = true;
@@ -73,8 +146,10 @@ let
         # 创建输出目录
         mkdir -p "$out"
 
-        # 复制主题内容
-        cp -rT "${src}/${themePath}" "$out"
+        # 复制主题内容（src 已过滤为该主题的文件）
+        cp -rT "$src/"${lib.escapeShellArg themePath} "$out"
+        chmod -R u+w "$out"
+        ${installShared selection.shared}
 
         # 验证必要文件存在
         if [ ! -f "$out/theme.txt" ]; then
@@ -1,29 +1,55 @@
 #!/usr/bin/env python3
 """
 Generate theme-list.json for 13atm01 GRUB themes collection.
-- If --repo-path is provided, use it; otherwise clone the upstream repo with depth 1.
+- If --repo-path is provided, walk it; otherwise make a blobless, depth-1 bare clone of
+  the upstream repo and list its tree with `git ls-tree`, so discovering the themes
+  downloads no image or font blob.
 - Discover all directories that directly contain a file named 'theme.txt'.
 - For each discovered theme, compute a package name by sanitizing the parent directory name
   (lowercase, non-alphanumeric -> '-', collapse repeats, trim '-') and map it to a relative
   path from the repo root to the directory containing theme.txt.
+- Write theme-manifests.json with, per theme, every file under its directory plus the
+  assets outside it that theme.txt references, each with its size and git blob id, and
+  the commit they were read from. The Nix side filters src down to these files for the
+  matching commit, so each theme's store path holds only what it uses. Themes are
+  scanned in parallel. File sizes need the blobs, so a blobless clone fetches the
+  missing ones here in a single request; the src hash below reuses them.
 
-Additionally: after updating theme-list.json, call nix-update to update the src
-(commit and hash) for this collection package. The attribute path is expected to be
-"grub-themes.13atm01-collection.meta" or "grub-themes.13atm01-collection" depending on
-how the flake exposes it; we attempt meta first then fallback.
+Additionally: after updating theme-list.json, update the src (commit and hash) for this
+collection package. The NAR hash of the commit is computed in-process from the git objects
+already at hand and `rev`/`hash` are patched in default.nix, so upstream is not downloaded
+a second time. With --nix-update (or when .gitattributes uses export-ignore/export-subst,
+which make the GitHub archive differ from the tree) nix-update is called instead. The
+attribute path is expected to be "grub-themes.13atm01-collection.meta" or
+"grub-themes.13atm01-collection" depending on how the flake exposes it; we attempt meta
+first then fallback.
 """
 
 import argparse
+import fnmatch
+import hashlib
 import json
 import os
+import posixpath
 import re
 import shutil
 import subprocess
 import sys
 import tempfile
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
 
 UPSTREAM_REPO = "https://github.com/13atm01/GRUB-Theme.git"
+DEFAULT_JOBS = os.cpu_count() or 4
+
+# theme.txt 中引用的图片与字体文件（可带 * 通配，如 menu_pixmap_style）
+THEME_REF_RE = re.compile(r'"([^"]+\.(?:png|jpe?g|tga|pf2))"', re.IGNORECASE)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "scripts"))
+
+from update_utils import trace  # noqa: E402
+from update_utils.nar import git_fetch_objects, git_missing_blobs  # noqa: E402
+from update_utils.nar import nar_hash_git  # noqa: E402
 
 
 def log(msg: str) -> None:
@@ -38,16 +64,18 @@ def sanitize_name(name: str) -> str:
     return name
 
 
-def clone_repo(temp_dir: Path) -> Path:
-    log("未提供仓库路径，将临时克隆仓库...")
-    dest = temp_dir / "repo"
-    subprocess.run(
+def clone_repo(temp_dir: Path, url: str = UPSTREAM_REPO) -> Path:
+    log("未提供仓库路径，将临时克隆仓库（仅树对象，不下载文件内容）...")
+    dest = temp_dir / "repo.git"
+    trace.run(
         [
             "git",
             "clone",
+            "--bare",
             "--depth",
             "1",
-            UPSTREAM_REPO,
+            "--filter=blob:none",
+            url,
             str(dest),
         ],
         check=True,
@@ -56,32 +84,169 @@ def clone_repo(temp_dir: Path) -> Path:
     return dest
 
 
-def find_themes(repo_root: Path) -> dict:
+def list_tree(git_dir: Path, rev: str = "HEAD") -> list[str]:
+    # 只读取树对象，blob 不会被按需拉取
+    result = subprocess.run(
+        ["git", "--git-dir", str(git_dir), "ls-tree", "-r", "-z", "--name-only", rev],
+        check=True,
+        stdout=subprocess.PIPE,
+    )
+    return [p for p in result.stdout.decode("utf-8").split("\0") if p]
+
+
+def themes_from_paths(paths: list[str]) -> dict:
     themes = {}
+    # Sorted so that colliding package names resolve the same way on every run
+    for path in sorted(paths):
+        rel = PurePosixPath(path)
+        if rel.name != "theme.txt":
+            continue
+        theme_dir = rel.parent
+        # package name is based on parent directory
+        package_name = sanitize_name(theme_dir.parent.name)
+        themes[package_name] = theme_dir.as_posix()
+    return themes
+
+
+def find_themes(repo_root: Path) -> dict:
+    paths = []
     # Walk and find files named 'theme.txt'
     for root, dirs, files in os.walk(repo_root):
         if "theme.txt" in files:
-            theme_dir = Path(root)
-            rel_path = theme_dir.relative_to(repo_root).as_posix()
+            theme_file = Path(root) / "theme.txt"
+            paths.append(theme_file.relative_to(repo_root).as_posix())
+    return themes_from_paths(paths)
 
-            parent_dir = theme_dir.parent
-            dir_name = parent_dir.name  # package name is based on parent directory
 
-            package_name = sanitize_name(dir_name)
-            themes[package_name] = rel_path
-    return themes
+def git_blob_id(path: Path) -> str:
+    # 与 `git hash-object` 一致，两种扫描方式得到相同的清单
+    hasher = hashlib.sha1(f"blob {path.stat().st_size}\0".encode())
+    with path.open("rb") as f:
+        while chunk := f.read(1024 * 1024):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class GitTreeSource:
+    """从 git 树对象读取文件列表、大小与 blob id"""
+
+    def __init__(self, git_dir: Path, rev: str = "HEAD"):
+        self.git_dir = git_dir
+        self.entries: dict[str, dict] = {}
+        # ls-tree -l 需要 blob 才能给出大小，partial clone 中会逐个按需拉取；
+        # 先一次性补齐缺失的 blob（随后计算 NAR 哈希同样需要它们）
+        git_fetch_objects(git_dir, git_missing_blobs(git_dir, rev))
+        listing = subprocess.run(
+            ["git", "--git-dir", str(git_dir), "ls-tree", "-r", "-z", "-l", rev],
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout.decode("utf-8")
+        for record in listing.split("\0"):
+            if not record:
+                continue
+            meta, path = record.split("\t", 1)
+            _mode, kind, oid, size = meta.split()
+            if kind == "blob":
+                self.entries[path] = {"blob": oid, "size": int(size)}
+
+    def files_under(self, directory: str) -> dict[str, dict]:
+        prefix = directory + "/"
+        return {
+            path[len(prefix) :]: entry
+            for path, entry in self.entries.items()
+            if path.startswith(prefix)
+        }
+
+    def glob(self, pattern: str) -> dict[str, dict]:
+        return {
+            path: entry
+            for path, entry in self.entries.items()
+            if posixpath.dirname(path) == posixpath.dirname(pattern)
+            and fnmatch.fnmatchcase(path, pattern)
+        }
+
+    def read_text(self, path: str) -> str:
+        result = subprocess.run(
+            ["git", "--git-dir", str(self.git_dir), "cat-file", "blob"]
+            + [self.entries[path]["blob"]],
+            check=True,
+            stdout=subprocess.PIPE,
+        )
+        return result.stdout.decode("utf-8", errors="replace")
+
+
+class DirectorySource:
+    """从已检出的目录读取文件并计算 blob id"""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def _entry(self, path: Path) -> dict:
+        return {"blob": git_blob_id(path), "size": path.stat().st_size}
+
+    def files_under(self, directory: str) -> dict[str, dict]:
+        base = self.root / directory
+        files = {}
+        for root, dirs, names in os.walk(base):
+            dirs[:] = [d for d in dirs if d != ".git"]
+            for name in names:
+                path = Path(root) / name
+                if path.is_file():
+                    files[path.relative_to(base).as_posix()] = self._entry(path)
+        return files
+
+    def glob(self, pattern: str) -> dict[str, dict]:
+        return {
+            path.relative_to(self.root).as_posix(): self._entry(path)
+            for path in self.root.glob(pattern)
+            if path.is_file()
+        }
+
+    def read_text(self, path: str) -> str:
+        return (self.root / path).read_text(encoding="utf-8", errors="replace")
+
+
+def build_manifest(source, theme_path: str, rev: str | None = None) -> dict:
+    files = source.files_under(theme_path)
+    shared = {}
+    for ref in THEME_REF_RE.findall(source.read_text(f"{theme_path}/theme.txt")):
+        target = posixpath.normpath(posixpath.join(theme_path, ref))
+        if target.startswith(theme_path + "/"):
+            continue  # 主题目录内的文件已在 files 中
+        if target.startswith("../") or not source.glob(target):
+            log(f"警告: {theme_path}/theme.txt 引用的 {ref} 不存在")
+            continue
+        for path, entry in source.glob(target).items():
+            shared[path] = {"ref": ref, **entry}
+    # default.nix 只在 rev 与 src 一致时使用清单，避免旧清单漏掉新文件
+    return {"path": theme_path, "rev": rev, "files": files, "shared": shared}
+
+
+def build_manifests(
+    source, themes: dict, rev: str | None = None, jobs: int = DEFAULT_JOBS
+) -> dict:
+    """并行扫描每个主题目录，生成 {包名: 清单}"""
+    if not themes:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(themes)))) as pool:
+        manifests = pool.map(
+            lambda path: build_manifest(source, path, rev), themes.values()
+        )
+        return dict(zip(themes, manifests))
 
 
 def write_json(output_path: Path, mapping: dict) -> None:
     # Sort keys for stable output
-    with output_path.open("w", encoding="utf-8") as f:
-        json.dump(mapping, f, indent=2, sort_keys=True, ensure_ascii=False)
+    with trace.span("write", path=str(output_path)) as span:
+        with output_path.open("w", encoding="utf-8") as f:
+            json.dump(mapping, f, indent=2, sort_keys=True, ensure_ascii=False)
+            span.set(bytes=f.tell())
 
 
 def try_run(cmd: list[str]) -> tuple[bool, str]:
     try:
         log("执行: " + " ".join(cmd))
-        subprocess.run(cmd, check=True)
+        trace.run(cmd, check=True)
         return True, ""
     except subprocess.CalledProcessError as e:
         return False, str(e)
@@ -101,6 +266,76 @@ def run_nix_update(attr_paths: list[str]) -> None:
     raise SystemExit(f"nix-update 全部尝试失败: {attr_paths}. 最后错误: {last_err}")
 
 
+def git_output(git_dir: Path, *args: str) -> str:
+    result = subprocess.run(
+        ["git", "--git-dir", str(git_dir), *args],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    return result.stdout.strip()
+
+
+def find_git_dir(repo_root: Path) -> Path | None:
+    try:
+        result = subprocess.run(
+            ["git", "-C", str(repo_root), "rev-parse", "--absolute-git-dir"],
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+    return Path(result.stdout.strip())
+
+
+def uses_archive_attributes(git_dir: Path, rev: str, paths: list[str]) -> bool:
+    # export-ignore/export-subst 会让 GitHub 归档与 git 树内容不一致
+    for path in paths:
+        if PurePosixPath(path).name != ".gitattributes":
+            continue
+        content = git_output(git_dir, "cat-file", "-p", f"{rev}:{path}")
+        if "export-ignore" in content or "export-subst" in content:
+            return True
+    return False
+
+
+def patch_src(nix_file: Path, rev: str, hash_: str) -> bool:
+    text = nix_file.read_text(encoding="utf-8")
+    patched, n_rev = re.subn(
+        r'^(\s*rev = )"[^"]*";', rf'\g<1>"{rev}";', text, count=1, flags=re.M
+    )
+    patched, n_hash = re.subn(
+        r'^(\s*hash = )"[^"]*";', rf'\g<1>"{hash_}";', patched, count=1, flags=re.M
+    )
+    if n_rev != 1 or n_hash != 1:
+        log(f"错误: 未能在 {nix_file} 中找到 rev/hash 定义")
+        return False
+    if patched != text:
+        with trace.span("write", path=str(nix_file)) as span:
+            nix_file.write_text(patched, encoding="utf-8")
+            span.set(bytes=nix_file.stat().st_size)
+    return True
+
+
+def update_src(git_dir: Path, nix_file: Path) -> bool:
+    """就地计算 src 的 NAR 哈希并写回 default.nix；无法计算时返回 False"""
+    try:
+        rev = git_output(git_dir, "rev-parse", "HEAD^{commit}")
+        if uses_archive_attributes(git_dir, rev, list_tree(git_dir, rev)):
+            log("仓库使用了 export-ignore/export-subst，无法从 git 树计算归档哈希")
+            return False
+        log(f"计算 {rev} 的 NAR 哈希...")
+        digest = nar_hash_git(git_dir, rev)
+    except (subprocess.CalledProcessError, ValueError) as e:
+        log(f"计算 NAR 哈希失败: {e}")
+        return False
+    if not patch_src(nix_file, rev, digest.sri):
+        return False
+    log(f"已更新 src: rev={rev} hash={digest.sri}")
+    return True
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(
         description="Generate 13atm01 GRUB theme list JSON and update src via nix-update"
@@ -109,15 +344,32 @@ def main() -> int:
         "--repo-path",
         help="Path to an existing GRUB-Theme repository (skips cloning)",
     )
+    parser.add_argument(
+        "--upstream",
+        default=UPSTREAM_REPO,
+        help="Repository URL to clone when --repo-path is not given",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help="Themes to scan in parallel when building file manifests",
+    )
     parser.add_argument(
         "--skip-nix-update",
         action="store_true",
-        help="Only refresh theme-list.json without running nix-update",
+        help="Only refresh theme-list.json without updating src",
+    )
+    parser.add_argument(
+        "--nix-update",
+        action="store_true",
+        help="Update src with nix-update instead of hashing the clone in-process",
     )
     args = parser.parse_args()
 
     script_dir = Path(__file__).resolve().parent
     output_file = script_dir / "theme-list.json"
+    manifest_file = script_dir / "theme-manifests.json"
 
     log("正在更新GRUB主题列表...")
     log(f"输出位置: {output_file}")
@@ -130,29 +382,48 @@ def main() -> int:
                 log(f"错误: 提供的仓库路径不存在或不是目录: {repo_root}")
                 return 1
             log(f"使用外部仓库路径: {repo_root}")
+            themes = find_themes(repo_root)
+            source = DirectorySource(repo_root)
+            git_dir = find_git_dir(repo_root)
         else:
             temp_dir = tempfile.TemporaryDirectory()
-            repo_root = clone_repo(Path(temp_dir.name))
-
-        themes = find_themes(repo_root)
+            git_dir = clone_repo(Path(temp_dir.name), args.upstream)
+            themes = themes_from_paths(list_tree(git_dir))
+            source = GitTreeSource(git_dir)
 
         if not themes:
             # Write empty object for determinism then fail like the shell script
             write_json(output_file, {})
+            write_json(manifest_file, {})
             return 1
 
         write_json(output_file, themes)
         log(f"成功生成 {len(themes)} 个主题到 {output_file}")
 
-        if not args.skip_nix_update:
-            # Prefer updating the meta derivation which carries the src
-            # Attribute paths to try in order
-            attr_candidates = [
-                "grub-themes.13atm01-collection.meta",
-            ]
-            run_nix_update(attr_candidates)
+        rev = None
+        if git_dir is not None:
+            rev = git_output(git_dir, "rev-parse", "HEAD^{commit}")
         else:
-            log("跳过 nix-update 根据参数 --skip-nix-update")
+            log("警告: 无法确定仓库提交，生成的清单不会被 default.nix 使用")
+        manifests = build_manifests(source, themes, rev, args.jobs)
+        write_json(manifest_file, manifests)
+        log(f"成功生成文件清单到 {manifest_file}")
+
+        if args.skip_nix_update:
+            log("跳过 src 更新 根据参数 --skip-nix-update")
+            return 0
+
+        if not args.nix_update and git_dir is not None:
+            if update_src(git_dir, script_dir / "default.nix"):
+                return 0
+            log("回退到 nix-update")
+
+        # Prefer updating the meta derivation which carries the src
+        # Attribute paths to try in order
+        attr_candidates = [
+            "grub-themes.13atm01-collection.meta",
+        ]
+        run_nix_update(attr_candidates)
 
         return 0
     finally:
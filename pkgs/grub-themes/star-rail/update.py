@@ -11,7 +11,21 @@ import subprocess
 import requests
 import re
 import logging
-import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[3]
+sys.path.insert(0, str(REPO_ROOT / "scripts"))
+
+from update_utils import cache_dir, trace  # noqa: E402
+from update_utils.hashing import DownloadCache, fetch_digest, url_basename  # noqa: E402
+from update_utils.http import (  # noqa: E402
+    DEFAULT_MAX_WAIT,
+    DEFERRED_EXIT_CODE,
+    HttpClient,
+    RateLimitBudget,
+    RateLimitExceeded,
+)
 
 # 配置日志
 logging.basicConfig(
@@ -21,11 +35,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger()
 
+# 下载回退路径的默认参数
+DEFAULT_JOBS = 8
+DEFAULT_RETRIES = 3
+DEFAULT_DOWNLOAD_CACHE = cache_dir("downloads", REPO_ROOT / ".cache" / "downloads")
+# ETag 状态与 HTTP 缓存；设置 UPDATE_CACHE_DIR 时在多个工作区间共享
+SCRIPT_CACHE = cache_dir("star-rail", Path(__file__).resolve().parent / "cache")
+# GitHub Actions 会设置该变量；也便于指向本地模拟服务器
+GITHUB_API = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_GRAPHQL = os.environ.get("GITHUB_GRAPHQL_URL", f"{GITHUB_API}/graphql")
+# GraphQL 单页资源数上限
+GRAPHQL_PAGE_SIZE = 100
+
 
 def calculate_sha256_nix(url: str):
     """使用 nix-prefetch-url 获取文件的 SHA256 哈希"""
     try:
-        result = subprocess.run(
+        result = trace.run(
             ["nix-prefetch-url", "--type", "sha256", url],
             check=True,
             stdout=subprocess.PIPE,
@@ -51,60 +77,185 @@ def extract_sha256_from_digest(digest: str):
     return None
 
 
-def calculate_sha256_request(url: str):
-    """计算远程文件的 SHA256 哈希值"""
+def calculate_sha256_request(
+    url: str,
+    session=None,
+    retries: int = DEFAULT_RETRIES,
+    cache=None,
+    add_to_store: bool = False,
+):
+    """下载一次远程文件并计算 SHA256，失败时按指数退避重试
+
+    传入 cache 时文件会写入内容寻址缓存，再次运行直接命中；add_to_store
+    会把文件注册进 Nix store，之后构建 fetchurl 无需再次下载。
+    """
+    digest = fetch_digest(
+        url,
+        session,
+        cache,
+        retries,
+        add_to_store_as=url_basename(url) if add_to_store and cache else None,
+    )
+    return digest.hex if digest else None
+
+
+def hash_missing_digests(
+    urls,
+    jobs: int = DEFAULT_JOBS,
+    retries: int = DEFAULT_RETRIES,
+    cache=None,
+    add_to_store: bool = False,
+    client=None,
+):
+    """并发下载缺少 digest 的资源并计算 SHA256，返回 {url: sha256}"""
+    if not urls:
+        return {}
+    jobs = max(1, min(jobs, len(urls)))
+    session = (client or HttpClient(pool_size=jobs)).session
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        hashes = pool.map(
+            lambda url: calculate_sha256_request(
+                url, session, retries, cache, add_to_store
+            ),
+            urls,
+        )
+        return dict(zip(urls, hashes))
+
+
+def load_json(path, default):
+    """读取 JSON 文件，不存在或损坏时返回默认值"""
     try:
-        headers = {"Accept-Encoding": "identity"}
-        response = requests.get(url, stream=True, headers=headers, timeout=30)
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def conditional_headers(headers, state, url):
+    """如果缓存中有该 URL 的 ETag，则附加 If-None-Match 请求头"""
+    etag = (state or {}).get(url, {}).get("etag")
+    if etag:
+        return {**headers, "If-None-Match": etag}
+    return headers
+
+
+def remember_etag(state, url, response):
+    """记录响应的 ETag，供下次条件请求使用"""
+    if state is not None and response.headers.get("ETag"):
+        state[url] = {"etag": response.headers["ETag"]}
+
+
+def github_headers():
+    """GitHub API 请求头，存在 GITHUB_TOKEN 时附带认证"""
+    headers = {"Accept": "application/vnd.github.v3+json"}
+    token = os.environ.get("GITHUB_TOKEN")
+    if token:
+        headers["Authorization"] = f"token {token}"
+    return headers
+
+
+def extract_assets(release):
+    """提取 release 中的 gz/tar.gz 资源"""
+    assets = []
+    for asset in release.get("assets", []):
+        # 只处理 gz/tar.gz 文件
+        if asset["name"].lower().endswith((".tar.gz", ".gz")):
+            assets.append(
+                {
+                    "name": asset["name"],
+                    "url": asset["browser_download_url"],
+                    "release_tag": release["tag_name"],
+                    "digest": asset.get("digest", ""),
+                }
+            )
+    return assets
+
+
+def iter_releases(owner, repo, per_page=100, client=None):
+    """按页惰性遍历仓库的全部 release（从新到旧），跟随 Link 头翻页
+
+    页面经 HTTP 缓存重新验证，未变化的页面只消耗一次 304。
+    """
+    client = client or HttpClient()
+    url = f"{GITHUB_API}/repos/{owner}/{repo}/releases?per_page={per_page}"
+    headers = github_headers()
+    while url:
+        response = client.get(url, headers=headers, timeout=15)
         response.raise_for_status()
+        yield from response.json()
+        url = response.links.get("next", {}).get("url")
 
-        hasher = hashlib.sha256()
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                hasher.update(chunk)
 
-        return hasher.hexdigest()
-    except Exception as e:
-        logger.error(f"Error downloading {url}: {str(e)}")
+def get_all_release_assets(owner, repo, known_tags=frozenset(), client=None):
+    """遍历全部 release，每个主题取最新 release 中的资源
+
+    遇到 known_tags 中已记录的 release 时，处理完该 release 即停止翻页，
+    更早的 release 不会再被请求。
+    """
+    assets = {}
+    releases_seen = 0
+    try:
+        for release in iter_releases(owner, repo, client=client):
+            releases_seen += 1
+            if release.get("draft", False) or release.get("prerelease", False):
+                continue
+            for asset in extract_assets(release):
+                # 从新到旧遍历，先出现的即为最新版本
+                assets.setdefault(generate_package_name(asset["name"]), asset)
+            if release["tag_name"] in known_tags:
+                logger.info(
+                    f"Reached already recorded release {release['tag_name']}, stopping"
+                )
+                break
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Network error fetching releases: {str(e)}")
         return None
 
+    logger.info(f"Found {len(assets)} themes in {releases_seen} releases")
+    return list(assets.values())
+
+
+def get_release_assets(owner, repo, tag=None, state=None, client=None):
+    """获取仓库的 Release 资源
 
-def get_release_assets(owner, repo, tag=None):
-    """获取仓库的 Release 资源"""
+    传入 state 时使用 ETag 条件请求；Release 未变化 (304) 时返回 None。
+    这里不走 HTTP 缓存：ETag 只在 themes.json 写入后才保存到 state。
+    """
+    client = client or HttpClient()
     try:
-        token = os.environ.get("GITHUB_TOKEN")
-        headers = {"Accept": "application/vnd.github.v3+json"}
-        if token:
-            headers["Authorization"] = f"token {token}"
+        headers = github_headers()
 
         if tag:
             # 获取特定标签的 release
-            release_url = (
-                f"https://api.github.com/repos/{owner}/{repo}/releases/tags/{tag}"
+            release_url = f"{GITHUB_API}/repos/{owner}/{repo}/releases/tags/{tag}"
+            response = client.get(
+                release_url,
+                headers=conditional_headers(headers, state, release_url),
+                cache=False,
+                timeout=15,
             )
-            response = requests.get(release_url, headers=headers, timeout=15)
-            
-            # Handle rate limit exceeded
-            if response.status_code == 403 and "rate limit exceeded" in response.text.lower():
-                logger.error(f"Network error fetching releases: {response.status_code} {response.reason}")
-                logger.info("Skipping update due to GitHub rate limit")
-                sys.exit(0)
-            
+            if response.status_code == 304:
+                logger.info(f"Release '{tag}' not modified since last run")
+                return None
+
             if response.status_code == 404:
                 logger.warning(f"Release tag '{tag}' not found for {owner}/{repo}")
                 return []
             response.raise_for_status()
+            remember_etag(state, release_url, response)
             releases = [response.json()]
         else:
             # 只获取最新的 release
-            latest_url = f"https://api.github.com/repos/{owner}/{repo}/releases/latest"
-            response = requests.get(latest_url, headers=headers, timeout=15)
-
-            # Handle rate limit exceeded
-            if response.status_code == 403 and "rate limit exceeded" in response.text.lower():
-                logger.error(f"Network error fetching releases: {response.status_code} {response.reason}")
-                logger.info("Skipping update due to GitHub rate limit")
-                sys.exit(0)
+            latest_url = f"{GITHUB_API}/repos/{owner}/{repo}/releases/latest"
+            response = client.get(
+                latest_url,
+                headers=conditional_headers(headers, state, latest_url),
+                cache=False,
+                timeout=15,
+            )
+            if response.status_code == 304:
+                logger.info("Latest release not modified since last run")
+                return None
 
             # 处理没有 release 的情况
             if response.status_code == 404:
@@ -112,6 +263,7 @@ def get_release_assets(owner, repo, tag=None):
                 return []
 
             response.raise_for_status()
+            remember_etag(state, latest_url, response)
             releases = [response.json()]
 
         assets = []
@@ -121,21 +273,13 @@ def get_release_assets(owner, repo, tag=None):
                 logger.info(f"Skipping draft release: {release['tag_name']}")
                 continue
 
-            for asset in release.get("assets", []):
-                # 只处理 gz/tar.gz 文件
-                if asset["name"].lower().endswith((".tar.gz", ".gz")):
-                    assets.append(
-                        {
-                            "name": asset["name"],
-                            "url": asset["browser_download_url"],
-                            "release_tag": release["tag_name"],
-                            "digest": asset.get("digest", ""),
-                        }
-                    )
+            assets.extend(extract_assets(release))
 
         logger.info(f"Found {len(assets)} assets in {len(releases)} releases")
         return assets
 
+    except RateLimitExceeded:
+        raise
     except requests.exceptions.RequestException as e:
         logger.error(f"Network error fetching releases: {str(e)}")
         return []
@@ -144,6 +288,147 @@ def get_release_assets(owner, repo, tag=None):
         return []
 
 
+def graphql_release_query(targets):
+    """为每个 (owner, repo, tag, cursor) 生成一个带别名的 repository 字段
+
+    tag 为 None 时查询最新 release；返回查询文本与变量。
+    """
+    params = []
+    fields = []
+    variables = {}
+    for i, (owner, repo, tag, cursor) in enumerate(targets):
+        params += [f"$o{i}: String!", f"$n{i}: String!", f"$c{i}: String"]
+        variables.update({f"o{i}": owner, f"n{i}": repo, f"c{i}": cursor})
+        if tag:
+            params.append(f"$t{i}: String!")
+            variables[f"t{i}"] = tag
+            release = f"release: release(tagName: $t{i})"
+        else:
+            release = "release: latestRelease"
+        fields.append(
+            f"r{i}: repository(owner: $o{i}, name: $n{i}) {{ {release} {{ "
+            f"tagName isDraft "
+            f"releaseAssets(first: {GRAPHQL_PAGE_SIZE}, after: $c{i}) {{ "
+            f"nodes {{ name downloadUrl digest }} "
+            f"pageInfo {{ hasNextPage endCursor }} }} }} }}"
+        )
+    query = f"query({', '.join(params)}) {{ {' '.join(fields)} }}"
+    return query, variables
+
+
+def get_release_assets_graphql(targets, client=None):
+    """用一次 GraphQL 请求获取多个仓库/标签的 release 资源与 digest
+
+    targets 为 (owner, repo, tag) 列表，tag 为 None 时取最新 release。
+    返回与 targets 一一对应的资源列表；资源超过一页时，仍有下一页的仓库
+    合并进同一个后续请求。GraphQL 需要认证，没有 GITHUB_TOKEN 时返回 None，
+    由调用方回退到 REST。
+    """
+    if not os.environ.get("GITHUB_TOKEN"):
+        return None
+    client = client or HttpClient()
+    results = [[] for _ in targets]
+    # 目标序号 -> 下一页游标
+    pending = {i: None for i in range(len(targets))}
+    while pending:
+        batch = [(i, *targets[i], cursor) for i, cursor in pending.items()]
+        query, variables = graphql_release_query([b[1:] for b in batch])
+        response = client.post(
+            GITHUB_GRAPHQL,
+            json={"query": query, "variables": variables},
+            headers=github_headers(),
+            timeout=30,
+        )
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get("errors"):
+            messages = "; ".join(e.get("message", "") for e in payload["errors"])
+            raise ValueError(f"GraphQL errors: {messages}")
+
+        pending = {}
+        for alias, (i, owner, repo, tag, _) in enumerate(batch):
+            repository = payload["data"].get(f"r{alias}")
+            release = (repository or {}).get("release")
+            if release is None:
+                logger.warning(f"No release {tag or '(latest)'} for {owner}/{repo}")
+                continue
+            if release["isDraft"]:
+                logger.info(f"Skipping draft release: {release['tagName']}")
+                continue
+            page = release["releaseAssets"]
+            # 转换为 REST 的结构，复用同一套资源筛选
+            results[i].extend(
+                extract_assets(
+                    {
+                        "tag_name": release["tagName"],
+                        "assets": [
+                            {
+                                "name": node["name"],
+                                "browser_download_url": node["downloadUrl"],
+                                "digest": node.get("digest") or "",
+                            }
+                            for node in page["nodes"]
+                        ],
+                    }
+                )
+            )
+            if page["pageInfo"]["hasNextPage"]:
+                pending[i] = page["pageInfo"]["endCursor"]
+
+    total = sum(len(assets) for assets in results)
+    logger.info(f"Found {total} assets in {len(targets)} repositories via GraphQL")
+    return results
+
+
+def parse_source(value):
+    """解析 OWNER/REPO[@TAG]"""
+    repo_spec, _, tag = value.partition("@")
+    owner, sep, repo = repo_spec.partition("/")
+    if not sep or not owner or not repo:
+        raise argparse.ArgumentTypeError(f"expected OWNER/REPO[@TAG], got {value!r}")
+    return owner, repo, tag or None
+
+
+def fetch_assets(targets, state, previous, client, all_releases=False, graphql=False):
+    """获取全部 targets 的资源；None 表示 release 未变化，应保留现有条目"""
+    if all_releases:
+        # 已记录的 tag 作为停止点；--full 时遍历完整历史
+        known_tags = {entry.get("tag") for entry in previous.values()}
+        assets = []
+        for owner, repo, _ in targets:
+            found = get_all_release_assets(owner, repo, known_tags, client)
+            if found is None:
+                logger.info("Failed to list releases, keeping existing theme info")
+                return None
+            assets.extend(found)
+        return assets
+
+    if graphql:
+        try:
+            per_target = get_release_assets_graphql(targets, client)
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            logger.warning(f"GraphQL fetch failed, falling back to REST: {e}")
+            per_target = None
+        else:
+            if per_target is None:
+                logger.info("No GITHUB_TOKEN for GraphQL, falling back to REST")
+        if per_target is not None:
+            return [asset for assets in per_target for asset in assets]
+
+    if len(targets) == 1:
+        owner, repo, tag = targets[0]
+        assets = get_release_assets(owner, repo, tag, state, client)
+        if assets is None:
+            logger.info("Release unchanged, keeping existing theme info")
+        return assets
+
+    # 多个来源时不使用 ETag：单个来源未变化时无法区分其已有条目
+    assets = []
+    for owner, repo, tag in targets:
+        assets.extend(get_release_assets(owner, repo, tag, None, client) or [])
+    return assets
+
+
 def generate_package_name(asset_name):
     """生成 Nix 包名"""
     # https://github.com/voidlhf/StarRailGrubThemes?tab=readme-ov-file#without-nixos-module
@@ -161,33 +446,154 @@ def main():
         "--repo", default="StarRailGrubThemes", help="GitHub repository name"
     )
     parser.add_argument("--tag", help="Specific release tag to process")
+    parser.add_argument(
+        "--source",
+        action="append",
+        type=parse_source,
+        help="OWNER/REPO[@TAG] to collect themes from; repeatable, "
+        "overrides --owner/--repo/--tag",
+    )
+    parser.add_argument(
+        "--graphql",
+        action="store_true",
+        help="Fetch releases of all sources in one GraphQL request "
+        "(needs GITHUB_TOKEN, falls back to REST)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help="Concurrent downloads for assets without an API digest",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help="Download attempts per asset before giving up",
+    )
+    parser.add_argument(
+        "--download-cache",
+        default=str(DEFAULT_DOWNLOAD_CACHE),
+        help="Content-addressed cache for downloaded assets",
+    )
+    parser.add_argument(
+        "--no-download-cache",
+        action="store_true",
+        help="Hash downloads in memory without keeping the files",
+    )
+    parser.add_argument(
+        "--add-to-store",
+        action="store_true",
+        help="Register downloaded assets with nix-store --add-fixed",
+    )
     parser.add_argument(
         "--output",
         default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "themes.json"),
         help="Output JSON file path",
     )
+    parser.add_argument(
+        "--state",
+        default=str(SCRIPT_CACHE / "release-state.json"),
+        help="File storing ETags for conditional release requests",
+    )
+    parser.add_argument(
+        "--http-cache",
+        default=str(SCRIPT_CACHE / "http"),
+        help="Directory caching release list pages for revalidation",
+    )
+    parser.add_argument(
+        "--all-releases",
+        action="store_true",
+        help="Walk every release instead of only the latest one, newest first",
+    )
+    parser.add_argument(
+        "--max-wait",
+        type=float,
+        default=DEFAULT_MAX_WAIT,
+        help="Seconds to wait for an exhausted GitHub rate limit to reset "
+        "before deferring the update",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignore ETags and existing entries, rebuild themes.json from scratch",
+    )
 
     args = parser.parse_args()
 
-    logger.info(f"Fetching releases for {args.owner}/{args.repo}")
-    assets = get_release_assets(args.owner, args.repo, args.tag)
+    # 增量模式：复用已有条目，并用 ETag 避免重复获取未变化的 release
+    state = {} if args.full else load_json(args.state, {})
+    previous = {} if args.full else load_json(args.output, {})
+
+    # API 请求与资源下载共用一个连接池
+    client = HttpClient(
+        cache_dir=None if args.full else args.http_cache,
+        pool_size=max(1, args.jobs),
+        retries=args.retries,
+        budget=RateLimitBudget(max_wait=args.max_wait),
+    )
+
+    targets = args.source or [(args.owner, args.repo, args.tag)]
+    names = ", ".join(f"{owner}/{repo}" for owner, repo, _ in targets)
+    logger.info(f"Fetching releases for {names}")
+    # 本次请求前的 ETag，用于找出本次新记录的条目
+    state_before = dict(state)
+    try:
+        assets = fetch_assets(
+            targets, state, previous, client, args.all_releases, args.graphql
+        )
+        if assets is None:
+            return
+    except RateLimitExceeded as e:
+        # 额度在 --max-wait 内不会恢复：以专用退出码推迟，而不是假装没有更新
+        logger.error(f"Deferring update, GitHub {e}")
+        sys.exit(DEFERRED_EXIT_CODE)
     logger.info(f"Found {len(assets)} .gz assets")
 
-    theme_info = {}
+    def reusable_sha256(asset):
+        """url 与 tag 均未变化时复用已记录的 SHA256（仅用于 API 未提供 digest 的资源）"""
+        entry = previous.get(generate_package_name(asset["name"]), {})
+        if entry.get("url") == asset["url"] and entry.get("tag") == asset.get(
+            "release_tag"
+        ):
+            return entry.get("sha256")
+        return None
+
+    # 优先使用API刚返回的SHA256（同一 tag 下重新上传的资源 digest 会变化），
+    # 其次复用已有条目，缺失的统一并发下载计算
+    missing = []
+    for asset in assets:
+        if extract_sha256_from_digest(asset.get("digest", "")):
+            continue
+        if reusable_sha256(asset):
+            continue
+        logger.info(
+            f"SHA256 not found in API for {asset['name']}, falling back to download"
+        )
+        missing.append(asset["url"])
+    cache = None if args.no_download_cache else DownloadCache(args.download_cache)
+    downloaded = hash_missing_digests(
+        missing, args.jobs, args.retries, cache, args.add_to_store, client
+    )
+    if cache is not None:
+        cache.prune()
+
+    # 遍历全部 release 时可能提前停止，未遍历到的主题保留原有条目
+    theme_info = dict(previous) if args.all_releases else {}
+    skipped = []
     for asset in assets:
         pname = generate_package_name(asset["name"])
         logger.info(f"Processing: {pname}")
 
-        # 优先使用API提供的SHA256，如果没有则下载计算
-        sha256 = extract_sha256_from_digest(asset.get("digest", ""))
-        if not sha256:
-            logger.info(
-                f"SHA256 not found in API for {pname}, falling back to download"
-            )
-            sha256 = calculate_sha256_request(asset["url"])
+        sha256 = (
+            extract_sha256_from_digest(asset.get("digest", ""))
+            or reusable_sha256(asset)
+            or downloaded.get(asset["url"])
+        )
 
         if not sha256:
             logger.warning(f"Failed to get SHA256 for {pname}, skipping")
+            skipped.append(pname)
             continue
 
         theme_info[pname] = {
@@ -197,11 +603,29 @@ def main():
         }
 
     # 保存到文件
-    with open(args.output, "w") as f:
+    with trace.span("write", path=args.output) as span, open(args.output, "w") as f:
         json.dump(theme_info, f, indent=2, sort_keys=True)
+        span.set(bytes=f.tell())
 
     logger.info(f"Saved theme info to {args.output}")
 
+    # 有资源被跳过时丢弃本次记录的 ETag，否则下次运行得到 304，
+    # 被跳过的主题要等到上游发布新 release 才会补上
+    if skipped:
+        fetched = [url for url in state if state[url] != state_before.get(url)]
+        for url in fetched:
+            del state[url]
+        logger.warning(
+            f"Not saving ETags: {len(skipped)} asset(s) without SHA256 "
+            "will be retried next run"
+        )
+
+    # 仅在 themes.json 写入成功后保存 ETag，避免中断后误判为未变化
+    os.makedirs(os.path.dirname(os.path.abspath(args.state)), exist_ok=True)
+    with trace.span("write", path=args.state) as span, open(args.state, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+        span.set(bytes=f.tell())
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""Offline benchmarks for readme.py and the update scripts.
+
+Every case runs in a fresh child interpreter against synthetic inputs:
+a generated `pkgs/by-name` tree, the `stub-nix` executable in place of
+`nix` (with `--nix-delay` seconds of latency per evaluation) and a local
+HTTP server imitating the GitHub releases API and the FDM pool listing.
+For each case and size the harness records wall time, subprocesses
+started, HTTP requests served and peak RSS of the child.
+
+Results are written to `.cache/bench/<commit>[-dirty].json`; pass
+`--compare <commit or file>` to print the change against an earlier run.
+
+Usage:
+  python3 scripts/bench/bench.py [--sizes 10,100,1000] [--cases ...]
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent.parent
+STUB_NIX = BENCH_DIR / "stub-nix"
+DEFAULT_RESULTS_DIR = REPO_ROOT / ".cache" / "bench"
+DEFAULT_SIZES = (10, 100, 1000)
+METRICS = ("wall", "subprocesses", "requests", "peak_rss_kib")
+
+sys.path.insert(0, str(BENCH_DIR))
+
+from fixtures import FixtureServer, make_package_tree  # noqa: E402
+
+
+def load_module(name: str, path: Path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_readme(tree: Path):
+    readme = load_module("readme", REPO_ROOT / "scripts" / "readme.py")
+    readme.REPO_ROOT = tree
+    readme.PKGS_DIR = tree / "pkgs"
+    readme.README = tree / "README.md"
+    return readme
+
+
+def case_find_packages(tree: Path, work: Path, server: str, size: int) -> Callable:
+    readme = load_readme(tree)
+    return readme.find_packages
+
+
+def case_build_markdown(tree: Path, work: Path, server: str, size: int) -> Callable:
+    readme = load_readme(tree)
+    groups = readme.find_packages()
+    return lambda: readme.build_markdown(groups)
+
+
+def case_star_rail(tree: Path, work: Path, server: str, size: int) -> Callable:
+    update = load_module(
+        "star_rail_update", REPO_ROOT / "pkgs/grub-themes/star-rail/update.py"
+    )
+    argv = [
+        "update.py",
+        "--full",
+        "--output",
+        str(work / "themes.json"),
+        "--state",
+        str(work / "release-state.json"),
+        "--http-cache",
+        str(work / "http"),
+        "--download-cache",
+        str(work / "downloads"),
+    ]
+
+    def run() -> None:
+        sys.argv = argv
+        update.main()
+
+    return run
+
+
+def case_fdm(tree: Path, work: Path, server: str, size: int) -> Callable:
+    update = load_module(
+        "fdm_update_version",
+        REPO_ROOT / "pkgs/by-name/fr/free-download-manager/update_version.py",
+    )
+    argv = ["update_version.py", "--url", f"{server}/fdm/{size}/", "--no-cache"]
+
+    def run() -> None:
+        sys.argv = argv
+        with contextlib.redirect_stdout(io.StringIO()):
+            update.get_latest_version()
+
+    return run
+
+
+CASES: Dict[str, Callable] = {
+    "find_packages": case_find_packages,
+    "build_markdown": case_build_markdown,
+    "star_rail_main": case_star_rail,
+    "get_latest_version": case_fdm,
+}
+TREE_CASES = {"find_packages", "build_markdown"}
+
+
+def run_child(case: str, tree: Path, work: Path, server: str, size: int) -> Dict:
+    """Time one case in this process; called in the child interpreter."""
+    setup = CASES[case](tree, work, server, size)
+
+    spawned = 0
+    popen = subprocess.Popen
+
+    class CountingPopen(popen):
+        def __init__(self, *args, **kwargs):
+            nonlocal spawned
+            spawned += 1
+            super().__init__(*args, **kwargs)
+
+    subprocess.Popen = CountingPopen
+    start = time.perf_counter()
+    try:
+        setup()
+    finally:
+        wall = time.perf_counter() - start
+        subprocess.Popen = popen
+    return {
+        "wall": wall,
+        "subprocesses": spawned,
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_case(
+    case: str,
+    size: int,
+    tree: Path,
+    server: FixtureServer,
+    bin_dir: Path,
+    nix_delay: float,
+) -> Dict:
+    with tempfile.TemporaryDirectory(prefix=f"bench-{case}-") as tmp:
+        work = Path(tmp)
+        result_path = work / "result.json"
+        env = dict(
+            os.environ,
+            PATH=f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            BENCH_NIX_DELAY=str(nix_delay),
+            GITHUB_API_URL=f"{server.url}/gh/{size}",
+            GITHUB_GRAPHQL_URL=f"{server.url}/gh/{size}/graphql",
+        )
+        env.pop("GITHUB_TOKEN", None)
+        before = server.requests
+        proc = subprocess.run(
+            [
+                sys.executable,
+                str(Path(__file__).resolve()),
+                "--child",
+                case,
+                "--size",
+                str(size),
+                "--tree",
+                str(tree),
+                "--work",
+                str(work),
+                "--server",
+                server.url,
+                "--result",
+                str(result_path),
+            ],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        if proc.returncode != 0:
+            tail = "\n".join(proc.stderr.strip().splitlines()[-20:])
+            raise RuntimeError(f"{case} at size {size} failed:\n{tail}")
+        result = json.loads(result_path.read_text(encoding="utf-8"))
+        result["requests"] = server.requests - before
+        return result
+
+
+def git_revision() -> str:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", "-C", str(REPO_ROOT), *args],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).stdout.strip()
+
+    rev = git("rev-parse", "--short", "HEAD") or "unknown"
+    if git("status", "--porcelain", "--untracked-files=no"):
+        rev += "-dirty"
+    return rev
+
+
+def load_results(ref: str, results_dir: Path) -> Dict:
+    path = Path(ref)
+    if not path.is_file():
+        matches = sorted(results_dir.glob(f"{ref}*.json"))
+        if not matches:
+            raise SystemExit(f"no stored results for {ref} in {results_dir}")
+        path = matches[0]
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def format_metric(metric: str, value: float) -> str:
+    if metric == "wall":
+        return f"{value:.3f}s"
+    if metric == "peak_rss_kib":
+        return f"{value / 1024:.1f}M"
+    return str(value)
+
+
+def print_table(report: Dict, baseline: Optional[Dict] = None) -> None:
+    header = f"{'case':<20} {'size':>6}"
+    for metric in METRICS:
+        header += f" {metric:>14}"
+    print(header)
+    for case, sizes in report["results"].items():
+        for size, values in sizes.items():
+            line = f"{case:<20} {size:>6}"
+            old = (baseline or {}).get("results", {}).get(case, {}).get(size)
+            for metric in METRICS:
+                cell = format_metric(metric, values[metric])
+                if old and old.get(metric):
+                    cell += f" {(values[metric] / old[metric] - 1) * 100:+.0f}%"
+                line += f" {cell:>14}"
+            print(line)
+    if baseline:
+        print(f"\ncompared with {baseline['revision']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark readme.py and the update scripts offline"
+    )
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(s) for s in DEFAULT_SIZES),
+        help="Comma separated synthetic package / asset counts",
+    )
+    parser.add_argument(
+        "--cases",
+        default=",".join(CASES),
+        help=f"Comma separated subset of: {', '.join(CASES)}",
+    )
+    parser.add_argument(
+        "--nix-delay",
+        type=float,
+        default=0.0,
+        help="Seconds the stub nix sleeps per evaluation",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="Runs per case and size; the fastest one is kept",
+    )
+    parser.add_argument(
+        "--results-dir",
+        default=str(DEFAULT_RESULTS_DIR),
+        help="Directory storing results per commit",
+    )
+    parser.add_argument(
+        "--compare", help="Commit or results file to compare this run against"
+    )
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--tree", help=argparse.SUPPRESS)
+    parser.add_argument("--work", help=argparse.SUPPRESS)
+    parser.add_argument("--server", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_child(
+            args.child, Path(args.tree), Path(args.work), args.server, args.size
+        )
+        Path(args.result).write_text(json.dumps(result), encoding="utf-8")
+        return 0
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    cases: List[str] = [c for c in args.cases.split(",") if c]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    results_dir = Path(args.results_dir)
+    baseline = load_results(args.compare, results_dir) if args.compare else None
+    report = {
+        "revision": git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "nix_delay": args.nix_delay,
+        "results": {case: {} for case in cases},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp, FixtureServer() as server:
+        bin_dir = Path(tmp) / "bin"
+        bin_dir.mkdir()
+        (bin_dir / "nix").symlink_to(STUB_NIX)
+        for size in sizes:
+            tree = Path(tmp) / f"tree-{size}"
+            if TREE_CASES & set(cases):
+                make_package_tree(tree, size)
+            for case in cases:
+                runs = [
+                    run_case(case, size, tree, server, bin_dir, args.nix_delay)
+                    for _ in range(max(1, args.repeat))
+                ]
+                best = min(runs, key=lambda r: r["wall"])
+                report["results"][case][str(size)] = best
+                print(f"{case} size={size}: {best['wall']:.3f}s", file=sys.stderr)
+
+    results_dir.mkdir(parents=True, exist_ok=True)
+    out = results_dir / f"{report['revision']}.json"
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print_table(report, baseline)
+    print(f"\nresults written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""Synthetic inputs for the benchmark harness.
+
+`make_package_tree` lays out a repository skeleton with `n` packages under
+`pkgs/by-name/<prefix>/<name>`, and `FixtureServer` serves imitations of
+the GitHub releases API and the free-download-manager pool listing whose
+size is chosen per request path, so one server covers every benchmark size.
+"""
+
+import hashlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Tuple
+
+PACKAGE_NIX = """{{ stdenvNoCC }}:
+stdenvNoCC.mkDerivation {{
+  pname = "{name}";
+  version = "1.0";
+  dontUnpack = true;
+  meta.description = "Synthetic package {name}";
+}}
+"""
+
+# Every tenth asset lacks an API digest so the download path is exercised
+MISSING_DIGEST_EVERY = 10
+ASSET_SIZE = 4096
+
+
+def package_names(n: int) -> list:
+    return [f"bench-{i:05d}" for i in range(n)]
+
+
+def make_package_tree(root: Path, n: int) -> None:
+    """Create `n` by-name packages plus the files readme.py hashes."""
+    (root / "pkgs" / "by-name").mkdir(parents=True, exist_ok=True)
+    (root / "overlays").mkdir(exist_ok=True)
+    (root / "flake.lock").write_text("{}\n", encoding="utf-8")
+    (root / "README.md").write_text(
+        "<!-- BEGIN_PACKAGE_LIST -->\n<!-- END_PACKAGE_LIST -->\n", encoding="utf-8"
+    )
+    for name in package_names(n):
+        pkg_dir = root / "pkgs" / "by-name" / name[:2] / name
+        pkg_dir.mkdir(parents=True, exist_ok=True)
+        (pkg_dir / "package.nix").write_text(
+            PACKAGE_NIX.format(name=name), encoding="utf-8"
+        )
+
+
+def asset_bytes(index: int) -> bytes:
+    seed = f"asset-{index}".encode()
+    return (seed * (ASSET_SIZE // len(seed) + 1))[:ASSET_SIZE]
+
+
+def asset_name(index: int) -> str:
+    return f"Theme_{index:05d}.tar.gz"
+
+
+def fdm_version(index: int) -> str:
+    return f"6.{index // 1000}.{index // 10 % 100}.{index % 10}"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Routes:
+
+    /gh/<n>/repos/<owner>/<repo>/releases/latest   release with n assets (ETag)
+    /gh/<n>/repos/<owner>/<repo>/releases[/tags/x] same release, listed
+    /gh/<n>/assets/<i>                             asset body
+    /gh/<n>/graphql (POST)                         the same release per alias
+    /fdm/<n>/                                      listing with n .debs
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: "FixtureServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body: bytes, content_type: str, headers=None) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def release(self, base: str, n: int) -> Dict:
+        assets = []
+        for i in range(n):
+            asset = {
+                "name": asset_name(i),
+                "browser_download_url": f"{base}/assets/{i}",
+            }
+            if i % MISSING_DIGEST_EVERY:
+                digest = hashlib.sha256(asset_bytes(i)).hexdigest()
+                asset["digest"] = f"sha256:{digest}"
+            assets.append(asset)
+        return {"tag_name": "v1.0.0", "assets": assets}
+
+    def do_POST(self):
+        """Answer star-rail's aliased release query, paging assets by 100.
+
+        Aliases and cursors are taken from the variables (`o<i>`, `c<i>`);
+        the cursor is the offset of the next asset.
+        """
+        self.server.count_request()
+        match = re.match(r"^/gh/(\d+)/graphql$", self.path)
+        if not match:
+            self.send_error(404)
+            return
+        n = int(match.group(1))
+        base = f"http://{self.headers['Host']}/gh/{n}"
+        length = int(self.headers.get("Content-Length", 0))
+        variables = json.loads(self.rfile.read(length))["variables"]
+        release = self.release(base, n)
+        data = {}
+        i = 0
+        while f"o{i}" in variables:
+            start = int(variables.get(f"c{i}") or 0)
+            end = min(start + 100, n)
+            nodes = [
+                {
+                    "name": a["name"],
+                    "downloadUrl": a["browser_download_url"],
+                    "digest": a.get("digest"),
+                }
+                for a in release["assets"][start:end]
+            ]
+            data[f"r{i}"] = {
+                "release": {
+                    "tagName": variables.get(f"t{i}") or release["tag_name"],
+                    "isDraft": False,
+                    "releaseAssets": {
+                        "nodes": nodes,
+                        "pageInfo": {"hasNextPage": end < n, "endCursor": str(end)},
+                    },
+                }
+            }
+            i += 1
+        self.send_body(json.dumps({"data": data}).encode(), "application/json")
+
+    def do_GET(self):
+        self.server.count_request()
+        path = self.path.split("?", 1)[0]
+        match = re.match(r"^/(gh|fdm)/(\d+)(/.*)?$", path)
+        if not match:
+            self.send_error(404)
+            return
+        kind, n, rest = match.group(1), int(match.group(2)), match.group(3) or "/"
+        base = f"http://{self.headers['Host']}/{kind}/{n}"
+
+        if kind == "fdm":
+            links = "\n".join(
+                f'<a href="freedownloadmanager_{fdm_version(i)}_amd64.deb">'
+                f"freedownloadmanager_{fdm_version(i)}_amd64.deb</a>"
+                for i in range(n)
+            )
+            body = f"<html><body><pre>\n{links}\n</pre></body></html>\n".encode()
+            self.send_body(body, "text/html")
+        elif rest.startswith("/assets/"):
+            self.send_body(asset_bytes(int(rest.rsplit("/", 1)[1])), "application/gzip")
+        elif re.match(r"^/repos/[^/]+/[^/]+/releases/(latest|tags/[^/]+)$", rest):
+            etag = f'"bench-{n}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = json.dumps(self.release(base, n)).encode()
+            self.send_body(body, "application/json", {"ETag": etag})
+        elif re.match(r"^/repos/[^/]+/[^/]+/releases$", rest):
+            body = json.dumps([self.release(base, n)]).encode()
+            self.send_body(body, "application/json")
+        else:
+            self.send_error(404)
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """Threaded fixture server on an ephemeral port that counts requests."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int] = ("127.0.0.1", 0)):
+        super().__init__(address, FixtureHandler)
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def count_request(self) -> None:
+        with self.lock:
+            self.requests += 1
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
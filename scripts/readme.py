@@ -1,11 +1,31 @@
 #!/usr/bin/env python3
+import argparse
+import bisect
+import hashlib
 import json
 import os
+import queue
 import re
+import select
+import signal
+import sqlite3
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
 
 REPO_ROOT = Path(__file__).resolve().parent.parent
 PKGS_DIR = REPO_ROOT / "pkgs"
@@ -13,49 +33,130 @@ README = REPO_ROOT / "README.md"
 GITHUB_REPO = "MiyakoMeow/nur-packages"
 DEFAULT_BRANCH = "main"
 DEFAULT_SYSTEM = os.environ.get("NIX_SYSTEM", "x86_64-linux")
+DEFAULT_JOBS = 1
+DEFAULT_TIMEOUT = 600.0
+TIMEOUT_EXIT_CODE = 124
+# A `nix repl` session that died in the middle of a query
+SESSION_LOST_EXIT_CODE = 75
+# Failures that say nothing about the package and may pass on a retry
+TRANSIENT_EXIT_CODES = (TIMEOUT_EXIT_CODE, SESSION_LOST_EXIT_CODE)
+# Seconds an interrupted `nix repl` gets to return to its prompt
+REPL_INTERRUPT_GRACE = 5.0
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = REPO_ROOT / ".cache" / "readme"
+DEFAULT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+# Kept in a subdirectory so MetadataCache.prune never evicts it
+QUARANTINE_FILE = Path("quarantine") / "state.json"
+DEFAULT_QUARANTINE_BACKOFF = 6 * 3600.0
+DEFAULT_QUARANTINE_MAX_BACKOFF = 7 * 24 * 3600.0
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 BEGIN_MARK = "<!-- BEGIN_PACKAGE_LIST -->"
 END_MARK = "<!-- END_PACKAGE_LIST -->"
+FINGERPRINT_RE = re.compile(r"<!-- package-list-fingerprint: ([0-9a-f]+) -->")
 
+# Inputs shared by every package: touching them invalidates all rows
+FULL_RUN_FILES = ("flake.lock", "flake.nix")
+FULL_RUN_DIRS = ("overlays/",)
 
-def run(cmd: List[str], cwd: Optional[Path] = None) -> Tuple[int, str, str]:
-    proc = subprocess.run(
-        cmd,
-        cwd=str(cwd) if cwd else None,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        check=False,
-    )
+
+def run(
+    cmd: List[str], cwd: Optional[Path] = None, timeout: Optional[float] = None
+) -> Tuple[int, str, str]:
+    try:
+        proc = subprocess.run(
+            cmd,
+            cwd=str(cwd) if cwd else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=False,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        # subprocess.run has already killed and reaped the child
+        return TIMEOUT_EXIT_CODE, "", f"timed out after {timeout:g}s: {cmd[0]}"
     return proc.returncode, proc.stdout, proc.stderr
 
 
-def nix_eval_for_pkg(
-    package_file: Path, system: str = DEFAULT_SYSTEM
-) -> Dict[str, Optional[str]]:
-    expr = (
-        """
+# Shared query library: a function from system to per-package queries. Every
+# evaluation mode (one package at a time or batched) goes through it so that
+# the metadata shape stays identical between them.
+QUERY_PRELUDE = """
 let
   flake = builtins.getFlake "path:{repo}";
-  basePkgs = import flake.inputs.nixpkgs {{ system = "{system}"; }};
-  overlaysSet = if builtins.pathExists "{repo}/overlays/default.nix" then import "{repo}/overlays/default.nix" else {{ }};
-  allOverlays = basePkgs.lib.composeManyExtensions (builtins.attrValues overlaysSet);
-  pkgs = basePkgs.extend allOverlays;
-  lib = pkgs.lib;
-  v = pkgs.callPackage {pkg} {{}};
-  target =
-    if lib.isDerivation v then v
-    else if lib.isAttrs v && v ? meta && lib.isDerivation v.meta then v.meta
-    else throw "not a derivation";
-  getName = drv: if drv ? pname then drv.pname else lib.getName drv;
-  getVersion = drv: if drv ? version then drv.version else lib.getVersion drv;
-  getDesc = drv: if drv ? meta && drv.meta ? description then drv.meta.description else (if drv ? description then drv.description else "");
-  getHomePage = drv: if drv ? meta && drv.meta ? homepage then drv.meta.homepage else "";
-  getChangelog = drv: if drv ? meta && drv.meta ? changelog then drv.meta.changelog else "";
-  in {{ pname = getName target; version = getVersion target; description = getDesc target; homepage = getHomePage target; changelog = getChangelog target; }}
+  mkQuery = system:
+    let
+      basePkgs = import flake.inputs.nixpkgs {{ inherit system; }};
+      overlaysSet = if builtins.pathExists "{repo}/overlays/default.nix" then import "{repo}/overlays/default.nix" else {{ }};
+      allOverlays = basePkgs.lib.composeManyExtensions (builtins.attrValues overlaysSet);
+      pkgs = basePkgs.extend allOverlays;
+      lib = pkgs.lib;
+      load = file: pkgs.callPackage file {{}};
+      getName = drv: if drv ? pname then drv.pname else lib.getName drv;
+      getVersion = drv: if drv ? version then drv.version else lib.getVersion drv;
+      getDesc = drv: if drv ? meta && drv.meta ? description then drv.meta.description else (if drv ? description then drv.description else "");
+      getHomePage = drv: if drv ? meta && drv.meta ? homepage then drv.meta.homepage else "";
+      getChangelog = drv: if drv ? meta && drv.meta ? changelog then drv.meta.changelog else "";
+      info = drv: {{ version = getVersion drv; description = getDesc drv; homepage = getHomePage drv; changelog = getChangelog drv; available = lib.meta.availableOn pkgs.stdenv.hostPlatform drv; }};
+      metaOf = v:
+        let
+          target =
+            if lib.isDerivation v then v
+            else if lib.isAttrs v && v ? meta && lib.isDerivation v.meta then v.meta
+            else throw "not a derivation";
+        in {{ pname = getName target; }} // info target;
+      childrenOf = v:
+        let
+          children =
+            if lib.isDerivation v then {{}} else
+            if lib.isAttrs v then v else {{}};
+          names = lib.filter (n: n != "meta" && (builtins.hasAttr n children) && lib.isDerivation (builtins.getAttr n children)) (lib.attrNames children);
+        in map (name: {{ inherit name; }} // info (builtins.getAttr name children)) names;
+      strict = x: builtins.deepSeq x x;
+      entryOf = file:
+        let
+          v = load file;
+          c = builtins.tryEval (strict (childrenOf v));
+          m = builtins.tryEval (strict (metaOf v));
+        in
+        if c.success && c.value != [ ] then {{ children = c.value; meta = null; error = null; }}
+        else if m.success then {{ children = [ ]; meta = m.value; error = null; }}
+        else {{ children = [ ]; meta = null; error = "not a derivation or evaluation error"; }};
+    in {{
+      meta = file: metaOf (load file);
+      children = file: childrenOf (load file);
+      entry = entryOf;
+    }};
+in mkQuery
 """
-    ).format(repo=str(REPO_ROOT), system=system, pkg=str(package_file))
-    code, out, err = run(
+
+
+def nix_str(value: str) -> str:
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("${", "\\${")
+    return f'"{escaped}"'
+
+
+def nix_path(path: Path) -> str:
+    return f"(/. + {nix_str(str(path))})"
+
+
+def systems_binding(systems: Sequence[str], query_for: Callable[[str], str]) -> str:
+    """Bind `qs` to the query sets of all `systems` and `q` to the first one."""
+    attrs = " ".join(f"{nix_str(s)} = {query_for(s)};" for s in systems)
+    return f"qs = {{ {attrs} }}; q = qs.{nix_str(systems[0])};"
+
+
+def query_expr(systems: Sequence[str], body: str) -> str:
+    prelude = QUERY_PRELUDE.format(repo=str(REPO_ROOT))
+    binding = systems_binding(systems, lambda s: f"mkQuery {nix_str(s)}")
+    return f"let mkQuery = ({prelude}); {binding} in {body}"
+
+
+def nix_eval_json(expr: str, timeout: Optional[float] = None) -> Tuple[int, str, str]:
+    return run(
         [
             "nix",
             "eval",
@@ -67,55 +168,401 @@ let
             expr,
         ],
         cwd=REPO_ROOT,
+        timeout=timeout,
+    )
+
+
+class EvalBackend(Protocol):
+    """Something that evaluates a query body against the prelude.
+
+    `body` may refer to `qs`, the query sets keyed by each of `systems`, and
+    to `q`, the query set of the first system. The result is the exit code,
+    the JSON text of the value and the error output.
+    """
+
+    # Number of nix processes started so far, for profiling
+    processes: int
+
+    def eval_json(
+        self, systems: Sequence[str], body: str, timeout: Optional[float] = None
+    ) -> Tuple[int, str, str]: ...
+
+    def close(self) -> None: ...
+
+
+class OneShotBackend:
+    """Evaluate every query in a fresh `nix eval` process."""
+
+    def __init__(self) -> None:
+        self.processes = 0
+        self.lock = threading.Lock()
+
+    def eval_json(
+        self, systems: Sequence[str], body: str, timeout: Optional[float] = None
+    ) -> Tuple[int, str, str]:
+        with self.lock:
+            self.processes += 1
+        return nix_eval_json(query_expr(systems, body), timeout)
+
+    def close(self) -> None:
+        pass
+
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+NIX_STRING_ESCAPE = re.compile(r"\\(.)")
+
+
+def parse_nix_string(text: str) -> str:
+    """Decode a string literal as printed by `nix repl`."""
+    if len(text) < 2 or text[0] != '"' or text[-1] != '"':
+        raise ValueError(f"not a Nix string: {text[:80]!r}")
+    escapes = {"n": "\n", "r": "\r", "t": "\t"}
+    return NIX_STRING_ESCAPE.sub(
+        lambda m: escapes.get(m.group(1), m.group(1)), text[1:-1]
     )
+
+
+class ReplSession:
+    """One long-lived `nix repl` with the query prelude already loaded.
+
+    Queries are written as single lines followed by a sentinel string; the
+    answer is whatever the repl prints before the sentinel comes back. A
+    query that runs past its timeout is interrupted like Ctrl-C would, which
+    keeps the loaded flake; the session is only killed if that fails.
+    """
+
+    def __init__(self, timeout: Optional[float]):
+        self.proc = subprocess.Popen(
+            [
+                "nix",
+                "repl",
+                "--impure",
+                "--extra-experimental-features",
+                "nix-command flakes",
+            ],
+            cwd=str(REPO_ROOT),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env={**os.environ, "NO_COLOR": "1", "TERM": "dumb"},
+        )
+        self.systems: Dict[str, str] = {}
+        self.counter = 0
+        self.buffer = b""
+        prelude = QUERY_PRELUDE.format(repo=str(REPO_ROOT)).replace("\n", " ")
+        code, _, err = self.send(f"__readme_mkq = {prelude}", timeout)
+        if code != 0:
+            self.close()
+            raise RuntimeError(f"failed to start nix repl: {err}")
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def close(self) -> None:
+        if self.alive():
+            self.proc.kill()
+        self.proc.wait()
+
+    def _read_until(self, marker: bytes, deadline: Optional[float]) -> Optional[bytes]:
+        fd = self.proc.stdout.fileno()
+        while marker not in self.buffer:
+            wait = None if deadline is None else deadline - time.monotonic()
+            if wait is not None and wait <= 0:
+                return None
+            ready, _, _ = select.select([fd], [], [], wait)
+            if not ready:
+                return None
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise EOFError("nix repl exited")
+            self.buffer += chunk
+        head, _, self.buffer = self.buffer.partition(marker)
+        return head
+
+    def interrupt(self, sentinel: str) -> bool:
+        """Abort the running query; False if the repl did not come back."""
+        try:
+            self.proc.send_signal(signal.SIGINT)
+            # The sentinel was sent along with the query and is echoed next
+            deadline = time.monotonic() + REPL_INTERRUPT_GRACE
+            return self._read_until(sentinel.encode(), deadline) is not None
+        except (OSError, EOFError):
+            return False
+
+    def send(self, line: str, timeout: Optional[float]) -> Tuple[int, str, str]:
+        self.counter += 1
+        sentinel = f"__readme_done_{self.counter}__"
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            self.proc.stdin.write(f'{line}\n"{sentinel}"\n'.encode())
+            self.proc.stdin.flush()
+            raw = self._read_until(sentinel.encode(), deadline)
+        except (OSError, EOFError) as exc:
+            self.close()
+            return SESSION_LOST_EXIT_CODE, "", str(exc)
+        if raw is None:
+            if not self.interrupt(sentinel):
+                self.close()
+            return TIMEOUT_EXIT_CODE, "", f"timed out after {timeout:g}s: nix repl"
+
+        lines = [
+            ANSI_ESCAPE.sub("", ln).strip()
+            for ln in raw.decode(errors="replace").splitlines()
+        ]
+        lines = [ln for ln in lines if ln and not ln.startswith("Welcome to Nix")]
+        # The sentinel is printed as a string literal; drop its stray quotes
+        lines = [ln for ln in lines if ln != '"']
+        if any(ln.startswith("error:") for ln in lines):
+            return 1, "", "\n".join(lines)
+        return 0, "\n".join(lines), ""
+
+    def eval_json(
+        self, systems: Sequence[str], body: str, timeout: Optional[float]
+    ) -> Tuple[int, str, str]:
+        for system in systems:
+            if system in self.systems:
+                continue
+            name = f"__readme_q{len(self.systems)}"
+            code, _, err = self.send(
+                f"{name} = __readme_mkq {nix_str(system)}", timeout
+            )
+            if code != 0:
+                return code, "", err
+            self.systems[system] = name
+        binding = systems_binding(systems, lambda s: self.systems[s])
+        code, out, err = self.send(
+            f"builtins.toJSON (let {binding} in {body})", timeout
+        )
+        if code != 0:
+            return code, out, err
+        try:
+            return 0, parse_nix_string(out.splitlines()[-1]), ""
+        except (IndexError, ValueError) as exc:
+            return 1, "", f"unexpected nix repl output: {exc}"
+
+
+class ReplBackend:
+    """Answer queries from a pool of persistent `nix repl` sessions.
+
+    The flake, nixpkgs and overlays are loaded once per session and per
+    system instead of once per query, so a timed-out batch and the
+    per-package fallback after it share one session. Sessions that die or
+    do not recover from a timeout are replaced on the next query; if no
+    session can be started at all the backend keeps working through the
+    one-shot fallback.
+    """
+
+    def __init__(self, size: int = 1, fallback: Optional[OneShotBackend] = None):
+        self.fallback = fallback or OneShotBackend()
+        self.idle: "queue.Queue[ReplSession]" = queue.Queue()
+        self.slots = threading.Semaphore(max(size, 1))
+        self.lock = threading.Lock()
+        self.sessions: List[ReplSession] = []
+        self.started = 0
+        self.broken = False
+
+    @property
+    def processes(self) -> int:
+        return self.started + self.fallback.processes
+
+    def _acquire(self, timeout: Optional[float]) -> Optional[ReplSession]:
+        while True:
+            try:
+                session = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            if session.alive():
+                return session
+            session.close()
+        if self.broken:
+            return None
+        with self.lock:
+            self.started += 1
+        try:
+            session = ReplSession(timeout)
+        except (OSError, RuntimeError) as exc:
+            print(
+                f"nix repl unavailable, using one-shot nix eval: {exc}",
+                file=sys.stderr,
+            )
+            self.broken = True
+            return None
+        with self.lock:
+            self.sessions.append(session)
+        return session
+
+    def eval_json(
+        self, systems: Sequence[str], body: str, timeout: Optional[float] = None
+    ) -> Tuple[int, str, str]:
+        with self.slots:
+            session = self._acquire(timeout)
+            if session is None:
+                return self.fallback.eval_json(systems, body, timeout)
+            try:
+                return session.eval_json(systems, body, timeout)
+            finally:
+                if session.alive():
+                    self.idle.put(session)
+
+    def close(self) -> None:
+        with self.lock:
+            for session in self.sessions:
+                session.close()
+            self.sessions.clear()
+
+
+QUERY_LABEL = re.compile(r'^q\.(meta|children) \(/\. \+ "(.*)"\)$')
+BATCH_ENTRY = re.compile(r'q\.entry \(/\. \+ "((?:[^"\\]|\\.)*)"\)')
+
+
+class ProfilingBackend:
+    """Wrap another backend and record every query it answers.
+
+    Each record holds the package, the query kind (`meta`, `children`,
+    `entry` for a single-package batch or `batch`), wall time, exit code and
+    stderr size; batch records also list the files they covered. Process
+    startup cost is estimated from one trivial `nix eval` run when the
+    report is built. A batch is timed as a whole, since nix offers no clock
+    inside an evaluation: pass `--batch-size 1` to time packages one by
+    one, at the cost of one evaluation per package.
+    """
+
+    def __init__(self, inner: EvalBackend):
+        self.inner = inner
+        self.records: List[Dict] = []
+        self.lock = threading.Lock()
+
+    @property
+    def processes(self) -> int:
+        return self.inner.processes
+
+    def eval_json(
+        self, systems: Sequence[str], body: str, timeout: Optional[float] = None
+    ) -> Tuple[int, str, str]:
+        match = QUERY_LABEL.match(body)
+        entries = BATCH_ENTRY.findall(body)
+        if match:
+            query = match.group(1)
+            package = os.path.relpath(match.group(2), REPO_ROOT)
+        elif len(entries) == 1:
+            query = "entry"
+            package = os.path.relpath(entries[0], REPO_ROOT)
+        else:
+            query = "batch"
+            package = f"{len(entries)} packages"
+        start = time.monotonic()
+        code, out, err = self.inner.eval_json(systems, body, timeout)
+        record = {
+            "package": package,
+            "query": query,
+            "system": ",".join(systems),
+            "wall": round(time.monotonic() - start, 6),
+            "exit_code": code,
+            "stderr_bytes": len(err.encode()),
+        }
+        if query == "batch":
+            record["files"] = [os.path.relpath(e, REPO_ROOT) for e in entries]
+        with self.lock:
+            self.records.append(record)
+        return code, out, err
+
+    def close(self) -> None:
+        self.inner.close()
+
+    def report(self, cache: Optional["MetadataCache"] = None) -> Dict:
+        baseline = 0.0
+        if self.processes:
+            start = time.monotonic()
+            code, _, _ = nix_eval_json("null")
+            baseline = time.monotonic() - start if code == 0 else 0.0
+        total = sum(r["wall"] for r in self.records)
+        startup = min(total, baseline * self.processes)
+        per_package: Dict[str, float] = {}
+        for r in self.records:
+            per_package[r["package"]] = per_package.get(r["package"], 0.0) + r["wall"]
+        summary = {
+            "calls": len(self.records),
+            "failures": sum(1 for r in self.records if r["exit_code"] != 0),
+            "processes": self.processes,
+            "total_wall": round(total, 6),
+            "startup_estimate": round(startup, 6),
+            "evaluation_estimate": round(total - startup, 6),
+            "process_baseline": round(baseline, 6),
+            "slowest": [
+                {"package": package, "wall": round(wall, 6)}
+                for package, wall in sorted(per_package.items(), key=lambda kv: -kv[1])
+            ][:20],
+        }
+        if cache is not None:
+            lookups = cache.hits + cache.misses
+            summary["cache"] = {
+                "hits": cache.hits,
+                "misses": cache.misses,
+                "hit_rate": round(cache.hits / lookups, 4) if lookups else None,
+            }
+        _, commit, _ = run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT)
+        return {"commit": commit.strip(), "summary": summary, "calls": self.records}
+
+
+def print_profile(report: Dict) -> None:
+    summary = report["summary"]
+    print(
+        f"{summary['calls']} nix queries ({summary['failures']} failed) "
+        f"in {summary['processes']} nix processes, "
+        f"{summary['total_wall']:.2f}s total: "
+        f"~{summary['startup_estimate']:.2f}s startup, "
+        f"~{summary['evaluation_estimate']:.2f}s evaluation",
+        file=sys.stderr,
+    )
+    if "cache" in summary:
+        cache = summary["cache"]
+        rate = "-" if cache["hit_rate"] is None else f"{cache['hit_rate']:.0%}"
+        print(
+            f"cache: {cache['hits']} hits, {cache['misses']} misses ({rate})",
+            file=sys.stderr,
+        )
+    print(f"{'seconds':>9}  package", file=sys.stderr)
+    for item in summary["slowest"]:
+        print(f"{item['wall']:9.3f}  {item['package']}", file=sys.stderr)
+
+
+class TransientEvalError(RuntimeError):
+    """A query that timed out or lost its session rather than failing to evaluate."""
+
+
+def check_transient(code: int, err: str, package_file: Path) -> None:
+    if code in TRANSIENT_EXIT_CODES or code < 0:
+        raise TransientEvalError(f"nix eval failed for {package_file}: {err}")
+
+
+def nix_eval_for_pkg(
+    package_file: Path,
+    system: str = DEFAULT_SYSTEM,
+    timeout: Optional[float] = None,
+    backend: Optional[EvalBackend] = None,
+) -> Dict[str, Optional[str]]:
+    backend = backend or OneShotBackend()
+    body = f"q.meta {nix_path(package_file)}"
+    code, out, err = backend.eval_json([system], body, timeout)
+    check_transient(code, err, package_file)
     if code != 0:
         raise RuntimeError(
-            f"nix eval failed for {package_file}: {err}\nExpression was:\n{expr}"
+            f"nix eval failed for {package_file}: {err}\nExpression was:\n{body}"
         )
     return json.loads(out)
 
 
 def nix_list_children(
-    package_file: Path, system: str = DEFAULT_SYSTEM
+    package_file: Path,
+    system: str = DEFAULT_SYSTEM,
+    timeout: Optional[float] = None,
+    backend: Optional[EvalBackend] = None,
 ) -> List[Dict[str, Optional[str]]]:
-    expr = (
-        """
-let
-  flake = builtins.getFlake "path:{repo}";
-  basePkgs = import flake.inputs.nixpkgs {{ system = "{system}"; }};
-  overlaysSet = if builtins.pathExists "{repo}/overlays/default.nix" then import "{repo}/overlays/default.nix" else {{ }};
-  allOverlays = basePkgs.lib.composeManyExtensions (builtins.attrValues overlaysSet);
-  pkgs = basePkgs.extend allOverlays;
-  lib = pkgs.lib;
-  v = pkgs.callPackage {pkg} {{}};
-  children =
-    if lib.isDerivation v then {{}} else
-    if lib.isAttrs v then v else {{}};
-  names = lib.filter (n: n != "meta" && (builtins.hasAttr n children) && lib.isDerivation (builtins.getAttr n children)) (lib.attrNames children);
-  toObj = name:
-    let drv = builtins.getAttr name children; in
-    {{ name = name;
-       version = if drv ? version then drv.version else lib.getVersion drv;
-       description = if drv ? meta && drv.meta ? description then drv.meta.description else (if drv ? description then drv.description else "");
-       homepage = if drv ? meta && drv.meta ? homepage then drv.meta.homepage else "";
-       changelog = if drv ? meta && drv.meta ? changelog then drv.meta.changelog else "";
-    }};
-  in map toObj names
-"""
-    ).format(repo=str(REPO_ROOT), system=system, pkg=str(package_file))
-    code, out, err = run(
-        [
-            "nix",
-            "eval",
-            "--impure",
-            "--json",
-            "--extra-experimental-features",
-            "nix-command flakes",
-            "--expr",
-            expr,
-        ],
-        cwd=REPO_ROOT,
+    backend = backend or OneShotBackend()
+    code, out, err = backend.eval_json(
+        [system], f"q.children {nix_path(package_file)}", timeout
     )
+    check_transient(code, err, package_file)
     if code != 0:
         return []
     try:
@@ -124,6 +571,483 @@ let
         return []
 
 
+def nix_eval_entry(
+    package_file: Path,
+    system: str = DEFAULT_SYSTEM,
+    timeout: Optional[float] = None,
+    backend: Optional[EvalBackend] = None,
+) -> Dict:
+    """Evaluate one package the same way a batched run would, one query at a time.
+
+    Timeouts and lost sessions are marked `transient`: unlike evaluation
+    errors they are not explained by the package's inputs.
+    """
+    try:
+        children = nix_list_children(package_file, system, timeout, backend)
+        if children:
+            return {"children": children, "meta": None, "error": None}
+        meta = nix_eval_for_pkg(package_file, system, timeout, backend)
+    except TransientEvalError as exc:
+        return {"children": [], "meta": None, "error": str(exc), "transient": True}
+    except Exception as exc:
+        return {"children": [], "meta": None, "error": str(exc)}
+    return {"children": [], "meta": meta, "error": None}
+
+
+def nix_eval_batch(
+    files: List[str],
+    systems: Sequence[str] = (DEFAULT_SYSTEM,),
+    timeout: Optional[float] = None,
+    backend: Optional[EvalBackend] = None,
+) -> Dict[str, Dict[str, Dict]]:
+    """Evaluate children and metadata of every package file in one `nix eval`.
+
+    Flake loading happens once for the whole batch, nixpkgs import and overlay
+    composition once per system. Results are keyed by system, then by file.
+    Each package is wrapped in `builtins.tryEval`, so throws stay local to
+    that package; errors `tryEval` cannot catch fail the whole batch and raise
+    RuntimeError so the caller can fall back to per-package runs.
+    """
+    backend = backend or OneShotBackend()
+    items = " ".join(
+        f"{{ name = {nix_str(f)}; value = q.entry {nix_path(REPO_ROOT / f)}; }}"
+        for f in files
+    )
+    code, out, err = backend.eval_json(
+        systems,
+        f"builtins.mapAttrs (system: q: builtins.listToAttrs [ {items} ]) qs",
+        timeout,
+    )
+    if code != 0:
+        raise RuntimeError(f"batched nix eval failed: {err}")
+    return json.loads(out)
+
+
+def map_ordered(fn: Callable[[T], R], items: List[T], jobs: int) -> List[R]:
+    """Apply `fn` to `items` on up to `jobs` threads, keeping input order."""
+    if jobs <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    executor = ThreadPoolExecutor(max_workers=min(jobs, len(items)))
+    try:
+        futures = [executor.submit(fn, item) for item in items]
+        return [f.result() for f in futures]
+    finally:
+        # Drop queued work if a worker raised or we were interrupted
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def evaluate_batch_chunk(
+    files: List[str],
+    systems: Sequence[str],
+    timeout: Optional[float],
+    backend: EvalBackend,
+) -> Dict[str, Dict[str, Dict]]:
+    try:
+        return nix_eval_batch(files, systems, timeout, backend)
+    except Exception as exc:
+        print(
+            f"Batched evaluation failed, falling back to per-package: {exc}",
+            file=sys.stderr,
+        )
+    return {
+        system: {
+            f: nix_eval_entry(REPO_ROOT / f, system, timeout, backend) for f in files
+        }
+        for system in systems
+    }
+
+
+def evaluate_files(
+    files: List[str],
+    systems: Sequence[str] = (DEFAULT_SYSTEM,),
+    batch: bool = True,
+    jobs: int = DEFAULT_JOBS,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+    backend: Optional[EvalBackend] = None,
+    batch_size: Optional[int] = None,
+) -> Dict[str, Dict[str, Dict]]:
+    """Evaluate the given package files for every system.
+
+    Results are keyed by system, then by repo-relative file. With `jobs` > 1
+    the work is spread over a thread pool: batched mode splits the package
+    list into one chunk per worker (or into chunks of `batch_size`), each
+    covering all systems, per-package mode evaluates one file and system per
+    task. `timeout` bounds every single query sent to `backend`.
+    """
+    results: Dict[str, Dict[str, Dict]] = {system: {} for system in systems}
+    if not files:
+        return results
+    backend = backend or OneShotBackend()
+    if batch:
+        if batch_size:
+            chunks = [
+                files[i : i + batch_size] for i in range(0, len(files), batch_size)
+            ]
+        else:
+            chunks = [
+                files[i :: max(jobs, 1)] for i in range(min(max(jobs, 1), len(files)))
+            ]
+        for chunk_results in map_ordered(
+            lambda chunk: evaluate_batch_chunk(chunk, systems, timeout, backend),
+            chunks,
+            jobs,
+        ):
+            for system in systems:
+                results[system].update(chunk_results.get(system, {}))
+        return results
+
+    tasks = [(system, f) for system in systems for f in files]
+    entries = map_ordered(
+        lambda task: nix_eval_entry(REPO_ROOT / task[1], task[0], timeout, backend),
+        tasks,
+        jobs,
+    )
+    for (system, f), entry in zip(tasks, entries):
+        results[system][f] = entry
+    return results
+
+
+# (REPO_ROOT, git index mtime) -> tracked paths, see tracked_files()
+_tracked_cache: Dict[Tuple[str, int], Optional[List[str]]] = {}
+
+
+def tracked_files() -> Optional[List[str]]:
+    """Sorted repo-relative paths git tracks, or None outside a git checkout.
+
+    Flake evaluation only sees tracked files, so untracked and ignored ones
+    (`__pycache__`, the update scripts' `cache/` directories) must not feed
+    cache keys or the fingerprint. One `git ls-files` serves the whole run.
+    """
+    try:
+        stamp = (REPO_ROOT / ".git" / "index").stat().st_mtime_ns
+    except OSError:
+        stamp = 0
+    key = (str(REPO_ROOT), stamp)
+    if key not in _tracked_cache:
+        code, out, _ = run(["git", "ls-files", "-z"], cwd=REPO_ROOT)
+        _tracked_cache[key] = (
+            sorted(p for p in out.split("\0") if p) if code == 0 else None
+        )
+    return _tracked_cache[key]
+
+
+def _files_under(path: Path) -> List[Path]:
+    """Files under the directory `path` that belong in a content hash."""
+    tracked = tracked_files()
+    try:
+        prefix = path.relative_to(REPO_ROOT).as_posix() + "/"
+    except ValueError:
+        tracked = None
+    if tracked is not None:
+        start = bisect.bisect_left(tracked, prefix)
+        end = bisect.bisect_left(tracked, prefix[:-1] + "0")  # "0" sorts after "/"
+        return [REPO_ROOT / rel for rel in tracked[start:end]]
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        files.extend(Path(root) / name for name in sorted(names))
+    return files
+
+
+def hash_tree(hasher: "hashlib._Hash", path: Path) -> None:
+    """Feed the relative paths and contents of the files under `path`.
+
+    Inside a git checkout only tracked files count.
+    """
+    if path.is_file():
+        hasher.update(b"f\0")
+        hasher.update(path.read_bytes())
+        return
+    if not path.is_dir():
+        hasher.update(b"missing\0")
+        return
+    for file_path in _files_under(path):
+        if not file_path.is_file():
+            continue  # tracked but deleted in the working tree
+        hasher.update(file_path.relative_to(path).as_posix().encode() + b"\0")
+        hasher.update(file_path.read_bytes())
+        hasher.update(b"\0")
+
+
+def global_inputs_digest(system: str) -> str:
+    """Digest of the inputs every package evaluation depends on."""
+    hasher = hashlib.sha256()
+    hasher.update(f"{CACHE_VERSION}\0{system}\0".encode())
+    hasher.update(QUERY_PRELUDE.encode())
+    hash_tree(hasher, REPO_ROOT / "flake.lock")
+    hash_tree(hasher, REPO_ROOT / "overlays")
+    return hasher.hexdigest()
+
+
+def package_cache_key(file_rel: str, inputs_digest: str) -> str:
+    hasher = hashlib.sha256()
+    hasher.update(f"{inputs_digest}\0{file_rel}\0".encode())
+    hash_tree(hasher, (REPO_ROOT / file_rel).parent)
+    return hasher.hexdigest()
+
+
+class MetadataCache:
+    """On-disk cache of evaluation results, one JSON file per content key.
+
+    Entries are touched on every hit, and `prune` evicts the least recently
+    used ones until the directory fits in `max_bytes`.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        try:
+            value = json.loads(path.read_text(encoding="utf-8"))
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Dict) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(value, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def prune(self) -> None:
+        if not self.root.is_dir():
+            return
+        entries = []
+        for path in self.root.glob("*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def format_time(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+class Quarantine:
+    """Persistent record of package evaluations that failed.
+
+    Entries are kept per system and package file together with the cache key
+    of the inputs that failed. While that key is unchanged the package is
+    skipped until its backoff expires; the backoff doubles with every
+    consecutive failure up to `max_backoff`. Any change to the package
+    directory, flake.lock or overlays/ yields a new key and an immediate retry.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        backoff: float = DEFAULT_QUARANTINE_BACKOFF,
+        max_backoff: float = DEFAULT_QUARANTINE_MAX_BACKOFF,
+    ):
+        self.path = path
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.entries: Dict[str, Dict] = {}
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if data.get("version") == CACHE_VERSION:
+            self.entries = data.get("entries", {})
+
+    @staticmethod
+    def _id(system: str, file_rel: str) -> str:
+        return f"{system}:{file_rel}"
+
+    def get(self, system: str, file_rel: str) -> Optional[Dict]:
+        return self.entries.get(self._id(system, file_rel))
+
+    def lookup(self, system: str, file_rel: str, key: str) -> Optional[Dict]:
+        """The failed result to reuse, or None if the package should be retried."""
+        entry = self.get(system, file_rel)
+        if entry is None or entry["key"] != key or entry["retry_after"] <= time.time():
+            return None
+        return {
+            "children": [],
+            "meta": None,
+            "error": entry["error"],
+            "quarantined": True,
+            "transient": entry.get("transient", False),
+        }
+
+    def record_failure(
+        self, system: str, file_rel: str, key: str, error: str, transient: bool = False
+    ) -> None:
+        now = time.time()
+        previous = self.get(system, file_rel)
+        if previous is None or previous["key"] != key:
+            previous = {"failures": 0, "first_failed": now}
+        failures = previous["failures"] + 1
+        delay = min(self.backoff * 2 ** (failures - 1), self.max_backoff)
+        self.entries[self._id(system, file_rel)] = {
+            "system": system,
+            "file": file_rel,
+            "key": key,
+            "error": error,
+            "transient": transient,
+            "failures": failures,
+            "first_failed": previous["first_failed"],
+            "last_failed": now,
+            "retry_after": now + delay,
+        }
+
+    def record_success(self, system: str, file_rel: str) -> None:
+        self.entries.pop(self._id(system, file_rel), None)
+
+    def save(self) -> None:
+        data = {"version": CACHE_VERSION, "entries": self.entries}
+        text = json.dumps(data, indent=2, sort_keys=True) + "\n"
+        atomic_write(self.path, text.encode("utf-8"))
+
+
+def evaluate_packages(
+    groups: Dict[str, List[Dict[str, str]]],
+    systems: Sequence[str] = (DEFAULT_SYSTEM,),
+    batch: bool = True,
+    jobs: int = DEFAULT_JOBS,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+    cache: Optional[MetadataCache] = None,
+    backend: Optional[EvalBackend] = None,
+    quarantine: Optional[Quarantine] = None,
+    batch_size: Optional[int] = None,
+) -> Dict[str, Dict[str, Dict]]:
+    """Evaluate every package in `groups`, reusing cached results if possible.
+
+    Only successful evaluations are stored in `cache`. Failures go to
+    `quarantine`, which answers for them with the recorded error until their
+    inputs change or their backoff expires.
+    """
+    files = [e["file"] for entries in groups.values() for e in entries]
+    if cache is None and quarantine is None:
+        return evaluate_files(files, systems, batch, jobs, timeout, backend, batch_size)
+
+    keys: Dict[str, Dict[str, str]] = {}
+    results: Dict[str, Dict[str, Dict]] = {}
+    for system in systems:
+        inputs_digest = global_inputs_digest(system)
+        keys[system] = {f: package_cache_key(f, inputs_digest) for f in files}
+        results[system] = {}
+        for f in files:
+            cached = cache.get(keys[system][f]) if cache is not None else None
+            if cached is None and quarantine is not None:
+                cached = quarantine.lookup(system, f, keys[system][f])
+            if cached is not None:
+                results[system][f] = cached
+    # Evaluate a file for all systems at once if any of them missed
+    misses = [f for f in files if any(f not in results[s] for s in systems)]
+    fresh = evaluate_files(misses, systems, batch, jobs, timeout, backend, batch_size)
+    for system in systems:
+        for f, result in fresh[system].items():
+            results[system][f] = result
+            if result.get("error"):
+                if quarantine is not None:
+                    quarantine.record_failure(
+                        system,
+                        f,
+                        keys[system][f],
+                        result["error"],
+                        bool(result.get("transient")),
+                    )
+                continue
+            if cache is not None:
+                cache.put(keys[system][f], result)
+            if quarantine is not None:
+                quarantine.record_success(system, f)
+    if cache is not None:
+        cache.prune()
+    if quarantine is not None:
+        quarantine.save()
+    return results
+
+
+def failure_report(
+    results: Dict[str, Dict[str, Dict]], quarantine: Optional[Quarantine] = None
+) -> Dict:
+    """Every package that failed to evaluate, with its quarantine state."""
+    failures = []
+    for system, by_file in results.items():
+        for file_rel, result in sorted(by_file.items()):
+            if not result.get("error"):
+                continue
+            item = {
+                "system": system,
+                "file": file_rel,
+                "error": result["error"],
+                "skipped": bool(result.get("quarantined")),
+                "transient": bool(result.get("transient")),
+            }
+            entry = quarantine.get(system, file_rel) if quarantine else None
+            if entry is not None:
+                item["failures"] = entry["failures"]
+                item["first_failed"] = format_time(entry["first_failed"])
+                item["retry_after"] = format_time(entry["retry_after"])
+            failures.append(item)
+    return {"generated": format_time(time.time()), "failures": failures}
+
+
+def print_failures(report: Dict) -> None:
+    failures = report["failures"]
+    if not failures:
+        return
+    skipped = sum(1 for item in failures if item["skipped"])
+    print(
+        f"{len(failures)} evaluation failure(s), {skipped} skipped by quarantine:",
+        file=sys.stderr,
+    )
+    for item in failures:
+        retry = f" (retry after {item['retry_after']})" if "retry_after" in item else ""
+        print(f"  {item['system']}  {item['file']}{retry}", file=sys.stderr)
+
+
+def tree_fingerprint(
+    groups: Dict[str, List[Dict[str, str]]], systems: Sequence[str]
+) -> str:
+    """Digest of everything the generated package list is derived from.
+
+    Covers the discovered packages and their cache keys for every system
+    (package trees, flake.lock, overlays/, the query expression) plus this
+    script, so it changes whenever a regeneration could change the output.
+    """
+    hasher = hashlib.sha256()
+    hash_tree(hasher, Path(__file__).resolve())
+    for system in systems:
+        inputs_digest = global_inputs_digest(system)
+        hasher.update(f"{system}\0".encode())
+        for group in sorted(groups):
+            for e in sorted(groups[group], key=lambda x: x["file"]):
+                key = package_cache_key(e["file"], inputs_digest)
+                hasher.update(f"{group}\0{e['usable_path']}\0{key}\0".encode())
+    return hasher.hexdigest()
+
+
+def readme_fingerprint() -> Optional[str]:
+    text = README.read_text(encoding="utf-8")
+    if BEGIN_MARK not in text or END_MARK not in text:
+        return None
+    block = text.split(BEGIN_MARK, 1)[1].split(END_MARK, 1)[0]
+    match = FINGERPRINT_RE.search(block)
+    return match.group(1) if match else None
+
+
 essential_groups_order = [
     "by-name",
 ]
@@ -188,7 +1112,133 @@ def find_packages() -> Dict[str, List[Dict[str, str]]]:
     return groups
 
 
-def build_markdown(groups: Dict[str, List[Dict[str, str]]]) -> str:
+def format_desc(info: Dict[str, Optional[str]]) -> str:
+    desc = info.get("description") or ""
+    homepage = info.get("homepage")
+    changelog = info.get("changelog")
+    if changelog:
+        desc = f"[📝Changelog]({changelog}) {desc}"
+    if homepage:
+        desc = f"[🏠Homepage]({homepage}) {desc}"
+    return desc
+
+
+def package_infos(
+    entry: Dict[str, str], result: Dict, system: Optional[str] = None
+) -> List[Tuple[str, Dict]]:
+    """Usable paths and metadata of the rows one package contributes."""
+    children = result.get("children") or []
+    if children:
+        return [
+            (f"{entry['usable_path']}.{child['name']}", child) for child in children
+        ]
+
+    meta = result.get("meta")
+    if meta is None:
+        where = f" on {system}" if system else ""
+        reason = "quarantined" if result.get("quarantined") else "eval error"
+        print(
+            f"Skip non-derivation or {reason} for {entry['file']}{where}: "
+            f"{result.get('error')}",
+            file=sys.stderr,
+        )
+        return []
+    return [(entry["usable_path"], meta)]
+
+
+def package_rows(
+    entry: Dict[str, str], result: Dict
+) -> List[Tuple[str, str, str, str]]:
+    return [
+        (usable, info.get("version") or "-", format_desc(info), entry["file"])
+        for usable, info in package_infos(entry, result)
+    ]
+
+
+def file_url(file_rel: str) -> str:
+    return f"https://github.com/{GITHUB_REPO}/blob/{DEFAULT_BRANCH}/{file_rel}"
+
+
+def table_header(systems: Sequence[str]) -> List[str]:
+    columns = ["version"] if len(systems) == 1 else list(systems)
+    columns = ["useable-path"] + columns + ["description"]
+    return [
+        "| " + " | ".join(columns) + " |",
+        "| " + " | ".join("---" for _ in columns) + " |",
+    ]
+
+
+def multi_system_rows(
+    entry: Dict[str, str], results: Dict[str, Dict[str, Dict]], systems: Sequence[str]
+) -> List[str]:
+    """Rows with one version column per system.
+
+    A cell reads "✗ unsupported" when the platform is excluded by meta,
+    "✗ missing" when the attribute does not exist on that system and
+    "⚠ eval error" when the package failed to evaluate there.
+    """
+    per_system: Dict[str, Dict[str, Dict]] = {}
+    order: List[str] = []
+    for system in systems:
+        infos = package_infos(entry, results[system].get(entry["file"], {}), system)
+        per_system[system] = dict(infos)
+        order.extend(usable for usable, _ in infos if usable not in order)
+
+    rows = []
+    for usable in order:
+        cells = []
+        desc = ""
+        for system in systems:
+            info = per_system[system].get(usable)
+            if info is None:
+                failed = not per_system[system]
+                cells.append("⚠ eval error" if failed else "✗ missing")
+                continue
+            if not desc:
+                desc = format_desc(info)
+            if info.get("available") is False:
+                cells.append("✗ unsupported")
+            else:
+                version = info.get("version") or "-"
+                cells.append(f"[{version}]({file_url(entry['file'])})")
+        rows.append(f"| `{usable}` | " + " | ".join(cells) + f" | {desc} |")
+    return rows
+
+
+def format_rows(
+    entry: Dict[str, str], results: Dict[str, Dict[str, Dict]], systems: Sequence[str]
+) -> List[str]:
+    if len(systems) > 1:
+        return multi_system_rows(entry, results, systems)
+    result = results[systems[0]].get(entry["file"], {})
+    return [format_row(*row) for row in package_rows(entry, result)]
+
+
+def format_row(usable: str, version: str, desc: str, file_rel: str) -> str:
+    return f"| `{usable}` | [{version}]({file_url(file_rel)}) | {desc} |"
+
+
+def build_markdown(
+    groups: Dict[str, List[Dict[str, str]]],
+    results: Optional[Dict[str, Dict[str, Dict]]] = None,
+    systems: Sequence[str] = (DEFAULT_SYSTEM,),
+) -> str:
+    if results is None:
+        results = evaluate_packages(groups, systems)
+    row_lines = {
+        e["file"]: format_rows(e, results, systems)
+        for entries in groups.values()
+        for e in entries
+    }
+    return render_markdown(groups, row_lines, systems)
+
+
+def render_markdown(
+    groups: Dict[str, List[Dict[str, str]]],
+    row_lines: Dict[str, List[str]],
+    systems: Sequence[str] = (DEFAULT_SYSTEM,),
+) -> str:
+    """Lay out the package tables from already formatted rows per package file."""
     lines: List[str] = []
     lines.append("This section is auto-generated. Do not edit manually.")
     lines.append("")
@@ -200,61 +1250,261 @@ def build_markdown(groups: Dict[str, List[Dict[str, str]]]) -> str:
     for group in ordered_groups:
         entries = sorted(groups[group], key=lambda x: x["usable_path"].lower())
 
-        rows: List[Tuple[str, str, str, str]] = []
+        rows: List[str] = []
         for e in entries:
-            file_rel = e["file"]
-            file_abs = REPO_ROOT / file_rel
-
-            children = nix_list_children(file_abs)
-            if children:
-                for child in children:
-                    usable = f"{e['usable_path']}.{child['name']}"
-                    version = child.get("version") or "-"
-                    desc = child.get("description") or ""
-                    homepage = child.get("homepage")
-                    changelog = child.get("changelog")
-                    if changelog:
-                        desc = f"[📝Changelog]({changelog}) {desc}"
-                    if homepage:
-                        desc = f"[🏠Homepage]({homepage}) {desc}"
-                    rows.append((usable, version, desc, file_rel))
-                continue
-
-            try:
-                meta = nix_eval_for_pkg(file_abs)
-            except Exception as exc:
-                print(
-                    f"Skip non-derivation or eval error for {file_rel}: {exc}",
-                    file=sys.stderr,
-                )
-                continue
-            version = meta.get("version") or "-"
-            desc = meta.get("description") or ""
-            homepage = meta.get("homepage")
-            changelog = meta.get("changelog")
-            if changelog:
-                desc = f"[📝Changelog]({changelog}) {desc}"
-            if homepage:
-                desc = f"[🏠Homepage]({homepage}) {desc}"
-            rows.append((e["usable_path"], version, desc, file_rel))
+            rows.extend(row_lines.get(e["file"], []))
 
         if not rows:
             continue
 
         lines.append(f"### {group}")
         lines.append("")
-        lines.append("| useable-path | version | description |")
-        lines.append("| --- | --- | --- |")
-        for usable, version, desc, file_rel in rows:
-            file_url = (
-                f"https://github.com/{GITHUB_REPO}/blob/{DEFAULT_BRANCH}/{file_rel}"
-            )
-            lines.append(f"| `{usable}` | [{version}]({file_url}) | {desc} |")
+        lines.extend(table_header(systems))
+        lines.extend(rows)
         lines.append("")
 
     return "\n".join(lines).rstrip() + "\n"
 
 
+INFO_FIELDS = ("version", "description", "homepage", "changelog")
+
+
+def index_entry(
+    entry: Dict[str, str], results: Dict[str, Dict[str, Dict]], systems: Sequence[str]
+) -> Dict:
+    """Index record of one package, from the first system's result."""
+    result = results[systems[0]].get(entry["file"], {})
+    meta = result.get("meta") or {}
+    item: Dict = {"usable_path": entry["usable_path"], "file": entry["file"]}
+    item.update({field: meta.get(field) for field in INFO_FIELDS})
+    item["children"] = [
+        {
+            "name": child["name"],
+            "usable_path": f"{entry['usable_path']}.{child['name']}",
+            **{field: child.get(field) for field in INFO_FIELDS},
+        }
+        for child in result.get("children") or []
+    ]
+    item["error"] = bool(result.get("error"))
+    if len(systems) > 1:
+        item["systems"] = {}
+        for system in systems:
+            r = results[system].get(entry["file"], {})
+            item["systems"][system] = {
+                "version": (r.get("meta") or {}).get("version"),
+                "available": (r.get("meta") or {}).get("available"),
+                "children": [c["name"] for c in r.get("children") or []],
+                "error": bool(r.get("error")),
+            }
+    return item
+
+
+def build_index(
+    groups: Dict[str, List[Dict[str, str]]],
+    results: Dict[str, Dict[str, Dict]],
+    systems: Sequence[str],
+    previous: Optional[Dict] = None,
+) -> Dict:
+    """Package index for every entry of `groups`, sorted by usable path.
+
+    Entries without a result are carried over from `previous`, so a partial
+    (`--since`) run still yields a complete index.
+    """
+    carried = {item["file"]: item for item in (previous or {}).get("packages", [])}
+    packages = []
+    for entries in groups.values():
+        for e in entries:
+            if any(e["file"] in results[s] for s in systems):
+                packages.append(index_entry(e, results, systems))
+            elif e["file"] in carried:
+                packages.append(carried[e["file"]])
+    packages.sort(key=lambda item: item["usable_path"])
+    return {"systems": list(systems), "packages": packages}
+
+
+def read_index(path: Path) -> Optional[Dict]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def read_index_sqlite(path: Path) -> Optional[Dict]:
+    """Rebuild the index written by `write_index_sqlite`, without per-system data."""
+    if not path.is_file():
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(
+                "SELECT usable_path, parent, file, version, description, homepage, "
+                "changelog, error FROM packages ORDER BY usable_path"
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    packages: Dict[str, Dict] = {}
+    children = []
+    for usable_path, parent, file_rel, *info, error in rows:
+        if parent is None:
+            packages[usable_path] = {
+                "usable_path": usable_path,
+                "file": file_rel,
+                **dict(zip(INFO_FIELDS, info)),
+                "children": [],
+                "error": bool(error),
+            }
+        else:
+            child = {
+                "name": usable_path[len(parent) + 1 :],
+                "usable_path": usable_path,
+                **dict(zip(INFO_FIELDS, info)),
+            }
+            children.append((parent, child))
+    for parent, child in children:
+        if parent in packages:
+            packages[parent]["children"].append(child)
+    return {"packages": list(packages.values())}
+
+
+def atomic_write(path: Path, data: bytes) -> None:
+    """Replace `path` with `data` so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_index_json(path: Path, index: Dict) -> None:
+    text = json.dumps(index, indent=2, sort_keys=True, ensure_ascii=False) + "\n"
+    atomic_write(path, text.encode("utf-8"))
+
+
+def write_index_sqlite(path: Path, index: Dict) -> None:
+    """Write the index as an SQLite database with one row per usable path.
+
+    Children get their own rows pointing at the package they belong to via
+    `parent`, so a lookup by attribute path is a single primary key query.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.")
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp)
+        with conn:
+            conn.execute(
+                "CREATE TABLE packages ("
+                "usable_path TEXT PRIMARY KEY, parent TEXT, file TEXT NOT NULL, "
+                "version TEXT, description TEXT, homepage TEXT, changelog TEXT, "
+                "error INTEGER NOT NULL)"
+            )
+            rows = []
+            for item in index["packages"]:
+                rows.append(
+                    (item["usable_path"], None, item["file"])
+                    + tuple(item.get(field) for field in INFO_FIELDS)
+                    + (int(item.get("error", False)),)
+                )
+                for child in item["children"]:
+                    rows.append(
+                        (child["usable_path"], item["usable_path"], item["file"])
+                        + tuple(child.get(field) for field in INFO_FIELDS)
+                        + (0,)
+                    )
+            conn.executemany(
+                "INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                sorted(rows, key=lambda row: row[0]),
+            )
+        conn.close()
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read_readme_rows(
+    systems: Sequence[str] = (DEFAULT_SYSTEM,),
+) -> Optional[Dict[str, List[str]]]:
+    """Existing table rows of the generated block, grouped by package file.
+
+    Returns None when README.md has no generated block to splice into, or
+    when its tables were rendered for a different set of systems.
+    """
+    text = README.read_text(encoding="utf-8")
+    if BEGIN_MARK not in text or END_MARK not in text:
+        return None
+    block = text.split(BEGIN_MARK, 1)[1].split(END_MARK, 1)[0]
+    if "\n| " in block and table_header(systems)[0] not in block:
+        return None
+    file_link = re.compile(
+        r"\]\(https://github\.com/"
+        + re.escape(f"{GITHUB_REPO}/blob/{DEFAULT_BRANCH}/")
+        + r"([^)]+)\)"
+    )
+    rows: Dict[str, List[str]] = {}
+    for line in block.splitlines():
+        if not line.startswith("| `"):
+            continue
+        match = file_link.search(line)
+        if match:
+            rows.setdefault(match.group(1), []).append(line)
+    return rows
+
+
+def git_changed_files(rev: str) -> List[str]:
+    """Files changed between `rev` and the working tree, plus untracked ones."""
+    changed: List[str] = []
+    for cmd in (
+        ["git", "diff", "--name-only", rev, "--"],
+        ["git", "ls-files", "--others", "--exclude-standard"],
+    ):
+        code, out, err = run(cmd, cwd=REPO_ROOT)
+        if code != 0:
+            raise RuntimeError(f"{' '.join(cmd)} failed: {err.strip()}")
+        changed.extend(line for line in out.splitlines() if line)
+    return changed
+
+
+def needs_full_run(changed: List[str]) -> bool:
+    return any(
+        path in FULL_RUN_FILES or path.startswith(FULL_RUN_DIRS) for path in changed
+    )
+
+
+def affected_packages(
+    groups: Dict[str, List[Dict[str, str]]], changed: List[str]
+) -> List[str]:
+    """Map changed paths onto package files by their deepest package directory.
+
+    A change inside `pkgs/<group>/<sub>/` belongs to that sub-package, anything
+    else under `pkgs/<group>/` to the group's own package if it has one.
+    """
+    dirs = {
+        os.path.dirname(e["file"]): e["file"]
+        for entries in groups.values()
+        for e in entries
+    }
+    affected = set()
+    for path in changed:
+        parent = os.path.dirname(path)
+        while parent:
+            if parent in dirs:
+                affected.add(dirs[parent])
+                break
+            parent = os.path.dirname(parent)
+    return sorted(affected)
+
+
 def update_readme(content: str) -> None:
     text = README.read_text(encoding="utf-8")
 
@@ -285,9 +1535,239 @@ def update_readme(content: str) -> None:
 
 
 def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Regenerate the package list section of README.md"
+    )
+    parser.add_argument(
+        "--no-batch",
+        action="store_true",
+        help="Evaluate packages one `nix eval` at a time instead of in one batch",
+    )
+    parser.add_argument(
+        "--system",
+        dest="systems",
+        action="append",
+        help="Nix system to evaluate for; repeat or separate with commas to "
+        "show one version column per system",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help="Number of `nix eval` processes to run concurrently",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help="Seconds before a single `nix eval` is killed (0 disables)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore and do not update the on-disk metadata cache and quarantine",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help="Directory of the metadata cache",
+    )
+    parser.add_argument(
+        "--cache-max-bytes",
+        type=int,
+        default=DEFAULT_CACHE_MAX_BYTES,
+        help="Evict least recently used cache entries beyond this size",
+    )
+    parser.add_argument(
+        "--no-quarantine",
+        action="store_true",
+        help="Retry packages that failed before instead of skipping them",
+    )
+    parser.add_argument(
+        "--quarantine-backoff",
+        type=float,
+        default=DEFAULT_QUARANTINE_BACKOFF,
+        help="Seconds a failed package is skipped; doubles with every failure",
+    )
+    parser.add_argument(
+        "--failure-report",
+        metavar="PATH",
+        type=Path,
+        help="Write the packages that failed to evaluate as JSON to PATH",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["eval", "repl"],
+        default="eval",
+        help="`eval` runs one `nix eval` per query, `repl` keeps `nix repl` sessions",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        type=Path,
+        help="Write a JSON trace of every nix query to PATH and print a summary",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        metavar="N",
+        help="Put at most N packages in each batched query instead of one chunk "
+        "per job; 1 lets --profile time every package, but costs one "
+        "evaluation per package",
+    )
+    parser.add_argument(
+        "--index",
+        metavar="PATH",
+        type=Path,
+        help="Also write a JSON index of the package metadata to PATH",
+    )
+    parser.add_argument(
+        "--index-sqlite",
+        metavar="PATH",
+        type=Path,
+        help="Also write the package index as an SQLite database to PATH",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Exit 1 if the package list is stale, without evaluating anything",
+    )
+    parser.add_argument(
+        "--since",
+        metavar="REV",
+        help="Only re-evaluate packages changed since REV and keep the other rows",
+    )
+    args = parser.parse_args()
+    systems = [
+        s for value in args.systems or [DEFAULT_SYSTEM] for s in value.split(",") if s
+    ]
+
     groups = find_packages()
-    md = build_markdown(groups)
-    update_readme(md)
+    fingerprint = tree_fingerprint(groups, systems)
+    if args.check:
+        if readme_fingerprint() == fingerprint:
+            print("README package list is up to date", file=sys.stderr)
+            return 0
+        print("README package list is stale, run scripts/readme.py", file=sys.stderr)
+        return 1
+
+    eval_groups = groups
+    existing_rows = None
+    if args.since:
+        changed = git_changed_files(args.since)
+        existing_rows = read_readme_rows(systems)
+        if existing_rows is None:
+            print(
+                "No matching package list in README.md, regenerating every row",
+                file=sys.stderr,
+            )
+        elif needs_full_run(changed):
+            print("Shared inputs changed, regenerating every row", file=sys.stderr)
+            existing_rows = None
+        else:
+            wanted = set(affected_packages(groups, changed))
+            wanted.update(
+                e["file"]
+                for entries in groups.values()
+                for e in entries
+                if e["file"] not in existing_rows
+            )
+            eval_groups = {
+                group: [e for e in entries if e["file"] in wanted]
+                for group, entries in groups.items()
+            }
+            print(
+                f"Re-evaluating {len(wanted)} changed package(s) since {args.since}",
+                file=sys.stderr,
+            )
+
+    # A partial run needs the previous index to carry the other packages over
+    previous_index = None
+    if existing_rows is not None and (args.index or args.index_sqlite):
+        if args.index:
+            previous_index = read_index(args.index)
+        else:
+            previous_index = read_index_sqlite(args.index_sqlite)
+        if previous_index is None:
+            print(
+                "No previous package index to update, regenerating every row",
+                file=sys.stderr,
+            )
+            existing_rows = None
+            eval_groups = groups
+
+    jobs = max(args.jobs, 1)
+    backend: EvalBackend = (
+        ReplBackend(jobs) if args.backend == "repl" else OneShotBackend()
+    )
+    if args.profile:
+        backend = ProfilingBackend(backend)
+    cache = (
+        None if args.no_cache else MetadataCache(args.cache_dir, args.cache_max_bytes)
+    )
+    quarantine = (
+        None
+        if args.no_cache or args.no_quarantine
+        else Quarantine(args.cache_dir / QUARANTINE_FILE, args.quarantine_backoff)
+    )
+    try:
+        results = evaluate_packages(
+            eval_groups,
+            systems=systems,
+            batch=not args.no_batch,
+            jobs=jobs,
+            timeout=args.timeout or None,
+            cache=cache,
+            backend=backend,
+            quarantine=quarantine,
+            batch_size=max(args.batch_size, 1) if args.batch_size else None,
+        )
+    finally:
+        backend.close()
+
+    failures = failure_report(results, quarantine)
+    print_failures(failures)
+    if args.failure_report:
+        args.failure_report.write_text(
+            json.dumps(failures, indent=2, ensure_ascii=False) + "\n",
+            encoding="utf-8",
+        )
+
+    if isinstance(backend, ProfilingBackend):
+        report = backend.report(cache)
+        args.profile.write_text(
+            json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8"
+        )
+        print_profile(report)
+
+    if existing_rows is None:
+        md = build_markdown(groups, results, systems)
+    else:
+        row_lines = dict(existing_rows)
+        for entries in eval_groups.values():
+            for e in entries:
+                row_lines[e["file"]] = format_rows(e, results, systems)
+        md = render_markdown(groups, row_lines, systems)
+    if any(item["transient"] for item in failures["failures"]):
+        # Evaluation errors follow from inputs the fingerprint already covers,
+        # but a timeout may pass next time: leave the list unstamped so
+        # --check keeps reporting it stale
+        print(
+            "Not stamping the package list fingerprint: some evaluations timed out",
+            file=sys.stderr,
+        )
+        update_readme(md)
+    else:
+        update_readme(f"<!-- package-list-fingerprint: {fingerprint} -->\n\n{md}")
+
+    if args.index or args.index_sqlite:
+        index = build_index(groups, results, systems, previous_index)
+        if args.index:
+            write_index_json(args.index, index)
+        if args.index_sqlite:
+            write_index_sqlite(args.index_sqlite, index)
     return 0
 
 
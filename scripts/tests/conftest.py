@@ -0,0 +1,61 @@
+"""Shared fixtures for the checks of scripts/ and the update scripts.
+
+The checks reuse the benchmark inputs: `stub-nix` stands in for `nix` and
+`FixtureServer` for GitHub and the FDM mirror, so they run offline with
+`python3 -m pytest scripts/tests`.
+"""
+
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent
+REPO_ROOT = SCRIPTS_DIR.parent
+BENCH_DIR = SCRIPTS_DIR / "bench"
+
+sys.path.insert(0, str(SCRIPTS_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+from fixtures import FixtureServer, make_package_tree  # noqa: E402
+
+
+def load_module(name: str, path: Path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def stub_nix(tmp_path, monkeypatch):
+    """Put `stub-nix` first on PATH as `nix`."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "nix").symlink_to(BENCH_DIR / "stub-nix")
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    return bin_dir
+
+
+@pytest.fixture
+def fixture_server():
+    with FixtureServer() as server:
+        yield server
+
+
+def make_readme(tree: Path):
+    """readme.py loaded against the package tree at `tree`."""
+    readme = load_module("readme", SCRIPTS_DIR / "readme.py")
+    readme.REPO_ROOT = tree
+    readme.PKGS_DIR = tree / "pkgs"
+    readme.README = tree / "README.md"
+    return readme
+
+
+@pytest.fixture
+def package_tree(tmp_path):
+    tree = tmp_path / "tree"
+    make_package_tree(tree, 5)
+    return tree
@@ -0,0 +1,93 @@
+"""13atm01-collection theme discovery from a blobless clone."""
+
+import subprocess
+
+from conftest import REPO_ROOT, load_module
+from update_utils.nar import git_missing_blobs
+
+UPDATE = REPO_ROOT / "pkgs/grub-themes/13atm01-collection/update.py"
+
+
+def git(*args, cwd=None) -> str:
+    return subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout
+
+
+def make_upstream(root):
+    """A repo laid out like GRUB-Theme, with images next to each theme.txt."""
+    themes = {
+        "Star Rail/Firefly/theme.txt": (
+            'desktop-image: "background.png"\n'
+            'menu_pixmap_style = "../common/menu_*.png"\n'
+        ),
+        "Star Rail/Firefly/background.png": "\x89PNG firefly",
+        "Genshin_Impact/Furina/theme.txt": 'title-font: "font.pf2"\n',
+        "Genshin_Impact/Furina/font.pf2": "PFF2",
+        "Star Rail/common/menu_c.png": "\x89PNG menu centre",
+        "Star Rail/common/menu_n.png": "\x89PNG menu north",
+        "README.md": "# GRUB themes\n",
+    }
+    for path, content in themes.items():
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text(content)
+    git("init", "-q", str(root))
+    git("add", "-A", cwd=root)
+    git("commit", "-qm", "themes", cwd=root)
+    git("config", "uploadpack.allowFilter", "true", cwd=root)
+    return root
+
+
+def test_blobless_clone_finds_the_same_themes(tmp_path):
+    update = load_module("atm01_update", UPDATE)
+    upstream = make_upstream(tmp_path / "upstream")
+
+    git_dir = update.clone_repo(tmp_path, f"file://{upstream}")
+    themes = update.themes_from_paths(update.list_tree(git_dir))
+
+    assert themes == update.find_themes(upstream)
+    assert themes == {
+        "star-rail": "Star Rail/Firefly",
+        "genshin-impact": "Genshin_Impact/Furina",
+    }
+    # Listing the tree must not have fetched any file contents
+    assert len(git_missing_blobs(git_dir, "HEAD")) == 7
+
+
+def test_manifests_list_theme_files_and_shared_assets(tmp_path, monkeypatch):
+    update = load_module("atm01_update", UPDATE)
+    fetch = update.git_fetch_objects
+    batches = []
+
+    def record_fetch(git_dir, oids):
+        # Still missing at this point means nothing was fetched lazily before
+        batches.append((len(oids), len(git_missing_blobs(git_dir, "HEAD"))))
+        fetch(git_dir, oids)
+
+    monkeypatch.setattr(update, "git_fetch_objects", record_fetch)
+    upstream = make_upstream(tmp_path / "upstream")
+    rev = git("rev-parse", "HEAD", cwd=upstream).strip()
+    git_dir = update.clone_repo(tmp_path, f"file://{upstream}")
+    themes = update.themes_from_paths(update.list_tree(git_dir))
+
+    manifests = update.build_manifests(update.GitTreeSource(git_dir), themes, rev)
+
+    firefly = manifests["star-rail"]
+    assert firefly["rev"] == rev
+    assert sorted(firefly["files"]) == ["background.png", "theme.txt"]
+    assert firefly["files"]["background.png"]["size"] == len("\x89PNG firefly".encode())
+    assert {path: a["ref"] for path, a in firefly["shared"].items()} == {
+        "Star Rail/common/menu_c.png": "../common/menu_*.png",
+        "Star Rail/common/menu_n.png": "../common/menu_*.png",
+    }
+    assert manifests["genshin-impact"]["shared"] == {}
+    # Sizes need the blobs: all of them arrive in one batch, none lazily
+    assert batches == [(7, 7)]
+    assert git_missing_blobs(git_dir, "HEAD") == []
+    # A checkout yields the same sizes and blob ids
+    checkout = update.build_manifests(update.DirectorySource(upstream), themes, rev)
+    assert checkout == manifests
@@ -0,0 +1,108 @@
+"""free-download-manager's .deb control parsing over HTTP Range requests."""
+
+import io
+import os
+import re
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conftest import REPO_ROOT, load_module
+
+UPDATE = REPO_ROOT / "pkgs/by-name/fr/free-download-manager/update_version.py"
+CONTROL = (
+    "Package: freedownloadmanager\n"
+    "Version: 6.24.2.6075\n"
+    "Installed-Size: 112233\n"
+    "Depends: libc6 (>= 2.34),\n"
+    " libgl1\n"
+    "Description: download manager\n"
+)
+
+
+def tar_xz(name: str, data: bytes) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:xz") as tar:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+def make_deb(payload: bytes) -> bytes:
+    """An ar archive laid out like a .deb, with `payload` in data.tar."""
+    members = [
+        ("debian-binary", b"2.0\n"),
+        ("control.tar.xz", tar_xz("./control", CONTROL.encode())),
+        ("data.tar.xz", tar_xz("./opt/payload", payload)),
+    ]
+    out = b"!<arch>\n"
+    for name, data in members:
+        header = f"{name + '/':<16}{0:<12}{0:<6}{0:<6}{'100644':<8}{len(data):<10}`\n"
+        out += header.encode("ascii") + data + b"\n" * (len(data) % 2)
+    return out
+
+
+class DebHandler(BaseHTTPRequestHandler):
+    """Serves `server.deb`, honouring Range unless `server.ranges` is off."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        deb = self.server.deb
+        match = re.match(r"bytes=(\d+)-(\d+)$", self.headers.get("Range", ""))
+        if self.server.ranges and match:
+            start, end = int(match.group(1)), int(match.group(2))
+            body = deb[start : end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(deb)}")
+        else:
+            body = deb
+            self.send_response(200)
+            # The client hangs up once it has read control.tar
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+            self.server.sent += len(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+@pytest.fixture
+def deb_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DebHandler)
+    # Incompressible, so the .deb is as large as the payload
+    server.deb = make_deb(os.urandom(1024 * 1024))
+    server.sent = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    server.url = f"http://{host}:{port}/freedownloadmanager_6.24.2.6075_amd64.deb"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("ranges", [True, False])
+def test_control_fields_from_leading_bytes(deb_server, ranges):
+    update = load_module("fdm_update_version", UPDATE)
+    deb_server.ranges = ranges
+
+    fields = update.fetch_control(deb_server.url)
+
+    assert fields == {
+        "Version": "6.24.2.6075",
+        "Installed-Size": "112233",
+        "Depends": "libc6 (>= 2.34), libgl1",
+    }
+    if ranges:
+        # One over-fetched range covers the ar headers and control.tar
+        assert deb_server.sent <= update.CHUNK_SIZE
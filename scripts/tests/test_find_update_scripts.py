@@ -0,0 +1,103 @@
+"""Fallback of scripts/update-packages/find-update-scripts.py on broken packages.
+
+`nix_eval` is replaced by an evaluator over a small attribute tree that
+mimics how `nix eval` fails as a whole when any visited attribute throws
+an error `tryEval` cannot catch.
+"""
+
+import json
+
+import pytest
+
+from conftest import SCRIPTS_DIR, load_module
+
+BROKEN = object()
+BROKEN_SCRIPT = object()
+
+
+def drv(script):
+    return {"derivation": True, "updateScript": script}
+
+
+TREE = {
+    "hello": drv(["nix-update"]),
+    "plain": {"derivation": True},
+    "broken-drv": BROKEN,
+    "grub-themes": {
+        "star-rail": drv({"command": ["python3", "update.py"]}),
+        "broken-script": drv(BROKEN_SCRIPT),
+    },
+}
+
+
+def node_at(path):
+    value = TREE
+    for name in path:
+        value = value[name]
+    return value
+
+
+def fake_nix_eval(module):
+    def visit(value, path):
+        if value is BROKEN:
+            raise RuntimeError(".".join(path))
+        if value.get("derivation"):
+            if "updateScript" not in value:
+                return []
+            if value["updateScript"] is BROKEN_SCRIPT:
+                raise RuntimeError(".".join(path))
+            script = json.dumps(value["updateScript"])
+            return [{"attr": ".".join(path), "updateScript": script}]
+        return [
+            item for name in sorted(value) for item in visit(value[name], path + [name])
+        ]
+
+    def nix_eval(repo, system, expr, roots):
+        try:
+            if expr == module.NODE_EXPR:
+                value = node_at(roots)
+                if value is BROKEN:
+                    return None
+                if value.get("derivation"):
+                    return {
+                        "derivation": True,
+                        "hasUpdateScript": "updateScript" in value,
+                    }
+                return {"derivation": False, "children": sorted(value)}
+            return [item for p in roots for item in visit(node_at(p), list(p))]
+        except RuntimeError:
+            return None
+
+    return nix_eval
+
+
+@pytest.fixture
+def finder(monkeypatch):
+    module = load_module(
+        "find_update_scripts",
+        SCRIPTS_DIR / "update-packages" / "find-update-scripts.py",
+    )
+    monkeypatch.setattr(module, "nix_eval", fake_nix_eval(module))
+    return module
+
+
+def test_broken_package_does_not_abort_discovery(finder, tmp_path, capsys):
+    entries = finder.evaluate(tmp_path, "x86_64-linux")
+
+    assert entries == [
+        {"attr": "grub-themes.broken-script", "updateScript": None},
+        {
+            "attr": "grub-themes.star-rail",
+            "updateScript": {"command": ["python3", "update.py"]},
+        },
+        {"attr": "hello", "updateScript": ["nix-update"]},
+    ]
+    err = capsys.readouterr().err
+    assert "broken-drv" in err
+    assert "grub-themes.broken-script" in err
+
+
+def test_unevaluable_legacy_packages_still_fails(finder, monkeypatch, tmp_path):
+    monkeypatch.setattr(finder, "nix_eval", lambda *args: None)
+    with pytest.raises(SystemExit):
+        finder.evaluate(tmp_path, "x86_64-linux")
@@ -0,0 +1,80 @@
+"""update_utils.hashing's download cache against a local server."""
+
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from update_utils.hashing import Digest, DownloadCache, fetch_digest
+
+
+class AssetHandler(BaseHTTPRequestHandler):
+    """Serves `server.body` with an ETag derived from it."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, send_body: bool) -> None:
+        self.server.methods.append(self.command)
+        body = self.server.body
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self.respond(True)
+
+    def do_HEAD(self):
+        self.respond(False)
+
+
+@pytest.fixture
+def asset_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), AssetHandler)
+    server.body = b"first release\n"
+    server.methods = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    server.url = f"http://{host}:{port}/theme.tar.gz"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def digest_of(body: bytes) -> Digest:
+    return Digest.from_bytes(hashlib.sha256(body).digest())
+
+
+def test_unchanged_download_is_revalidated(asset_server, tmp_path):
+    cache = DownloadCache(tmp_path / "downloads")
+    first = fetch_digest(asset_server.url, cache=cache)
+    second = fetch_digest(asset_server.url, cache=cache)
+
+    assert first == second == digest_of(b"first release\n")
+    assert asset_server.methods == ["GET", "HEAD"]
+
+
+def test_changed_download_is_hashed_again(asset_server, tmp_path):
+    cache = DownloadCache(tmp_path / "downloads")
+    fetch_digest(asset_server.url, cache=cache)
+    asset_server.body = b"asset replaced in place\n"
+
+    assert fetch_digest(asset_server.url, cache=cache) == digest_of(
+        b"asset replaced in place\n"
+    )
+    assert asset_server.methods == ["GET", "HEAD", "GET"]
+    # The index now points at the new file
+    assert cache.lookup(asset_server.url) == digest_of(b"asset replaced in place\n")
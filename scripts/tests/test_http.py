@@ -0,0 +1,67 @@
+"""update_utils.http against a local server."""
+
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from update_utils import http as http_client
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    """Answers the first request with 429 and `Retry-After`, then 200."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.hits += 1
+        if self.server.hits == 1:
+            self.send_response(429)
+            self.send_header("Retry-After", self.server.retry_after)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def throttling_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottlingHandler)
+    server.hits = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("form", ["seconds", "http-date"])
+def test_retry_after_is_honoured(throttling_server, monkeypatch, form):
+    if form == "seconds":
+        throttling_server.retry_after = "7"
+    else:
+        throttling_server.retry_after = formatdate(time.time() + 30, usegmt=True)
+    sleeps = []
+    monkeypatch.setattr(http_client.time, "sleep", sleeps.append)
+    host, port = throttling_server.server_address[:2]
+
+    # A backoff this small would never be mistaken for the server's delay
+    with http_client.HttpClient(backoff=0.001) as client:
+        response = client.get(f"http://{host}:{port}/", cache=False)
+
+    assert response.status_code == 200
+    assert throttling_server.hits == 2
+    assert len(sleeps) == 1
+    if form == "seconds":
+        assert sleeps[0] == 7
+    else:
+        assert 25 < sleeps[0] <= 30
@@ -0,0 +1,97 @@
+"""NAR hashes of update_utils.nar against known Nix output."""
+
+import shutil
+import subprocess
+
+import pytest
+
+from update_utils.nar import git_missing_blobs, nar_hash_git, nar_hash_path
+
+# `nix hash path` of an empty directory
+EMPTY_DIR_HASH = "sha256-pQpattmS9VmO3ZIQUFn66az8GSmB4IvYhTTCFn6SUmo="
+# `nix hash path` of the tree built by make_fixture(); test_agrees_with_nix
+# rechecks it wherever nix is installed
+FIXTURE_HASH = "sha256-kx/MHVONe90wzkUrI1Wjn6jjGg48IOLWM66HuUqFBnQ="
+
+
+def make_fixture(root):
+    """An executable, a symlink and a nested directory."""
+    (root / "bin").mkdir(parents=True)
+    run = root / "bin" / "run"
+    run.write_text("#!/bin/sh\necho hello\n")
+    run.chmod(0o755)
+    (root / "data" / "nested").mkdir(parents=True)
+    (root / "data" / "nested" / "file.txt").write_text("hello\n")
+    (root / "link").symlink_to("data/nested/file.txt")
+    return root
+
+
+def test_empty_directory(tmp_path):
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    assert nar_hash_path(empty).sri == EMPTY_DIR_HASH
+
+
+def test_fixture_tree(tmp_path):
+    assert nar_hash_path(make_fixture(tmp_path / "tree")).sri == FIXTURE_HASH
+
+
+def test_git_tree_matches_checkout(tmp_path):
+    work = make_fixture(tmp_path / "repo")
+
+    def git(*args):
+        subprocess.run(
+            ["git", "-C", str(work), *args], check=True, stdout=subprocess.DEVNULL
+        )
+
+    git("init", "-q")
+    git("add", "-A")
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", "fixture")
+    assert nar_hash_git(work / ".git").sri == FIXTURE_HASH
+
+
+def test_blobless_clone_matches_checkout(tmp_path):
+    upstream = make_fixture(tmp_path / "upstream")
+
+    def git(*args, cwd=upstream):
+        subprocess.run(
+            ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+            cwd=cwd,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    git("init", "-q")
+    git("config", "uploadpack.allowFilter", "true")
+    git("add", "-A")
+    git("commit", "-qm", "fixture")
+    # A later commit, so hashing an older revision is covered too
+    (upstream / "data" / "nested" / "file.txt").write_text("changed\n")
+    (upstream / "bin" / "run").chmod(0o644)
+    git("commit", "-qam", "change")
+
+    clone = tmp_path / "clone"
+    url = f"file://{upstream}"
+    git("clone", "-q", "--filter=blob:none", "--no-checkout", url, str(clone), cwd=None)
+    assert git_missing_blobs(clone / ".git", "HEAD")
+    checkout = tmp_path / "checkout"
+    git("clone", "-q", url, str(checkout), cwd=None)
+    shutil.rmtree(checkout / ".git")
+
+    assert nar_hash_git(clone / ".git").sri == nar_hash_path(checkout).sri
+    assert nar_hash_git(clone / ".git", "HEAD~1").sri == FIXTURE_HASH
+    assert git_missing_blobs(clone / ".git", "HEAD") == []
+
+
+@pytest.mark.skipif(shutil.which("nix") is None, reason="nix is not installed")
+def test_agrees_with_nix(tmp_path):
+    tree = make_fixture(tmp_path / "tree")
+    result = subprocess.run(
+        ["nix", "--extra-experimental-features", "nix-command", "hash", "path"]
+        + [str(tree)],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    assert result.stdout.strip() == nar_hash_path(tree).sri
@@ -0,0 +1,304 @@
+"""scripts/readme.py against a synthetic tree and the stub nix."""
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+from conftest import make_readme
+
+
+def run_main(readme, monkeypatch, *args) -> int:
+    monkeypatch.setattr(sys, "argv", ["readme.py", *args])
+    return readme.main()
+
+
+def commit_tree(tree) -> None:
+    git = ["git", "-c", "user.name=bench", "-c", "user.email=bench@localhost"]
+    subprocess.run(git + ["init", "-q"], cwd=tree, check=True)
+    subprocess.run(git + ["add", "-A"], cwd=tree, check=True)
+    subprocess.run(git + ["commit", "-qm", "init"], cwd=tree, check=True)
+
+
+def test_fingerprint_stamped_after_evaluation_errors(
+    package_tree, stub_nix, monkeypatch, tmp_path
+):
+    readme = make_readme(package_tree)
+    cache = ["--cache-dir", str(tmp_path / "cache")]
+
+    # The error follows from inputs the fingerprint covers: no need to rerun
+    monkeypatch.setenv("BENCH_NIX_FAIL", "bench-00002")
+    assert run_main(readme, monkeypatch, *cache) == 0
+    assert run_main(readme, monkeypatch, "--check") == 0
+
+    # Quarantine hits are stamped as well
+    monkeypatch.delenv("BENCH_NIX_FAIL")
+    assert run_main(readme, monkeypatch, *cache) == 0
+    assert run_main(readme, monkeypatch, "--check") == 0
+
+
+def test_fingerprint_not_stamped_after_timeouts(
+    package_tree, stub_nix, monkeypatch, tmp_path, capsys
+):
+    readme = make_readme(package_tree)
+    cache = ["--cache-dir", str(tmp_path / "cache")]
+    slow = ["--no-batch", "--jobs", "5", "--timeout", "0.5"]
+
+    monkeypatch.setenv("BENCH_NIX_DELAY", "5")
+    assert run_main(readme, monkeypatch, *cache, *slow) == 0
+    assert "some evaluations timed out" in capsys.readouterr().err
+    assert readme.readme_fingerprint() is None
+    assert run_main(readme, monkeypatch, "--check") == 1
+
+    # A quarantined timeout still leaves the list unstamped
+    monkeypatch.delenv("BENCH_NIX_DELAY")
+    assert run_main(readme, monkeypatch, *cache) == 0
+    assert run_main(readme, monkeypatch, "--check") == 1
+
+    assert run_main(readme, monkeypatch, *cache, "--no-quarantine") == 0
+    assert "bench-00002" in readme.README.read_text(encoding="utf-8")
+    assert run_main(readme, monkeypatch, "--check") == 0
+
+
+def test_timed_out_packages_fail_and_are_not_cached(
+    package_tree, stub_nix, monkeypatch, tmp_path
+):
+    readme = make_readme(package_tree)
+    cache_dir = tmp_path / "cache"
+    report = tmp_path / "failures.json"
+    monkeypatch.setenv("BENCH_NIX_DELAY", "30")
+    args = ["--no-batch", "--jobs", "5", "--timeout", "0.5"]
+    args += ["--cache-dir", str(cache_dir), "--failure-report", str(report)]
+
+    started = time.monotonic()
+    assert run_main(readme, monkeypatch, *args) == 0
+    # The stuck evaluations were killed rather than waited for
+    assert time.monotonic() - started < 10
+
+    failures = json.loads(report.read_text(encoding="utf-8"))["failures"]
+    assert len(failures) == 5
+    assert all("timed out after 0.5s" in item["error"] for item in failures)
+    assert list(cache_dir.glob("*.json")) == []
+
+
+def test_jobs_fan_out(package_tree, stub_nix, monkeypatch, tmp_path):
+    readme = make_readme(package_tree)
+    log = tmp_path / "nix.log"
+    monkeypatch.setenv("BENCH_NIX_LOG", str(log))
+
+    # Batched mode splits the packages into one chunk per job
+    assert run_main(readme, monkeypatch, "--no-cache", "--jobs", "2") == 0
+    assert log.read_text().splitlines() == ["eval", "eval"]
+
+    # Per-package mode runs the queries side by side
+    log.unlink()
+    monkeypatch.setenv("BENCH_NIX_DELAY", "1")
+    started = time.monotonic()
+    assert run_main(readme, monkeypatch, "--no-cache", "--no-batch", "-j", "5") == 0
+    elapsed = time.monotonic() - started
+    # A children and a meta query per package: 10s one after the other
+    assert log.read_text().splitlines() == ["eval"] * 10
+    assert elapsed < 5
+
+
+def test_cache_prune_evicts_least_recently_used(tmp_path):
+    readme = make_readme(tmp_path)
+    cache = readme.MetadataCache(tmp_path / "cache")
+    for i in range(5):
+        cache.put(f"key{i}", {"meta": {"pname": f"bench-{i:05d}"}})
+        # Oldest first, a minute apart
+        os.utime(cache.root / f"key{i}.json", (1000 + 60 * i,) * 2)
+    size = (cache.root / "key0.json").stat().st_size
+    assert cache.get("key0") is not None
+
+    cache.max_bytes = 2 * size
+    cache.prune()
+
+    kept = sorted(path.stem for path in cache.root.glob("*.json"))
+    assert kept == ["key0", "key4"]
+
+
+def test_cache_stays_within_its_limit(package_tree, stub_nix, monkeypatch, tmp_path):
+    readme = make_readme(package_tree)
+    cache_dir = tmp_path / "cache"
+    args = ["--cache-dir", str(cache_dir), "--cache-max-bytes", "600"]
+    assert run_main(readme, monkeypatch, *args) == 0
+
+    entries = list(cache_dir.glob("*.json"))
+    assert 0 < len(entries) < 5
+    assert sum(path.stat().st_size for path in entries) <= 600
+
+
+def test_since_keeps_rows_of_sqlite_only_index(
+    package_tree, stub_nix, monkeypatch, tmp_path, capsys
+):
+    readme = make_readme(package_tree)
+    db = tmp_path / "index.sqlite"
+    commit_tree(package_tree)
+    assert run_main(readme, monkeypatch, "--no-cache", "--index-sqlite", str(db)) == 0
+
+    package = package_tree / "pkgs" / "by-name" / "be" / "bench-00001" / "package.nix"
+    package.write_text(package.read_text() + "\n", encoding="utf-8")
+    args = ["--no-cache", "--since", "HEAD", "--index-sqlite", str(db)]
+    assert run_main(readme, monkeypatch, *args) == 0
+    assert "Re-evaluating 1 changed package(s)" in capsys.readouterr().err
+
+    conn = sqlite3.connect(db)
+    count = conn.execute("SELECT COUNT(*) FROM packages").fetchone()[0]
+    conn.close()
+    assert count == 5
+
+
+def test_since_without_previous_index_regenerates_everything(
+    package_tree, stub_nix, monkeypatch, tmp_path, capsys
+):
+    readme = make_readme(package_tree)
+    commit_tree(package_tree)
+    assert run_main(readme, monkeypatch, "--no-cache") == 0
+
+    db = tmp_path / "index.sqlite"
+    args = ["--no-cache", "--since", "HEAD", "--index-sqlite", str(db)]
+    assert run_main(readme, monkeypatch, *args) == 0
+    assert "No previous package index" in capsys.readouterr().err
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT COUNT(*) FROM packages").fetchone()[0] == 5
+    conn.close()
+
+
+def test_profile_keeps_batches_and_lists_their_files(
+    package_tree, stub_nix, monkeypatch, tmp_path
+):
+    readme = make_readme(package_tree)
+    profile = tmp_path / "profile.json"
+    args = ["--no-cache", "--jobs", "1", "--profile", str(profile)]
+    assert run_main(readme, monkeypatch, *args) == 0
+
+    report = json.loads(profile.read_text(encoding="utf-8"))
+    # Profiling must not change how packages are evaluated
+    assert [call["query"] for call in report["calls"]] == ["batch"]
+    assert sorted(report["calls"][0]["files"]) == [
+        f"pkgs/by-name/be/bench-{i:05d}/package.nix" for i in range(5)
+    ]
+
+
+def test_batch_size_one_names_packages_in_profile(
+    package_tree, stub_nix, monkeypatch, tmp_path
+):
+    readme = make_readme(package_tree)
+    profile = tmp_path / "profile.json"
+    args = ["--no-cache", "--batch-size", "1", "--profile", str(profile)]
+    assert run_main(readme, monkeypatch, *args) == 0
+
+    report = json.loads(profile.read_text(encoding="utf-8"))
+    slowest = {item["package"] for item in report["summary"]["slowest"]}
+    assert slowest == {f"pkgs/by-name/be/bench-{i:05d}/package.nix" for i in range(5)}
+    assert {call["query"] for call in report["calls"]} == {"entry"}
+
+
+def test_several_systems_share_one_evaluation(
+    package_tree, stub_nix, monkeypatch, tmp_path
+):
+    readme = make_readme(package_tree)
+    log = tmp_path / "nix.log"
+    monkeypatch.setenv("BENCH_NIX_LOG", str(log))
+    monkeypatch.setenv("BENCH_NIX_UNSUPPORTED", "aarch64-linux:bench-00001")
+    args = ["--no-cache", "--system", "x86_64-linux,aarch64-linux"]
+    assert run_main(readme, monkeypatch, *args) == 0
+
+    text = readme.README.read_text(encoding="utf-8")
+    assert "| useable-path | x86_64-linux | aarch64-linux | description |" in text
+    row = next(line for line in text.splitlines() if "`bench-00001`" in line)
+    assert row.split(" | ")[1:3] == [
+        f"[1.0]({readme.file_url('pkgs/by-name/be/bench-00001/package.nix')})",
+        "✗ unsupported",
+    ]
+    # Both systems come out of the same queries
+    queries = log.read_text().splitlines()
+    assert queries.count("repl-query") + queries.count("eval") == 1
+
+
+def test_untracked_files_do_not_change_the_fingerprint(
+    package_tree, stub_nix, monkeypatch, tmp_path
+):
+    readme = make_readme(package_tree)
+    commit_tree(package_tree)
+    assert run_main(readme, monkeypatch, "--cache-dir", str(tmp_path / "c")) == 0
+    assert run_main(readme, monkeypatch, "--check") == 0
+
+    # What tests and update runs leave behind inside package directories
+    package_dir = package_tree / "pkgs" / "by-name" / "be" / "bench-00001"
+    (package_dir / "__pycache__").mkdir()
+    (package_dir / "__pycache__" / "update.cpython-311.pyc").write_bytes(b"\0")
+    (package_dir / "cache").mkdir()
+    (package_dir / "cache" / "state.json").write_text("{}", encoding="utf-8")
+    assert run_main(readme, monkeypatch, "--check") == 0
+
+    # Tracked content still counts, committed or not
+    package = package_dir / "package.nix"
+    package.write_text(package.read_text() + "\n", encoding="utf-8")
+    assert run_main(readme, monkeypatch, "--check") == 1
+
+
+def repl_files(readme):
+    return [e["file"] for entries in readme.find_packages().values() for e in entries]
+
+
+def test_repl_backend_batches_on_one_session(
+    package_tree, stub_nix, monkeypatch, tmp_path
+):
+    readme = make_readme(package_tree)
+    log = tmp_path / "nix.log"
+    monkeypatch.setenv("BENCH_NIX_LOG", str(log))
+    backend = readme.ReplBackend(1)
+    systems = ("x86_64-linux", "aarch64-linux")
+    try:
+        results = readme.evaluate_files(
+            repl_files(readme), systems, jobs=1, backend=backend
+        )
+    finally:
+        backend.close()
+
+    assert all(r["meta"] for by_file in results.values() for r in by_file.values())
+    assert log.read_text().splitlines() == ["repl", "repl-query"]
+
+
+def test_repl_backend_falls_back_on_the_same_session(
+    package_tree, stub_nix, monkeypatch, tmp_path
+):
+    readme = make_readme(package_tree)
+    log = tmp_path / "nix.log"
+    monkeypatch.setenv("BENCH_NIX_LOG", str(log))
+    monkeypatch.setenv("BENCH_NIX_BATCH_DELAY", "30")
+    backend = readme.ReplBackend(1)
+    try:
+        results = readme.evaluate_files(
+            repl_files(readme), jobs=1, timeout=0.5, backend=backend
+        )
+    finally:
+        backend.close()
+
+    by_file = results[readme.DEFAULT_SYSTEM]
+    assert len(by_file) == 5
+    assert all(r["meta"] and not r["error"] for r in by_file.values())
+    # The timed-out batch was interrupted, not killed: no second session
+    queries = log.read_text().splitlines()
+    assert queries.count("repl") == backend.started == 1
+    assert queries.count("repl-query") == 1 + 2 * 5
+
+
+def test_repl_backend_restarts_a_dead_session(
+    package_tree, stub_nix, monkeypatch, tmp_path
+):
+    readme = make_readme(package_tree)
+    backend = readme.ReplBackend(1)
+    package = package_tree / repl_files(readme)[0]
+    try:
+        assert readme.nix_eval_for_pkg(package, backend=backend)["pname"]
+        backend.sessions[0].proc.kill()
+        backend.sessions[0].proc.wait()
+        assert readme.nix_eval_for_pkg(package, backend=backend)["pname"]
+    finally:
+        backend.close()
+    assert backend.started == 2
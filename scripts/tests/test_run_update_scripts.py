@@ -0,0 +1,144 @@
+"""run-update-scripts.py against a throwaway repo and a fake execute script."""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import SCRIPTS_DIR, load_module
+
+RUNNER = SCRIPTS_DIR / "update-packages" / "run-update-scripts.py"
+
+# Stands in for execute-update-script.sh: what it does depends on the package
+FAKE_EXECUTE = """\
+set -eu
+echo "worktree=$PWD" > "$FAKE_STATE/$1.pwd"
+case "$1" in
+  bump-*)
+    printf '%s\\n' "$1" > version.txt
+    echo has_update=true >> "$GITHUB_OUTPUT"
+    ;;
+  same)
+    echo has_update=false >> "$GITHUB_OUTPUT"
+    ;;
+  defer)
+    exit 75
+    ;;
+  hang)
+    sleep 300 &
+    echo $! > "$FAKE_STATE/hang.child"
+    sleep 300
+    ;;
+esac
+"""
+
+
+def git(repo, *args) -> str:
+    return subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t", "-C", str(repo), *args],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout
+
+
+def alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # A zombie still answers until its parent reaps it
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(")")[-1].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+class Runner:
+    """The orchestrator pointed at `repo`, with the fake execute script."""
+
+    def __init__(self, tmp_path, monkeypatch):
+        self.repo = tmp_path / "repo"
+        self.repo.mkdir()
+        (self.repo / "version.txt").write_text("1.0\n")
+        git(self.repo, "init", "-q")
+        git(self.repo, "add", "-A")
+        git(self.repo, "commit", "-qm", "init")
+        self.state = tmp_path / "state"
+        self.state.mkdir()
+        monkeypatch.setenv("FAKE_STATE", str(self.state))
+        fake = tmp_path / "execute-update-script.sh"
+        fake.write_text(FAKE_EXECUTE)
+
+        self.module = load_module("run_update_scripts", RUNNER)
+        self.module.REPO_ROOT = self.repo
+        self.module.EXECUTE_SCRIPT = fake
+        self.options = ["--output-dir", str(tmp_path / "out")]
+        self.options += ["--cache-dir", str(tmp_path / "cache")]
+        self.monkeypatch = monkeypatch
+
+    def run(self, *args) -> int:
+        argv = ["run-update-scripts.py", *self.options, *args]
+        self.monkeypatch.setattr(sys, "argv", argv)
+        return self.module.main()
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    return Runner(tmp_path, monkeypatch)
+
+
+def test_statuses_worktrees_and_timeout(runner, tmp_path):
+    summary = tmp_path / "summary.json"
+    started = time.monotonic()
+    code = runner.run(
+        "-j", "4", "--timeout", "2", "--summary", str(summary),
+        "bump-a", "same", "defer", "hang",
+    )  # fmt: skip
+    assert time.monotonic() - started < 30
+    assert code == 1
+
+    results = json.loads(summary.read_text())["results"]
+    assert {r["package"]: r["status"] for r in results} == {
+        "bump-a": "updated",
+        "same": "unchanged",
+        "defer": "deferred",
+        "hang": "timeout",
+    }
+    assert {r["package"]: r["returncode"] for r in results}["defer"] == 75
+
+    # Each package ran in its own worktree, and every one was removed
+    worktrees = {
+        p: (runner.state / f"{p}.pwd").read_text().strip().split("=", 1)[1]
+        for p in ("bump-a", "same", "defer", "hang")
+    }
+    assert len(set(worktrees.values())) == 4
+    assert str(runner.repo) not in worktrees.values()
+    assert not any(os.path.exists(path) for path in worktrees.values())
+    assert git(runner.repo, "worktree", "list", "--porcelain").count("worktree ") == 1
+
+    # The timeout took down the whole process group, not just bash
+    child = int((runner.state / "hang.child").read_text())
+    assert not alive(child)
+
+    # Without --apply the patch is only saved
+    patch = next(r["patch"] for r in results if r["package"] == "bump-a")
+    assert "+bump-a" in open(patch).read()
+    assert (runner.repo / "version.txt").read_text() == "1.0\n"
+
+
+def test_apply_reports_conflicting_patches(runner, capsys):
+    assert runner.run("-j", "2", "--apply", "bump-a", "bump-b") == 1
+
+    # bump-a applies first; bump-b touches the same line and conflicts
+    assert "bump-a" in (runner.repo / "version.txt").read_text()
+    assert "补丁无法应用: bump-b" in capsys.readouterr().err
+
+
+def test_apply_clean_patch(runner):
+    assert runner.run("--apply", "bump-a", "same") == 0
+    assert (runner.repo / "version.txt").read_text() == "bump-a\n"
@@ -0,0 +1,282 @@
+"""pkgs/grub-themes/star-rail/update.py against the fixture server."""
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from urllib.parse import parse_qs
+
+import pytest
+
+from conftest import REPO_ROOT, FixtureServer
+from fixtures import FixtureHandler
+
+UPDATE = REPO_ROOT / "pkgs" / "grub-themes" / "star-rail" / "update.py"
+DEFERRED_EXIT_CODE = 75
+
+
+def run_update(api: str, work, *args, token=None) -> subprocess.CompletedProcess:
+    env = dict(os.environ, GITHUB_API_URL=api, GITHUB_GRAPHQL_URL=f"{api}/graphql")
+    env.pop("GITHUB_TOKEN", None)
+    if token:
+        env["GITHUB_TOKEN"] = token
+    env.pop("UPDATE_TRACE_DIR", None)
+    return subprocess.run(
+        [
+            sys.executable,
+            str(UPDATE),
+            "--output",
+            str(work / "themes.json"),
+            "--state",
+            str(work / "state.json"),
+            "--http-cache",
+            str(work / "http"),
+            "--no-download-cache",
+            *args,
+        ],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+
+
+class RateLimitedHandler(FixtureHandler):
+    """Refuses release lookups with an exhausted rate limit until `reset`."""
+
+    def do_GET(self):
+        if "/releases" in self.path and time.time() < self.server.reset:
+            self.server.count_request()
+            body = b'{"message": "API rate limit exceeded"}'
+            self.send_response(403)
+            self.send_header("X-RateLimit-Remaining", "0")
+            self.send_header("X-RateLimit-Reset", str(int(self.server.reset)))
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        super().do_GET()
+
+
+@pytest.fixture
+def limited_server():
+    server = FixtureServer()
+    server.RequestHandlerClass = RateLimitedHandler
+    with server:
+        yield server
+
+
+def test_exhausted_rate_limit_defers(limited_server, tmp_path):
+    limited_server.reset = time.time() + 3600
+    proc = run_update(f"{limited_server.url}/gh/3", tmp_path, "--max-wait", "5")
+    assert proc.returncode == DEFERRED_EXIT_CODE, proc.stdout
+    assert "Deferring update" in proc.stdout
+    assert not (tmp_path / "themes.json").exists()
+
+
+def test_rate_limit_resetting_within_max_wait_is_awaited(limited_server, tmp_path):
+    # GitHub announces resets in whole seconds
+    limited_server.reset = int(time.time()) + 2
+    proc = run_update(f"{limited_server.url}/gh/3", tmp_path, "--max-wait", "30")
+    assert proc.returncode == 0, proc.stdout
+    themes = json.loads((tmp_path / "themes.json").read_text(encoding="utf-8"))
+    assert len(themes) == 3
+
+
+def test_caches_follow_update_cache_dir(fixture_server, tmp_path, monkeypatch):
+    shared = tmp_path / "shared"
+    monkeypatch.setenv("UPDATE_CACHE_DIR", str(shared))
+    env = dict(os.environ, GITHUB_API_URL=f"{fixture_server.url}/gh/3")
+    env.pop("GITHUB_TOKEN", None)
+    proc = subprocess.run(
+        [sys.executable, str(UPDATE), "--output", str(tmp_path / "themes.json")],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    assert proc.returncode == 0, proc.stdout
+    assert (shared / "star-rail" / "release-state.json").is_file()
+    # The asset without an API digest was downloaded into the shared cache
+    assert any((shared / "downloads" / "sha256").iterdir())
+
+
+def test_second_run_revalidates_with_etag(fixture_server, tmp_path):
+    api = f"{fixture_server.url}/gh/3"
+    assert run_update(api, tmp_path).returncode == 0
+    state = json.loads((tmp_path / "state.json").read_text(encoding="utf-8"))
+    assert any(entry.get("etag") for entry in state.values())
+
+    proc = run_update(api, tmp_path)
+    assert proc.returncode == 0, proc.stdout
+    assert "not modified since last run" in proc.stdout
+
+
+def test_graphql_pages_match_rest(fixture_server, tmp_path):
+    # 150 assets take two GraphQL pages
+    api = f"{fixture_server.url}/gh/150"
+    rest, graphql = tmp_path / "rest", tmp_path / "graphql"
+    rest.mkdir()
+    graphql.mkdir()
+    assert run_update(api, rest, "--full").returncode == 0
+
+    before = fixture_server.requests
+    proc = run_update(api, graphql, "--full", "--graphql", token="fixture")
+    assert proc.returncode == 0, proc.stdout
+    assert "via GraphQL" in proc.stdout
+    # Two POSTs plus one download per asset without an API digest
+    assert fixture_server.requests - before == 2 + 15
+
+    themes = json.loads((graphql / "themes.json").read_text(encoding="utf-8"))
+    assert len(themes) == 150
+    assert themes == json.loads((rest / "themes.json").read_text(encoding="utf-8"))
+
+
+class FailingAssetHandler(FixtureHandler):
+    """Answers downloads of the assets in `server.broken` with HTTP 500."""
+
+    def do_GET(self):
+        if any(self.path.endswith(f"/assets/{i}") for i in self.server.broken):
+            self.server.count_request()
+            self.send_error(500)
+            return
+        super().do_GET()
+
+
+@pytest.fixture
+def flaky_server():
+    server = FixtureServer()
+    server.RequestHandlerClass = FailingAssetHandler
+    server.broken = set()
+    with server:
+        yield server
+
+
+def test_etag_not_saved_when_an_asset_is_skipped(flaky_server, tmp_path):
+    api = f"{flaky_server.url}/gh/3"
+    # Asset 0 has no API digest and must be downloaded
+    flaky_server.broken = {0}
+    proc = run_update(api, tmp_path, "--retries", "1")
+    assert proc.returncode == 0, proc.stdout
+    themes = json.loads((tmp_path / "themes.json").read_text(encoding="utf-8"))
+    assert "theme_00000" not in themes
+    assert json.loads((tmp_path / "state.json").read_text(encoding="utf-8")) == {}
+
+    # No 304 on the next run: the skipped theme is picked up again
+    flaky_server.broken = set()
+    proc = run_update(api, tmp_path, "--retries", "1")
+    assert proc.returncode == 0, proc.stdout
+    assert "not modified" not in proc.stdout
+    themes = json.loads((tmp_path / "themes.json").read_text(encoding="utf-8"))
+    assert "theme_00000" in themes
+
+
+def test_api_digest_wins_over_recorded_sha256(fixture_server, tmp_path):
+    api = f"{fixture_server.url}/gh/3"
+    assert run_update(api, tmp_path).returncode == 0
+    themes_path = tmp_path / "themes.json"
+    fresh = json.loads(themes_path.read_text(encoding="utf-8"))
+
+    # As if theme_00001 had been re-uploaded under the same tag and url
+    stale = json.loads(themes_path.read_text(encoding="utf-8"))
+    stale["theme_00001"]["sha256"] = "0" * 64
+    themes_path.write_text(json.dumps(stale), encoding="utf-8")
+    (tmp_path / "state.json").unlink()
+
+    proc = run_update(api, tmp_path)
+    assert proc.returncode == 0, proc.stdout
+    themes = json.loads(themes_path.read_text(encoding="utf-8"))
+    assert themes["theme_00001"]["sha256"] == fresh["theme_00001"]["sha256"]
+
+
+class PagedReleasesHandler(FixtureHandler):
+    """Lists `server.releases` one release per page, linked by `Link` headers.
+
+    Releases are (tag, themes) pairs, newest first; requested page numbers
+    are recorded in `server.pages`.
+    """
+
+    def do_GET(self):
+        match = re.match(r"^/paged/repos/[^/]+/[^/]+/releases\?(.*)$", self.path)
+        if not match:
+            super().do_GET()
+            return
+        self.server.count_request()
+        page = int(parse_qs(match.group(1)).get("page", ["1"])[0])
+        self.server.pages.append(page)
+        base = f"http://{self.headers['Host']}/paged"
+        tag, themes = self.server.releases[page - 1]
+        release = {
+            "tag_name": tag,
+            "draft": False,
+            "prerelease": False,
+            "assets": [
+                {
+                    "name": f"{theme}.tar.gz",
+                    "browser_download_url": f"{base}/assets/{tag}/{theme}",
+                    "digest": "sha256:"
+                    + hashlib.sha256(f"{tag}/{theme}".encode()).hexdigest(),
+                }
+                for theme in themes
+            ],
+        }
+        headers = {}
+        if page < len(self.server.releases):
+            url = f"{base}/repos/o/r/releases?per_page=100&page={page + 1}"
+            headers["Link"] = f'<{url}>; rel="next"'
+        self.send_body(json.dumps([release]).encode(), "application/json", headers)
+
+
+@pytest.fixture
+def paged_server():
+    server = FixtureServer()
+    server.RequestHandlerClass = PagedReleasesHandler
+    server.pages = []
+    server.releases = [
+        ("v3", ["Theme_A", "Theme_B"]),
+        ("v2", ["Theme_A", "Theme_C"]),
+        ("v1", ["Theme_D"]),
+    ]
+    with server:
+        yield server
+
+
+def test_all_releases_follows_pages(paged_server, tmp_path):
+    api = f"{paged_server.url}/paged"
+    proc = run_update(api, tmp_path, "--all-releases", "--full")
+    assert proc.returncode == 0, proc.stdout
+    assert paged_server.pages == [1, 2, 3]
+
+    themes = json.loads((tmp_path / "themes.json").read_text(encoding="utf-8"))
+    # Each theme comes from the newest release that has it
+    assert {name: entry["tag"] for name, entry in themes.items()} == {
+        "theme_a": "v3",
+        "theme_b": "v3",
+        "theme_c": "v2",
+        "theme_d": "v1",
+    }
+    assert themes["theme_a"]["url"].endswith("/assets/v3/Theme_A")
+
+
+def test_all_releases_stops_at_a_recorded_release(paged_server, tmp_path):
+    api = f"{paged_server.url}/paged"
+    assert run_update(api, tmp_path, "--all-releases", "--full").returncode == 0
+    before = json.loads((tmp_path / "themes.json").read_text(encoding="utf-8"))
+
+    paged_server.releases.insert(0, ("v4", ["Theme_A", "Theme_E"]))
+    paged_server.pages.clear()
+    proc = run_update(api, tmp_path, "--all-releases")
+    assert proc.returncode == 0, proc.stdout
+    # v3 is already recorded: v2 and v1 are never requested
+    assert paged_server.pages == [1, 2]
+    assert "Reached already recorded release v3" in proc.stdout
+
+    themes = json.loads((tmp_path / "themes.json").read_text(encoding="utf-8"))
+    assert themes["theme_a"]["tag"] == "v4"
+    assert themes["theme_e"]["tag"] == "v4"
+    # Entries of the releases that were not visited are kept as they were
+    assert themes["theme_c"] == before["theme_c"]
+    assert themes["theme_d"] == before["theme_d"]
@@ -0,0 +1,140 @@
+"""update_utils.trace: spans, summaries and the `run` wrapper."""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from conftest import REPO_ROOT, SCRIPTS_DIR
+from fixtures import ASSET_SIZE
+from update_utils.trace import Tracer, summarize
+
+TRACE = SCRIPTS_DIR / "update_utils" / "trace.py"
+STAR_RAIL = REPO_ROOT / "pkgs" / "grub-themes" / "star-rail" / "update.py"
+
+
+def read_spans(directory):
+    return [
+        json.loads(line)
+        for path in sorted(directory.glob("*.jsonl"))
+        for line in path.read_text(encoding="utf-8").splitlines()
+    ]
+
+
+def trace_cli(*args, env=None) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, str(TRACE), *args],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+def test_spans_nest_per_thread(tmp_path):
+    tracer = Tracer(tmp_path, "nesting")
+
+    def worker():
+        with tracer.span("other"):
+            pass
+
+    with tracer.span("outer", step=1) as outer:
+        with tracer.span("inner") as inner:
+            inner.set(bytes=10)
+        # A span opened on another thread does not inherit this stack
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+    with pytest.raises(ValueError):
+        with tracer.span("failing"):
+            raise ValueError("boom")
+    tracer.close()
+
+    spans = {s["name"]: s for s in read_spans(tmp_path)}
+    assert spans["outer"]["parent"] is None
+    assert spans["outer"]["step"] == 1
+    assert spans["inner"]["parent"] == outer.id
+    assert spans["inner"]["bytes"] == 10
+    assert spans["other"]["parent"] is None
+    assert spans["failing"]["parent"] is None
+    assert spans["failing"]["error"] == "ValueError"
+
+    summary = json.loads(next(tmp_path.glob("*.summary.json")).read_text())
+    assert summary["script"] == "nesting"
+    assert summary["spans"]["failing"]["errors"] == 1
+    assert summary["spans"]["inner"]["bytes"] == 10
+
+
+def test_run_passes_the_exit_code_through(tmp_path):
+    env = dict(os.environ, UPDATE_TRACE_DIR=str(tmp_path))
+    assert trace_cli("run", "--", "sh", "-c", "exit 3", env=env).returncode == 3
+    assert trace_cli("run", "true", env=env).returncode == 0
+    missing = trace_cli("run", "--", "no-such-command-here", env=env)
+    assert missing.returncode == 127
+    assert "command not found" in missing.stderr
+
+    spans = read_spans(tmp_path)
+    assert sorted(s["returncode"] for s in spans if "returncode" in s) == [0, 3]
+    assert {s["script"] for s in spans} >= {"sh", "true"}
+
+
+def test_summarize_merges_processes(tmp_path):
+    env = dict(os.environ, UPDATE_TRACE_DIR=str(tmp_path))
+    for _ in range(2):
+        assert trace_cli("run", "--", "true", env=env).returncode == 0
+    assert trace_cli("run", "--", "sh", "-c", "exit 1", env=env).returncode == 1
+
+    assert trace_cli("summarize", str(tmp_path)).returncode == 0
+    summary = json.loads((tmp_path / "summary.json").read_text(encoding="utf-8"))
+    assert summary == summarize(tmp_path)
+    assert len(summary["processes"]) == 3
+    assert summary["spans"]["subprocess"]["count"] == 3
+    assert summary["scripts"]["true"]["subprocess"]["count"] == 2
+    assert summary["scripts"]["sh"]["subprocess"]["count"] == 1
+
+
+def test_update_script_spans(fixture_server, tmp_path):
+    trace_dir = tmp_path / "trace"
+    env = dict(
+        os.environ,
+        GITHUB_API_URL=f"{fixture_server.url}/gh/3",
+        UPDATE_TRACE_DIR=str(trace_dir),
+    )
+    env.pop("GITHUB_TOKEN", None)
+    proc = subprocess.run(
+        [
+            sys.executable,
+            str(STAR_RAIL),
+            "--output",
+            str(tmp_path / "themes.json"),
+            "--state",
+            str(tmp_path / "state.json"),
+            "--http-cache",
+            str(tmp_path / "http"),
+            "--no-download-cache",
+        ],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    assert proc.returncode == 0, proc.stdout
+
+    spans = read_spans(trace_dir)
+    (release,) = [s for s in spans if s["name"] == "http"]
+    assert release["status"] == 200
+    # The one asset without an API digest is downloaded and hashed
+    (hashed,) = [s for s in spans if s["name"] == "hash"]
+    assert hashed["url"].endswith("/assets/0")
+    assert hashed["bytes"] == ASSET_SIZE
+
+    assert trace_cli("summarize", str(trace_dir)).returncode == 0
+    summary = json.loads((trace_dir / "summary.json").read_text(encoding="utf-8"))
+    totals = summary["scripts"]["update"]
+    assert totals["http"]["count"] + totals["hash"]["count"] == 2
+    assert fixture_server.requests == 2
+    assert totals["hash"]["bytes"] == ASSET_SIZE
+    assert totals["write"]["count"] == 2
@@ -10,6 +10,14 @@ if [ $# -lt 1 ]; then
 fi
 
 PACKAGE="$1"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+TRACE="$SCRIPT_DIR/../update_utils/trace.py"
+
+# 各脚本把 JSON-lines span 写入该目录（须在工作区之外，否则会被当作更新）；
+# 退出时合并为 summary.json，供工作流作为 artifact 收集
+export UPDATE_TRACE_DIR="${UPDATE_TRACE_DIR:-${RUNNER_TEMP:-/tmp}/update-trace}"
+mkdir -p "$UPDATE_TRACE_DIR"
+trap 'python3 "$TRACE" summarize "$UPDATE_TRACE_DIR" || true' EXIT
 
 # Helper: 向 GitHub Actions 的 $GITHUB_OUTPUT 追加输出（本地调试时退回到 stdout）
 append_github_output() {
@@ -21,6 +29,20 @@ append_github_output() {
   fi
 }
 
+# 更新脚本因 API 额度耗尽而推迟时的退出码（见 scripts/update_utils/http.py）
+DEFERRED_EXIT_CODE=75
+
+# 运行更新命令；推迟时记录 deferred 输出并保留非零退出码，使其在 CI 中可见
+run_update_command() {
+  local status=0
+  python3 "$TRACE" run -- "$@" || status=$?
+  if [ "$status" -eq "$DEFERRED_EXIT_CODE" ]; then
+    append_github_output "deferred" "true"
+    echo "更新已推迟: $PACKAGE（API 额度耗尽，下次运行重试）"
+  fi
+  return "$status"
+}
+
 # 设置 Git 用户信息
 git config --global user.email "actions@github.com"
 git config --global user.name "GitHub Actions"
@@ -40,7 +62,7 @@ export ORI_HOME="$HOME"
 export HOME=$(mktemp -d)
 
 echo "获取包 $PACKAGE 的updateScript"
-script_json=$(nix eval --impure --json --expr "
+script_json=$(python3 "$TRACE" run -- nix eval --impure --json --expr "
   let
     f = builtins.getFlake (builtins.getEnv \"FLAKE_REF\");
     sys = \"x86_64-linux\";
@@ -90,11 +112,11 @@ execute_command_array() {
     new_command+=("$PACKAGE")
 
     echo "替换后的命令: ${new_command[@]}"
-    "${new_command[@]}"
+    run_update_command "${new_command[@]}"
   else
     # 非 nix-update 命令按原样执行
     echo "执行更新命令(数组): ${script_array[@]}"
-    "${script_array[@]}"
+    run_update_command "${script_array[@]}"
   fi
 }
 
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""一次求值找出 legacyPackages 中所有具有 updateScript 的包及其命令。
+
+与逐包 nix eval 相比，getFlake 与 import <nixpkgs> 只执行一次；结果按
+flake.lock 与包定义树的内容缓存，未变化时无需求值。若某个包的错误使整体
+求值失败，则对半拆分、逐层展开属性重新求值，跳过并报告出错的属性。
+
+输出与 find-packages-with-update-script.sh 相同:
+  package_list: JSON 数组字符串, 包含要更新的包属性路径
+  package_count: 要更新的条目数
+写入 $GITHUB_OUTPUT（未设置时打印到 stdout）。--json 额外输出
+[{"attr": ..., "updateScript": ...}]，读取失败的 updateScript 为 null。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+REPO_ROOT = SCRIPT_DIR.parent.parent
+DEFAULT_SYSTEM = "x86_64-linux"
+DEFAULT_CACHE_DIR = REPO_ROOT / ".cache" / "update-scripts"
+CACHE_VERSION = 1
+
+# 影响 legacyPackages 的输入
+INPUT_FILES = ("flake.lock", "flake.nix", "default.nix", "overlay.nix", "ci.nix")
+INPUT_DIRS = ("pkgs", "lib", "overlays", "modules")
+
+PRELUDE = """
+  f = builtins.getFlake (builtins.getEnv "FLAKE_REF");
+  sys = builtins.getEnv "UPDATE_SCRIPT_SYSTEM";
+  lp = builtins.getAttr sys f.legacyPackages;
+  pkgsN = import <nixpkgs> {};
+  lib = pkgsN.lib;
+  scriptOf = pkg:
+    if (pkg ? passthru && pkg.passthru ? updateScript) then pkg.passthru.updateScript
+    else pkg.updateScript;
+  hasUS = pkg: (pkg ? passthru && pkg.passthru ? updateScript) || (pkg ? updateScript);
+  at = path: lib.attrByPath path null lp;
+"""
+
+# 收集 UPDATE_SCRIPT_ROOTS（属性路径列表，[[]] 即整个 legacyPackages）下的包
+DISCOVERY_EXPR = "let" + PRELUDE + """
+  roots = builtins.fromJSON (builtins.getEnv "UPDATE_SCRIPT_ROOTS");
+  visit = v: p:
+    if lib.isDerivation v then
+      if hasUS v then
+        let script = builtins.tryEval (builtins.toJSON (scriptOf v)); in
+        [ {
+          attr = lib.concatStringsSep "." p;
+          updateScript = if script.success then script.value else null;
+        } ]
+      else []
+    else if lib.isAttrs v then
+      lib.concatMap (name: visit v.${name} (p ++ [ name ])) (builtins.attrNames v)
+    else [];
+in lib.concatMap (p: visit (at p) p) roots
+"""
+
+# 定位出错属性时查看单个节点：派生是否有 updateScript，或属性集的子属性名
+NODE_EXPR = "let" + PRELUDE + """
+  v = at (builtins.fromJSON (builtins.getEnv "UPDATE_SCRIPT_ROOTS"));
+in
+  if lib.isDerivation v then { derivation = true; hasUpdateScript = hasUS v; }
+  else { derivation = false; children = if lib.isAttrs v then builtins.attrNames v else []; }
+"""
+
+
+def log(msg: str) -> None:
+    print(msg, file=sys.stderr, flush=True)
+
+
+def append_github_output(key: str, value: str) -> None:
+    path = os.environ.get("GITHUB_OUTPUT")
+    if path:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(f"{key}={value}\n")
+    else:
+        print(f"{key}={value}")
+
+
+def inputs_digest(repo: Path, system: str) -> str:
+    """flake.lock、顶层 nix 文件与包定义目录的内容摘要"""
+    h = hashlib.sha256(f"v{CACHE_VERSION}\0{system}\0".encode())
+    h.update(os.environ.get("NIX_PATH", "").encode() + b"\0")
+    paths = [repo / name for name in INPUT_FILES]
+    for name in INPUT_DIRS:
+        paths.extend(sorted(p for p in (repo / name).rglob("*") if p.is_file()))
+    for path in paths:
+        if not path.is_file():
+            continue
+        h.update(path.relative_to(repo).as_posix().encode() + b"\0")
+        h.update(hashlib.sha256(path.read_bytes()).digest())
+    return h.hexdigest()
+
+
+def nix_eval(repo: Path, system: str, expr: str, roots) -> Optional[object]:
+    """求值 expr，失败时返回 None（错误信息已输出到 stderr）"""
+    env = dict(
+        os.environ,
+        FLAKE_REF=f"path:{repo}",
+        UPDATE_SCRIPT_SYSTEM=system,
+        UPDATE_SCRIPT_ROOTS=json.dumps(roots),
+        NIXPKGS_ALLOW_UNFREE="1",
+    )
+    proc = subprocess.run(
+        ["nix", "eval", "--impure", "--json", "--expr", expr],
+        env=env,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return None
+    return json.loads(proc.stdout)
+
+
+def bisect(
+    repo: Path, system: str, roots: List[List[str]], broken: List[str]
+) -> List[Dict]:
+    """逐步缩小范围求值，跳过无法求值的属性并记录到 broken。
+
+    一组根路径整体失败时对半拆分；单个属性集失败时展开为其子属性。
+    单个派生仍然失败时，若能确认它有 updateScript 则与以前一样带上
+    （updateScript 为 null），否则跳过。
+    """
+    items = nix_eval(repo, system, DISCOVERY_EXPR, roots)
+    if items is not None:
+        return items
+    if len(roots) > 1:
+        mid = len(roots) // 2
+        return bisect(repo, system, roots[:mid], broken) + bisect(
+            repo, system, roots[mid:], broken
+        )
+
+    path = roots[0]
+    node = nix_eval(repo, system, NODE_EXPR, path)
+    if node is None and not path:
+        # 连 legacyPackages 本身都无法求值，问题不在某个包
+        raise SystemExit("nix eval 失败: 无法求值 legacyPackages")
+    if node is not None and not node["derivation"] and node["children"]:
+        return bisect(repo, system, [path + [n] for n in node["children"]], broken)
+    attr = ".".join(path)
+    broken.append(attr)
+    if node is not None and node.get("hasUpdateScript"):
+        return [{"attr": attr, "updateScript": None}]
+    log(f"警告: 无法求值 {attr}，已跳过")
+    return []
+
+
+def evaluate(repo: Path, system: str) -> List[Dict]:
+    items = nix_eval(repo, system, DISCOVERY_EXPR, [[]])
+    if items is None:
+        # 一个包的错误不应中断整个发现过程：缩小范围找出出错的属性
+        log("整体求值失败，逐步缩小范围定位出错的属性...")
+        broken: List[str] = []
+        items = bisect(repo, system, [[]], broken)
+        log(f"无法求值的属性: {', '.join(broken) or '无'}")
+    entries = []
+    for item in items:
+        script = item["updateScript"]
+        if script is None:
+            # 无法读取 updateScript 时仍包含该包以避免遗漏
+            log(f"警告: 无法读取 {item['attr']} 的 updateScript，包含在更新列表中")
+        entries.append(
+            {
+                "attr": item["attr"],
+                "updateScript": json.loads(script) if script is not None else None,
+            }
+        )
+    return entries
+
+
+def find_update_scripts(
+    repo: Path = REPO_ROOT,
+    system: str = DEFAULT_SYSTEM,
+    cache_dir: Optional[Path] = DEFAULT_CACHE_DIR,
+) -> List[Dict]:
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = Path(cache_dir) / f"{inputs_digest(repo, system)}.json"
+        try:
+            entries = json.loads(cache_file.read_text(encoding="utf-8"))
+            log(f"使用缓存的 updateScript 列表: {cache_file}")
+            return entries
+        except (OSError, ValueError):
+            pass
+
+    entries = evaluate(repo, system)
+    # 按属性路径去重，保留首次出现的条目
+    unique: Dict[str, Dict] = {}
+    for entry in entries:
+        unique.setdefault(entry["attr"], entry)
+    entries = list(unique.values())
+
+    if cache_file is not None:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(entries, indent=2), encoding="utf-8")
+        os.replace(tmp, cache_file)
+    return entries
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="List packages with an updateScript using a single nix eval"
+    )
+    parser.add_argument("--system", default=DEFAULT_SYSTEM, help="Nix system")
+    parser.add_argument(
+        "--cache-dir",
+        default=str(DEFAULT_CACHE_DIR),
+        help="Directory caching results keyed on flake.lock and the pkgs tree",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Always evaluate")
+    parser.add_argument(
+        "--json", help="Also write attr paths with their updateScript to this file"
+    )
+    args = parser.parse_args()
+
+    log("开始查找具有 updateScript 的包...")
+    repo = Path(os.environ.get("GITHUB_WORKSPACE") or REPO_ROOT).resolve()
+    cache_dir = None if args.no_cache else Path(args.cache_dir)
+    entries = find_update_scripts(repo, args.system, cache_dir)
+
+    packages = [e["attr"] for e in entries]
+    log(f"找到 {len(packages)} 个需要更新的条目:")
+    for package in packages:
+        log(package)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(entries, indent=2), encoding="utf-8")
+    append_github_output("package_list", json.dumps(packages, separators=(",", ":")))
+    append_github_output("package_count", str(len(packages)))
+    log("完成: 已写入 package_list 和 package_count 到 GitHub 输出变量。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
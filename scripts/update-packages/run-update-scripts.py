@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""在本机并行运行所有 updateScript，代替每个包一个 Actions job 的扇出。
+
+每个包在独立的 git worktree 中执行 execute-update-script.sh，拥有自己的临时
+HOME、GITHUB_OUTPUT 与追踪目录（UPDATE_TRACE_DIR），互不干扰；下载缓存与
+ETag/HTTP 缓存则通过 UPDATE_CACHE_DIR（默认 .cache/）在各 worktree 与各次运行
+间共享。超时的脚本连同
+其子进程一起被终止。结束后打印汇总（有更新 / 无更新 / 推迟 / 失败 / 超时及耗时），
+并把有更新的包的改动保存为补丁，可选地依次应用到当前工作区。每个包的 span
+汇总位于输出目录下的 <包>.trace/summary.json。
+
+用法:
+  python3 scripts/update-packages/run-update-scripts.py [-j N] [--timeout S] [PKG ...]
+
+未指定包时使用 find-packages-with-update-script.sh 发现的全部包。
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+REPO_ROOT = SCRIPT_DIR.parent.parent
+FIND_SCRIPT = SCRIPT_DIR / "find-packages-with-update-script.sh"
+EXECUTE_SCRIPT = SCRIPT_DIR / "execute-update-script.sh"
+DEFAULT_JOBS = os.cpu_count() or 4
+DEFAULT_TIMEOUT = 1800.0
+DEFAULT_OUTPUT_DIR = REPO_ROOT / ".cache" / "update-packages"
+# 各 worktree 共用的缓存目录（下载缓存、ETag 状态、HTTP 缓存），见 update_utils
+DEFAULT_CACHE_DIR = Path(os.environ.get("UPDATE_CACHE_DIR") or REPO_ROOT / ".cache")
+# 与 update_utils.http.DEFERRED_EXIT_CODE 一致：API 额度耗尽，更新被推迟
+DEFERRED_EXIT_CODE = 75
+# 并发的 git worktree add/remove 会争用仓库元数据的锁而失败，须逐个执行
+WORKTREE_LOCK = threading.Lock()
+
+
+@dataclass
+class UpdateResult:
+    package: str
+    status: str  # updated | unchanged | deferred | failed | timeout
+    duration: float
+    returncode: Optional[int]
+    log: str
+    patch: Optional[str] = None
+    trace: Optional[str] = None
+
+
+def log(msg: str) -> None:
+    print(msg, file=sys.stderr, flush=True)
+
+
+def read_github_output(path: Path) -> Dict[str, str]:
+    outputs = {}
+    try:
+        text = path.read_text(encoding="utf-8")
+    except OSError:
+        return outputs
+    for line in text.splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            outputs[key] = value
+    return outputs
+
+
+def discover_packages(repo: Path) -> List[str]:
+    """调用 find-packages-with-update-script.sh，读取其 package_list 输出"""
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / "github-output"
+        env = dict(os.environ, GITHUB_OUTPUT=str(output), GITHUB_WORKSPACE=str(repo))
+        subprocess.run(
+            ["bash", str(FIND_SCRIPT)],
+            cwd=repo,
+            env=env,
+            check=True,
+            stdout=sys.stderr,
+        )
+        return json.loads(read_github_output(output).get("package_list", "[]"))
+
+
+def safe_name(package: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", package)
+
+
+def run_with_timeout(
+    cmd: List[str], cwd: Path, env: Dict[str, str], log_path: Path, timeout: float
+) -> Optional[int]:
+    """运行命令并把输出写入日志；超时时终止整个进程组并返回 None"""
+    with log_path.open("wb") as log_file:
+        proc = subprocess.Popen(
+            cmd,
+            cwd=cwd,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+        try:
+            return proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGTERM)
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                os.killpg(proc.pid, signal.SIGKILL)
+                proc.wait()
+            return None
+
+
+def run_update(
+    package: str,
+    repo: Path,
+    work_dir: Path,
+    output_dir: Path,
+    timeout: float,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+) -> UpdateResult:
+    name = safe_name(package)
+    worktree = work_dir / name
+    home = work_dir / f"{name}.home"
+    github_output = work_dir / f"{name}.output"
+    log_path = output_dir / f"{name}.log"
+    trace_dir = output_dir / f"{name}.trace"
+    home.mkdir()
+
+    start = time.monotonic()
+    with WORKTREE_LOCK:
+        subprocess.run(
+            ["git", "-C", str(repo), "worktree", "add", "--detach", str(worktree)],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    try:
+        # 独立 HOME：脚本中的 git config --global 等写入不会互相覆盖
+        env = dict(
+            os.environ,
+            HOME=str(home),
+            GITHUB_WORKSPACE=str(worktree),
+            GITHUB_OUTPUT=str(github_output),
+            UPDATE_TRACE_DIR=str(trace_dir),
+            # worktree 用完即删，缓存须放在其外才能在包与运行之间复用
+            UPDATE_CACHE_DIR=str(cache_dir),
+        )
+        code = run_with_timeout(
+            ["bash", str(EXECUTE_SCRIPT), package], worktree, env, log_path, timeout
+        )
+        duration = time.monotonic() - start
+
+        trace = str(trace_dir / "summary.json")
+        if code is None:
+            return UpdateResult(
+                package, "timeout", duration, None, str(log_path), trace=trace
+            )
+        if code == DEFERRED_EXIT_CODE:
+            return UpdateResult(
+                package, "deferred", duration, code, str(log_path), trace=trace
+            )
+        if code != 0:
+            return UpdateResult(
+                package, "failed", duration, code, str(log_path), trace=trace
+            )
+        if read_github_output(github_output).get("has_update") != "true":
+            return UpdateResult(
+                package, "unchanged", duration, 0, str(log_path), trace=trace
+            )
+
+        # 把工作区改动（含新文件）保存为补丁
+        subprocess.run(["git", "-C", str(worktree), "add", "-A"], check=True)
+        patch = subprocess.run(
+            ["git", "-C", str(worktree), "diff", "--cached", "--binary"],
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        patch_path = output_dir / f"{name}.patch"
+        patch_path.write_bytes(patch)
+        return UpdateResult(
+            package, "updated", duration, 0, str(log_path), str(patch_path), trace
+        )
+    finally:
+        with WORKTREE_LOCK:
+            subprocess.run(
+                [
+                    "git",
+                    "-C",
+                    str(repo),
+                    "worktree",
+                    "remove",
+                    "--force",
+                    str(worktree),
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        shutil.rmtree(home, ignore_errors=True)
+
+
+def apply_patches(repo: Path, results: List[UpdateResult]) -> List[str]:
+    """依次把补丁应用到当前工作区，返回无法应用的包"""
+    conflicts = []
+    for result in results:
+        if result.status != "updated":
+            continue
+        proc = subprocess.run(
+            ["git", "-C", str(repo), "apply", "--3way", result.patch],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        if proc.returncode != 0:
+            log(f"补丁无法应用: {result.package}\n{proc.stdout.strip()}")
+            conflicts.append(result.package)
+    return conflicts
+
+
+def print_summary(results: List[UpdateResult], wall: float) -> None:
+    width = max([len("package")] + [len(r.package) for r in results])
+    print(f"{'package':<{width}}  {'status':<9}  {'time':>8}")
+    for r in sorted(results, key=lambda r: (r.status, r.package)):
+        print(f"{r.package:<{width}}  {r.status:<9}  {r.duration:>7.1f}s")
+    counts = {}
+    for r in results:
+        counts[r.status] = counts.get(r.status, 0) + 1
+    total = sum(r.duration for r in results)
+    summary = ", ".join(f"{k}={v}" for k, v in sorted(counts.items()))
+    print(f"\n{len(results)} 个包: {summary}; 墙钟 {wall:.1f}s, 累计 {total:.1f}s")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Run every updateScript locally with bounded concurrency"
+    )
+    parser.add_argument(
+        "packages",
+        nargs="*",
+        help="Attribute paths to update (default: discover all with updateScript)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help="Number of update scripts to run at once",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help="Seconds before an update script is killed",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=str(DEFAULT_OUTPUT_DIR),
+        help="Directory for per-package logs and patches",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=str(DEFAULT_CACHE_DIR),
+        help="Cache directory shared by the update scripts of all worktrees",
+    )
+    parser.add_argument(
+        "--summary",
+        help="Write the results as JSON to this path",
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Apply the resulting patches to the current working tree",
+    )
+    args = parser.parse_args()
+
+    repo = REPO_ROOT
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    packages = args.packages or discover_packages(repo)
+    if not packages:
+        log("没有找到具有 updateScript 的包")
+        return 0
+    jobs = max(1, min(args.jobs, len(packages)))
+    log(
+        f"并行运行 {len(packages)} 个 updateScript（并发 {jobs}，超时 {args.timeout}s）"
+    )
+
+    start = time.monotonic()
+    with tempfile.TemporaryDirectory(prefix="update-packages-") as tmp:
+        work_dir = Path(tmp)
+
+        def worker(package: str) -> UpdateResult:
+            try:
+                result = run_update(
+                    package,
+                    repo,
+                    work_dir,
+                    output_dir,
+                    args.timeout,
+                    Path(args.cache_dir).resolve(),
+                )
+            except (OSError, subprocess.CalledProcessError) as e:
+                log(f"无法启动 {package}: {e}")
+                result = UpdateResult(package, "failed", 0.0, None, "")
+            log(f"[{result.status}] {package} ({result.duration:.1f}s)")
+            return result
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(worker, packages))
+        subprocess.run(["git", "-C", str(repo), "worktree", "prune"], check=False)
+    wall = time.monotonic() - start
+
+    print_summary(results, wall)
+    if args.summary:
+        Path(args.summary).write_text(
+            json.dumps(
+                {"wall_seconds": wall, "results": [asdict(r) for r in results]},
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+
+    conflicts = apply_patches(repo, results) if args.apply else []
+    failed = [r for r in results if r.status in ("failed", "timeout")]
+    deferred = [r.package for r in results if r.status == "deferred"]
+    if deferred:
+        log(f"以下包因 API 额度耗尽被推迟，请稍后重试: {' '.join(deferred)}")
+    return 1 if failed or conflicts or deferred else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+"""Helpers shared by the per-package update scripts under pkgs/.
+
+Update scripts run from the repository root (see passthru.updateScript), so
+they make this package importable with:
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[N] / "scripts"))
+
+Caches default to locations inside the checkout. Set `UPDATE_CACHE_DIR` to
+keep them in one directory shared across checkouts instead: the local
+orchestrator does so because it runs every package in a throwaway git
+worktree, and the update workflow restores the directory with
+actions/cache so conditional requests survive between scheduled runs.
+"""
+
+import os
+from pathlib import Path
+
+CACHE_DIR_ENV = "UPDATE_CACHE_DIR"
+
+
+def cache_dir(name: str, default: Path) -> Path:
+    """`$UPDATE_CACHE_DIR/<name>` when the variable is set, else `default`."""
+    shared = os.environ.get(CACHE_DIR_ENV)
+    return Path(shared) / name if shared else Path(default)
@@ -0,0 +1,274 @@
+"""Stream a download once and derive every hash format Nix expressions use.
+
+`fetch_digest` hashes the response body while writing it into a
+content-addressed `DownloadCache`. A URL that has been fetched before is
+answered from the cache once a conditional HEAD request confirms that the
+server still has the same file, so a replaced release asset is hashed
+again instead of keeping its old digest. With
+`add_to_store_as` the file is also registered via `nix-store --add-fixed`,
+so a later `fetchurl { url; hash; }` for the same file is already
+substituted locally.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+from urllib.parse import unquote, urlparse
+
+import requests
+
+from . import trace
+
+NIX_BASE32_ALPHABET = "0123456789abcdfghijklmnpqrsvwxyz"
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_RETRIES = 3
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Response headers recorded with each URL to revalidate cached digests
+VALIDATORS = ("ETag", "Last-Modified", "Content-Length")
+
+
+def nix_base32(digest: bytes) -> str:
+    """Encode bytes the way `nix-hash --to-base32` does."""
+    length = (len(digest) * 8 - 1) // 5 + 1
+    chars = []
+    for n in range(length - 1, -1, -1):
+        byte, bit = divmod(n * 5, 8)
+        c = digest[byte] >> bit
+        if byte + 1 < len(digest):
+            c |= digest[byte + 1] << (8 - bit)
+        chars.append(NIX_BASE32_ALPHABET[c & 0x1F])
+    return "".join(chars)
+
+
+@dataclass(frozen=True)
+class Digest:
+    """A SHA-256 digest in the three spellings found in Nix expressions."""
+
+    hex: str
+    base32: str
+    sri: str
+
+    @classmethod
+    def from_bytes(cls, digest: bytes) -> "Digest":
+        return cls(
+            hex=digest.hex(),
+            base32=nix_base32(digest),
+            sri="sha256-" + base64.b64encode(digest).decode("ascii"),
+        )
+
+    @classmethod
+    def from_hex(cls, value: str) -> "Digest":
+        return cls.from_bytes(bytes.fromhex(value))
+
+
+def url_basename(url: str) -> str:
+    """Store name `fetchurl` derives from a URL (`baseNameOf url`)."""
+    return unquote(os.path.basename(urlparse(url).path)) or "download"
+
+
+class DownloadCache:
+    """Downloaded files keyed by SHA-256, plus a URL -> digest index.
+
+    Layout: `sha256/<hex>` holds the bytes and `urls/<sha256(url)>.json`
+    records which digest a URL resolved to, together with the response's
+    ETag, Last-Modified and Content-Length. `lookup` trusts an index entry
+    only after revalidating it against these. Entries are touched on every
+    hit, and `prune` evicts the least recently used files until the blobs
+    fit in `max_bytes`.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def blob_path(self, hex_digest: str) -> Path:
+        return self.root / "sha256" / hex_digest
+
+    def _url_path(self, url: str) -> Path:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.root / "urls" / f"{key}.json"
+
+    def lookup(self, url: str, session=None) -> Optional[Digest]:
+        """Cached digest of `url`, if the server still serves the same file."""
+        try:
+            entry = json.loads(self._url_path(url).read_text(encoding="utf-8"))
+            blob = self.blob_path(entry["sha256"])
+            os.utime(blob)
+        except (OSError, ValueError, KeyError):
+            return None
+        if not self._revalidate(url, entry, session or requests):
+            return None
+        return Digest.from_hex(entry["sha256"])
+
+    def _revalidate(self, url: str, entry: dict, http) -> bool:
+        """Ask the server with a conditional HEAD whether `entry` is current."""
+        validators = {name: entry.get(name) for name in VALIDATORS}
+        if not validators["ETag"] and not validators["Last-Modified"]:
+            # Nothing to compare against: download again
+            return False
+        headers = {"Accept-Encoding": "identity"}
+        if validators["ETag"]:
+            headers["If-None-Match"] = validators["ETag"]
+        if validators["Last-Modified"]:
+            headers["If-Modified-Since"] = validators["Last-Modified"]
+        try:
+            response = http.head(url, headers=headers, allow_redirects=True, timeout=30)
+        except requests.RequestException:
+            return False
+        if response.status_code == 304:
+            return True
+        if response.status_code != 200:
+            return False
+        # Servers may ignore conditional headers on HEAD
+        return all(
+            response.headers.get(name) == value
+            for name, value in validators.items()
+            if value
+        )
+
+    def temp_file(self):
+        """Open a temporary file on the same filesystem as the blobs."""
+        (self.root / "sha256").mkdir(parents=True, exist_ok=True)
+        return tempfile.NamedTemporaryFile(
+            dir=self.root / "sha256", prefix=".partial-", delete=False
+        )
+
+    def commit(self, tmp_path: Path, url: str, digest: Digest, headers=None) -> Path:
+        """Move a finished download into place and index it under `url`.
+
+        `headers` are the download's response headers; their validators
+        are kept for revalidating later lookups.
+        """
+        blob = self.blob_path(digest.hex)
+        os.replace(tmp_path, blob)
+        os.chmod(blob, 0o644)
+        index = self._url_path(url)
+        index.parent.mkdir(parents=True, exist_ok=True)
+        # Other processes may share the cache through UPDATE_CACHE_DIR
+        tmp = index.with_suffix(f".{os.getpid()}.tmp")
+        entry = {"url": url, "sha256": digest.hex}
+        for name in VALIDATORS:
+            if headers is not None and headers.get(name):
+                entry[name] = headers[name]
+        tmp.write_text(json.dumps(entry), "utf-8")
+        os.replace(tmp, index)
+        return blob
+
+    def prune(self) -> None:
+        blobs_dir = self.root / "sha256"
+        if not blobs_dir.is_dir():
+            return
+        entries = []
+        for path in blobs_dir.iterdir():
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def add_to_store(path: Path, name: str) -> Optional[str]:
+    """Register a flat file as a fixed-output store path named `name`.
+
+    The resulting path is the one `fetchurl` with the same name and hash
+    would produce. Returns None when nix-store is unavailable or fails.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        named = Path(tmpdir) / name
+        shutil.copyfile(path, named)
+        try:
+            proc = trace.run(
+                ["nix-store", "--add-fixed", "sha256", str(named)],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+        except FileNotFoundError:
+            print("nix-store not found, skipping --add-fixed", file=sys.stderr)
+            return None
+    if proc.returncode != 0:
+        print(f"nix-store --add-fixed failed: {proc.stderr.strip()}", file=sys.stderr)
+        return None
+    return proc.stdout.strip()
+
+
+def fetch_digest(
+    url: str,
+    session=None,
+    cache: Optional[DownloadCache] = None,
+    retries: int = DEFAULT_RETRIES,
+    add_to_store_as: Optional[str] = None,
+) -> Optional[Digest]:
+    """Download `url` once and return its digest, or None after `retries`.
+
+    Bytes are streamed straight to disk while hashing, so memory use stays
+    at one chunk regardless of file size. Pass `add_to_store_as` (normally
+    `url_basename(url)`) to register the result with the Nix store; this
+    requires a cache since nix-store needs the bytes on disk.
+    """
+    with trace.span("hash", url=url) as s:
+        if cache is not None:
+            cached = cache.lookup(url, session)
+            if cached is not None:
+                s.set(cached=True)
+                if add_to_store_as:
+                    add_to_store(cache.blob_path(cached.hex), add_to_store_as)
+                return cached
+
+        http = session or requests
+        for attempt in range(1, retries + 1):
+            s.set(attempts=attempt)
+            tmp = cache.temp_file() if cache is not None else None
+            try:
+                hasher = hashlib.sha256()
+                size = 0
+                hash_seconds = 0.0
+                headers = {"Accept-Encoding": "identity"}
+                with http.get(
+                    url, stream=True, headers=headers, timeout=30
+                ) as response:
+                    response.raise_for_status()
+                    validators = response.headers
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if chunk:
+                            started = time.perf_counter()
+                            hasher.update(chunk)
+                            if tmp is not None:
+                                tmp.write(chunk)
+                            hash_seconds += time.perf_counter() - started
+                            size += len(chunk)
+                s.set(bytes=size, hash_seconds=hash_seconds)
+                digest = Digest.from_bytes(hasher.digest())
+                if tmp is not None:
+                    tmp.close()
+                    blob = cache.commit(Path(tmp.name), url, digest, validators)
+                    if add_to_store_as:
+                        add_to_store(blob, add_to_store_as)
+                return digest
+            except Exception as e:
+                print(
+                    f"Error downloading {url} (attempt {attempt}/{retries}): {e}",
+                    file=sys.stderr,
+                )
+                if attempt < retries:
+                    time.sleep(2 ** (attempt - 1))
+            finally:
+                if tmp is not None:
+                    tmp.close()
+                    Path(tmp.name).unlink(missing_ok=True)
+        return None
@@ -0,0 +1,345 @@
+"""更新脚本共用的连接池 HTTP 客户端。
+
+`HttpClient` 封装一个保持连接的 `requests.Session`，并提供：
+
+- 可选的磁盘缓存，用 ETag/Last-Modified 重新验证：未变化的资源只消耗一次
+  304（GitHub 不计入限流额度），而不是完整的响应体；
+- 连接错误、429 与 5xx 响应按带抖动的指数退避重试，并遵守 Retry-After；
+- 由 `X-RateLimit-*` 头驱动的按主机 `RateLimitBudget`。额度不足时，若窗口
+  很快重置（`UPDATE_RATE_LIMIT_MAX_WAIT` 秒内，默认 60）则等待，否则抛出
+  `RateLimitExceeded`；脚本随后以 `DEFERRED_EXIT_CODE` 退出，编排脚本将其
+  报告为 deferred，而不是耗尽剩余额度。
+"""
+
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .trace import span
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_RETRIES = 3
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_BACKOFF = 1.0
+# 剩余额度低于该值时开始节流
+DEFAULT_RESERVE = 10
+# 额度在这么多秒内重置时等待，否则放弃；CI 可用环境变量放宽
+MAX_WAIT_ENV = "UPDATE_RATE_LIMIT_MAX_WAIT"
+DEFAULT_MAX_WAIT = float(os.environ.get(MAX_WAIT_ENV) or 60.0)
+RESET_MARGIN = 1.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# 额度耗尽、更新被推迟时脚本的退出码 (EX_TEMPFAIL)，编排脚本据此报告 deferred
+DEFERRED_EXIT_CODE = 75
+
+
+class RateLimitExceeded(Exception):
+    """主机的请求额度已耗尽，直到 `reset_at` 才恢复"""
+
+    def __init__(self, host: str, reset_at: Optional[float]):
+        self.host = host
+        self.reset_at = reset_at
+        wait = f" for {max(0, int(reset_at - time.time()))}s" if reset_at else ""
+        super().__init__(f"rate limit for {host} exhausted{wait}")
+
+
+class RateLimitBudget:
+    """按主机记录 `X-RateLimit-Remaining/Reset`，可在多线程间共享"""
+
+    def __init__(
+        self, reserve: int = DEFAULT_RESERVE, max_wait: float = DEFAULT_MAX_WAIT
+    ):
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.hosts: Dict[str, Dict[str, float]] = {}
+        self.lock = threading.Lock()
+
+    def update(self, host: str, response: requests.Response) -> None:
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None:
+            return
+        with self.lock:
+            self.hosts[host] = {
+                "remaining": int(remaining),
+                "limit": int(response.headers.get("X-RateLimit-Limit", remaining)),
+                "reset": float(reset) if reset else 0.0,
+            }
+
+    def exhausted(self, host: str, response: requests.Response) -> bool:
+        return response.status_code in (403, 429) and (
+            response.headers.get("X-RateLimit-Remaining") == "0"
+            or "rate limit exceeded" in response.text.lower()
+        )
+
+    def acquire(self, host: str) -> None:
+        """额度不足时等待，或拒绝向 `host` 发出请求"""
+        with self.lock:
+            state = self.hosts.get(host)
+            if state is None or state["remaining"] > self.reserve:
+                if state is not None:
+                    state["remaining"] -= 1
+                return
+            wait = state["reset"] - time.time()
+            if wait <= 0:
+                # 窗口已重置，等下一次响应更新真实额度
+                del self.hosts[host]
+                return
+        self.wait_for_reset(host, state["reset"])
+
+    def wait_for_reset(self, host: str, reset_at: Optional[float]) -> None:
+        """等待到 `reset_at`；超过 `max_wait` 时抛出异常"""
+        wait = reset_at - time.time() if reset_at else None
+        if wait is None or wait > self.max_wait:
+            raise RateLimitExceeded(host, reset_at)
+        if wait > 0:
+            print(f"Rate limit for {host} low, waiting {wait:.0f}s", file=sys.stderr)
+            # 重置时间只精确到秒，且本机时钟可能略有偏差
+            time.sleep(wait + RESET_MARGIN)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {host: dict(state) for host, state in self.hosts.items()}
+
+
+class ResponseCache:
+    """保存 GET 响应体及其校验头，每个 URL 一对文件"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.root / f"{key}.json", self.root / f"{key}.body"
+
+    def load(self, url: str) -> Optional[Dict]:
+        meta_path, body_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            meta["body"] = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None
+        return meta
+
+    def store(self, url: str, response: requests.Response) -> None:
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        if not any(validators.values()):
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        meta_path, body_path = self._paths(url)
+        # 缓存可能被多个进程共享，临时文件名带上 pid
+        tmp = body_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(response.content)
+        os.replace(tmp, body_path)
+        meta = dict(validators, url=url, headers=dict(response.headers))
+        tmp = meta_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(meta, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, meta_path)
+
+    def conditional_headers(self, entry: Dict) -> Dict[str, str]:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def replay(self, url: str, entry: Dict, revalidated) -> requests.Response:
+        """收到 304 后，用缓存条目构造 200 响应"""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response._content = entry["body"]
+        response.headers.update(entry.get("headers", {}))
+        # 304 上的限流信息比缓存中的更新
+        response.headers.update(revalidated.headers)
+        response.from_cache = True
+        return response
+
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """Retry-After 头要求等待的秒数（秒数或 HTTP 日期两种形式）"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """带缓存、退避与限流节奏控制的连接池会话
+
+    可在多线程间共享：连接池大小由 `pool_size` 指定，额度与缓存均支持并发使用。
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        retries: int = DEFAULT_RETRIES,
+        timeout: float = DEFAULT_TIMEOUT,
+        backoff: float = DEFAULT_BACKOFF,
+        budget: Optional[RateLimitBudget] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.retries = max(1, retries)
+        self.timeout = timeout
+        self.backoff = backoff
+        self.budget = budget if budget is not None else RateLimitBudget()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _sleep_before_retry(self, attempt: int, response=None) -> None:
+        # 429/5xx 的 Response 布尔值为假，必须与 None 比较
+        delay = retry_after_seconds(response) if response is not None else None
+        if delay is None:
+            delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+        time.sleep(max(0.0, delay))
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        budget_key: str,
+        headers: Dict[str, str],
+        stream: bool,
+        timeout: Optional[float],
+        **kwargs,
+    ) -> Tuple[requests.Response, int]:
+        """按额度节奏发送并重试，返回响应与尝试次数"""
+        host = urlparse(url).netloc
+        for attempt in range(1, self.retries + 1):
+            self.budget.acquire(budget_key)
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    headers=headers,
+                    stream=stream,
+                    timeout=timeout or self.timeout,
+                    **kwargs,
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                self._sleep_before_retry(attempt)
+                continue
+
+            self.budget.update(budget_key, response)
+            if self.budget.exhausted(budget_key, response):
+                reset = response.headers.get("X-RateLimit-Reset")
+                response.close()
+                if attempt == self.retries:
+                    raise RateLimitExceeded(host, float(reset) if reset else None)
+                self.budget.wait_for_reset(host, float(reset) if reset else None)
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                response.close()
+                self._sleep_before_retry(attempt, response)
+                continue
+            break
+        return response, attempt
+
+    def get(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+        cache: bool = True,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        """带重试的 GET；除 `stream` 或 `cache=False` 外均使用缓存
+
+        经 304 重新验证后返回的响应带有 `from_cache = True`。主机额度耗尽且
+        超过 `max_wait` 仍不恢复时抛出 `RateLimitExceeded`。
+        """
+        host = urlparse(url).netloc
+        headers = dict(headers or {})
+        entry = None
+        if self.cache is not None and cache and not stream:
+            entry = self.cache.load(url)
+            if entry is not None:
+                headers.update(self.cache.conditional_headers(entry))
+
+        with span("http", url=url, stream=stream) as s:
+            response, attempts = self._send("GET", url, host, headers, stream, timeout)
+            s.set(status=response.status_code, attempts=attempts)
+            response.from_cache = False
+            if entry is not None and response.status_code == 304:
+                s.set(from_cache=True, bytes=0)
+                return self.cache.replay(url, entry, response)
+            if (
+                self.cache is not None
+                and cache
+                and not stream
+                and response.status_code == 200
+            ):
+                self.cache.store(url, response)
+            # 流式响应的正文尚未读取，只能记录声明的长度
+            length = response.headers.get("Content-Length")
+            if not stream:
+                s.set(bytes=len(response.content))
+            elif length and length.isdigit():
+                s.set(bytes=int(length))
+            return response
+
+    def post(
+        self,
+        url: str,
+        json: Optional[Dict] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        """带重试地 POST JSON 请求体，从不缓存
+
+        额度按主机与路径分别记录：GitHub 对 GraphQL 端点与 REST API 分开计量。
+        """
+        parsed = urlparse(url)
+        with span("http", url=url, method="POST") as s:
+            response, attempts = self._send(
+                "POST",
+                url,
+                parsed.netloc + parsed.path,
+                dict(headers or {}),
+                False,
+                timeout,
+                json=json,
+            )
+            response.from_cache = False
+            s.set(
+                status=response.status_code,
+                attempts=attempts,
+                bytes=len(response.content),
+            )
+            return response
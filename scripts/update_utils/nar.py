@@ -0,0 +1,212 @@
+"""Compute Nix NAR hashes in-process, without a Nix store.
+
+`fetchFromGitHub`, `fetchgit` and other unpacking fetchers pin their output
+with the SHA-256 of its NAR serialisation. `nar_hash_path` serialises a
+directory on disk, and `nar_hash_git` serialises a commit straight from git
+objects, which is what GitHub's archive tarball unpacks to. Both stream file
+contents, so memory use does not depend on the size of the tree.
+"""
+
+import hashlib
+import os
+import stat
+import subprocess
+from pathlib import Path
+from typing import Dict, Tuple
+
+from . import trace
+from .hashing import Digest
+
+NAR_MAGIC = "nix-archive-1"
+CHUNK_SIZE = 1024 * 1024
+
+
+class NarWriter:
+    """Emits NAR tokens into a hash (or anything with `update`)."""
+
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else hashlib.sha256()
+
+    def _bytes(self, data: bytes) -> None:
+        self.sink.update(len(data).to_bytes(8, "little"))
+        self.sink.update(data)
+        self._pad(len(data))
+
+    def _pad(self, length: int) -> None:
+        if length % 8:
+            self.sink.update(b"\0" * (8 - length % 8))
+
+    def token(self, *values) -> None:
+        for value in values:
+            self._bytes(value.encode("utf-8") if isinstance(value, str) else value)
+
+    def regular(self, size: int, chunks, executable: bool = False) -> None:
+        self.token("(", "type", "regular")
+        if executable:
+            self.token("executable", "")
+        self.token("contents")
+        self.sink.update(size.to_bytes(8, "little"))
+        written = 0
+        for chunk in chunks:
+            self.sink.update(chunk)
+            written += len(chunk)
+        if written != size:
+            raise ValueError(f"expected {size} bytes of contents, got {written}")
+        self._pad(size)
+        self.token(")")
+
+    def symlink(self, target: bytes) -> None:
+        self.token("(", "type", "symlink", "target", target, ")")
+
+
+def _read_chunks(path: Path):
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+def _dump_path(writer: NarWriter, path: Path) -> None:
+    st = os.lstat(path)
+    if stat.S_ISLNK(st.st_mode):
+        writer.symlink(os.fsencode(os.readlink(path)))
+    elif stat.S_ISREG(st.st_mode):
+        writer.regular(
+            st.st_size, _read_chunks(path), executable=bool(st.st_mode & 0o100)
+        )
+    elif stat.S_ISDIR(st.st_mode):
+        writer.token("(", "type", "directory")
+        # NAR orders entries by raw name bytes
+        for name in sorted(os.listdir(os.fsencode(path))):
+            writer.token("entry", "(", "name", name, "node")
+            _dump_path(writer, Path(path) / os.fsdecode(name))
+            writer.token(")")
+        writer.token(")")
+    else:
+        raise ValueError(f"cannot serialise special file: {path}")
+
+
+def nar_hash_path(path: Path) -> Digest:
+    """NAR hash of a file or directory on disk, like `nix-hash --type sha256`."""
+    writer = NarWriter()
+    writer.token(NAR_MAGIC)
+    _dump_path(writer, Path(path))
+    return Digest.from_bytes(writer.sink.digest())
+
+
+def git_missing_blobs(git_dir: Path, rev: str) -> list:
+    """Objects reachable from `rev` that a partial clone has not downloaded."""
+    result = subprocess.run(
+        ["git", "--git-dir", str(git_dir), "rev-list", "--objects"]
+        + ["--missing=print", rev],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    return [line[1:] for line in result.stdout.splitlines() if line.startswith("?")]
+
+
+def git_fetch_objects(git_dir: Path, oids: list, remote: str = "origin") -> None:
+    """Fetch the given objects in a single request instead of one at a time."""
+    if not oids:
+        return
+    trace.run(
+        [
+            "git",
+            "--git-dir",
+            str(git_dir),
+            "-c",
+            "fetch.negotiationAlgorithm=noop",
+            "fetch",
+            remote,
+            "--no-tags",
+            "--no-write-fetch-head",
+            "--recurse-submodules=no",
+            "--filter=blob:none",
+            "--stdin",
+        ],
+        input="".join(f"{oid}\n" for oid in oids),
+        check=True,
+        text=True,
+    )
+
+
+def nar_hash_git(git_dir: Path, rev: str = "HEAD") -> Digest:
+    """NAR hash of the tree of `rev`, as an unpacked archive of it would have.
+
+    Submodules become empty directories, matching GitHub archives. Missing
+    blobs of a partial clone are fetched up front in one batch.
+    """
+    git_fetch_objects(git_dir, git_missing_blobs(git_dir, rev))
+    with trace.span("hash", kind="nar", rev=rev) as s:
+        digest, size = _hash_git_tree(git_dir, rev)
+        s.set(bytes=size)
+    return digest
+
+
+def _hash_git_tree(git_dir: Path, rev: str) -> Tuple[Digest, int]:
+    """NAR hash of the tree of `rev` and the number of content bytes read."""
+    listing = subprocess.run(
+        ["git", "--git-dir", str(git_dir), "ls-tree", "-r", "-t", "-z", "-l", rev],
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+
+    # Tree of name -> (mode, oid, size, children)
+    root: Dict[bytes, Tuple] = {}
+    dirs = {b"": root}
+    total = 0
+    for record in listing.split(b"\0"):
+        if not record:
+            continue
+        meta, path = record.split(b"\t", 1)
+        mode, _, oid, size = meta.split()
+        parent, _, name = path.rpartition(b"/")
+        children: Dict[bytes, Tuple] = {}
+        if mode in (b"040000", b"160000"):
+            dirs[path] = children
+        size = int(size) if size != b"-" else 0
+        total += size
+        dirs[parent][name] = (mode, oid, size, children)
+
+    with subprocess.Popen(
+        ["git", "--git-dir", str(git_dir), "cat-file", "--batch"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    ) as cat:
+
+        def read_blob(oid: bytes, size: int):
+            cat.stdin.write(oid + b"\n")
+            cat.stdin.flush()
+            header = cat.stdout.readline().split()
+            if len(header) != 3 or int(header[2]) != size:
+                raise ValueError(f"unexpected cat-file reply for {oid.decode()}")
+            remaining = size
+            while remaining:
+                chunk = cat.stdout.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ValueError(f"truncated blob {oid.decode()}")
+                remaining -= len(chunk)
+                yield chunk
+            cat.stdout.read(1)  # trailing newline
+
+        def dump_tree(writer: NarWriter, entries: Dict[bytes, Tuple]) -> None:
+            writer.token("(", "type", "directory")
+            for name in sorted(entries):
+                mode, oid, size, children = entries[name]
+                writer.token("entry", "(", "name", name, "node")
+                if mode in (b"040000", b"160000"):
+                    dump_tree(writer, children)
+                elif mode == b"120000":
+                    writer.symlink(b"".join(read_blob(oid, size)))
+                else:
+                    writer.regular(
+                        size, read_blob(oid, size), executable=mode == b"100755"
+                    )
+                writer.token(")")
+            writer.token(")")
+
+        writer = NarWriter()
+        writer.token(NAR_MAGIC)
+        dump_tree(writer, root)
+        cat.stdin.close()
+    return Digest.from_bytes(writer.sink.digest()), total
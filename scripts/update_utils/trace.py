@@ -0,0 +1,262 @@
+"""JSON-lines tracing for the update scripts.
+
+Set `UPDATE_TRACE_DIR` to collect spans: every process then appends one
+JSON object per finished span to `<dir>/<script>.<pid>.jsonl` and writes
+`<dir>/<script>.<pid>.summary.json` with per-span totals when it exits.
+Without the variable a span costs two clock reads and nothing is written.
+
+Span names used across the scripts:
+
+- `http`: one request, with `url`, `status`, `bytes` and `from_cache`
+- `hash`: a download or NAR serialisation being hashed, with `bytes` and
+  the part of the time spent hashing rather than waiting (`hash_seconds`)
+- `subprocess`: git clone/fetch, nix-update, nix-prefetch-url, ...
+- `write`: files written by the scripts, with `path` and `bytes`
+
+The orchestrating shell scripts merge the per-process summaries with
+
+    python3 scripts/update_utils/trace.py summarize "$UPDATE_TRACE_DIR"
+
+which writes `summary.json` next to the span files.
+"""
+
+import argparse
+import atexit
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+TRACE_DIR_ENV = "UPDATE_TRACE_DIR"
+SUMMARY_NAME = "summary.json"
+
+
+class Span:
+    """Attributes of a running span; `set` adds more before it finishes."""
+
+    def __init__(self, name: str, span_id: int, parent: Optional[int], attrs: Dict):
+        self.name = name
+        self.id = span_id
+        self.parent = parent
+        self.attrs = attrs
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+
+def _empty_totals() -> Dict:
+    return {"count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0}
+
+
+def _record_totals(record: Dict) -> Dict:
+    """Totals entry for a single span record."""
+    entry = {
+        "count": 1,
+        "errors": 1 if record.get("error") else 0,
+        "seconds": record["seconds"],
+        "max_seconds": record["seconds"],
+    }
+    for key, value in record.items():
+        numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+        if numeric and (key == "bytes" or key.endswith("_seconds")):
+            entry.setdefault(key, value)
+    return entry
+
+
+def _merge_totals(entry: Dict, other: Dict) -> None:
+    for key, value in other.items():
+        if key == "max_seconds":
+            entry[key] = max(entry[key], value)
+        elif key != "bytes_per_second":
+            entry[key] = entry.get(key, 0) + value
+
+
+def _finish_totals(totals: Dict) -> Dict:
+    for entry in totals.values():
+        seconds = entry.get("hash_seconds") or entry["seconds"]
+        if entry.get("bytes") and seconds:
+            entry["bytes_per_second"] = entry["bytes"] / seconds
+    return totals
+
+
+class Tracer:
+    """Writes spans of one process; safe to use from several threads."""
+
+    def __init__(self, directory: Optional[Path], script: str):
+        self.directory = Path(directory) if directory else None
+        self.script = script
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.local = threading.local()
+        self.totals: Dict[str, Dict] = {}
+        self.file = None
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            stem = f"{script}.{os.getpid()}"
+            self.file = (self.directory / f"{stem}.jsonl").open("a", encoding="utf-8")
+            self.summary_path = self.directory / f"{stem}.summary.json"
+
+    @property
+    def enabled(self) -> bool:
+        return self.file is not None
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Span]:
+        stack = self.local.__dict__.setdefault("stack", [])
+        current = Span(name, next(self.ids), stack[-1] if stack else None, attrs)
+        stack.append(current.id)
+        start = time.time()
+        clock = time.perf_counter()
+        error = None
+        try:
+            yield current
+        except BaseException as exc:
+            error = type(exc).__name__
+            raise
+        finally:
+            stack.pop()
+            seconds = time.perf_counter() - clock
+            if self.enabled:
+                record = dict(
+                    current.attrs,
+                    name=name,
+                    id=current.id,
+                    parent=current.parent,
+                    pid=os.getpid(),
+                    script=self.script,
+                    start=start,
+                    seconds=seconds,
+                )
+                if error:
+                    record["error"] = error
+                line = json.dumps(record, default=str)
+                with self.lock:
+                    self.file.write(line + "\n")
+                    self.file.flush()
+                    _merge_totals(
+                        self.totals.setdefault(name, _empty_totals()),
+                        _record_totals(record),
+                    )
+
+    def summary(self) -> Dict:
+        with self.lock:
+            spans = json.loads(json.dumps(self.totals))
+        return {
+            "script": self.script,
+            "pid": os.getpid(),
+            "argv": sys.argv,
+            "start": self.started,
+            "seconds": time.time() - self.started,
+            "spans": _finish_totals(spans),
+        }
+
+    def close(self) -> None:
+        if not self.enabled:
+            return
+        self.summary_path.write_text(
+            json.dumps(self.summary(), indent=2, sort_keys=True), encoding="utf-8"
+        )
+        with self.lock:
+            self.file.close()
+            self.file = None
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer(script: Optional[str] = None) -> Tracer:
+    """The process-wide tracer, configured from `UPDATE_TRACE_DIR`.
+
+    `script` names the span files; it defaults to the running script and
+    only takes effect on the first call.
+    """
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            if script is None:
+                script = Path(sys.argv[0]).stem if sys.argv[0] else "python"
+            _tracer = Tracer(os.environ.get(TRACE_DIR_ENV) or None, script)
+            atexit.register(_tracer.close)
+        return _tracer
+
+
+def span(name: str, **attrs):
+    """Context manager timing a block as one span of the process tracer."""
+    return get_tracer().span(name, **attrs)
+
+
+def run(cmd: List[str], **kwargs) -> subprocess.CompletedProcess:
+    """`subprocess.run` inside a `subprocess` span named after the command."""
+    with span("subprocess", command=Path(str(cmd[0])).name, args=cmd[1:]) as s:
+        try:
+            proc = subprocess.run(cmd, **kwargs)
+        except subprocess.CalledProcessError as e:
+            s.set(returncode=e.returncode)
+            raise
+        s.set(returncode=proc.returncode)
+        return proc
+
+
+def summarize(directory: Path) -> Dict:
+    """Merge the per-process summaries in `directory` into one."""
+    totals: Dict[str, Dict] = {}
+    scripts: Dict[str, Dict] = {}
+    processes = []
+    for path in sorted(Path(directory).glob("*.summary.json")):
+        try:
+            summary = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        processes.append({k: summary[k] for k in ("script", "pid", "seconds")})
+        per_script = scripts.setdefault(summary["script"], {})
+        for name, entry in summary["spans"].items():
+            _merge_totals(totals.setdefault(name, _empty_totals()), entry)
+            _merge_totals(per_script.setdefault(name, _empty_totals()), entry)
+    return {
+        "processes": processes,
+        "spans": _finish_totals(totals),
+        "scripts": {name: _finish_totals(t) for name, t in scripts.items()},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Collect update script traces")
+    sub = parser.add_subparsers(dest="action", required=True)
+    p_sum = sub.add_parser("summarize", help="Merge per-process summaries")
+    p_sum.add_argument("directory", help="Trace directory")
+    p_sum.add_argument(
+        "-o", "--output", help=f"Output file (default DIR/{SUMMARY_NAME})"
+    )
+    p_run = sub.add_parser("run", help="Run a command inside a subprocess span")
+    p_run.add_argument("cmd", nargs=argparse.REMAINDER, help="Command and arguments")
+    args = parser.parse_args()
+
+    if args.action == "summarize":
+        output = Path(args.output or Path(args.directory) / SUMMARY_NAME)
+        summary = summarize(Path(args.directory))
+        output.write_text(
+            json.dumps(summary, indent=2, sort_keys=True), encoding="utf-8"
+        )
+        return 0
+
+    cmd = args.cmd[1:] if args.cmd[:1] == ["--"] else args.cmd
+    if not cmd:
+        parser.error("run needs a command")
+    get_tracer(Path(cmd[0]).name)
+    try:
+        return run(cmd).returncode
+    except FileNotFoundError:
+        print(f"{cmd[0]}: command not found", file=sys.stderr)
+        return 127
+
+
+if __name__ == "__main__":
+    sys.exit(main())